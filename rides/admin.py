@@ -1,7 +1,64 @@
+from django import forms
 from django.contrib import admin
 
 from .models import Ride
+from .transitions import bulk_transition
 
 
-# Register your models here.
-admin.site.register(Ride)
+class RideAdminForm(forms.ModelForm):
+    # Carries the version the ride was opened with, so saving over a write made
+    # since (e.g. by the tracker) is a form error instead of a RideVersionConflict.
+    read_version = forms.IntegerField(widget=forms.HiddenInput, required=False)
+
+    class Meta:
+        model = Ride
+        fields = "__all__"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk is not None:
+            self.fields["read_version"].initial = self.instance.version
+
+    def clean(self):
+        cleaned_data = super().clean()
+        read_version = cleaned_data.get("read_version")
+        if self.instance.pk is None or read_version is None:
+            return cleaned_data
+
+        # The admin saves in the same transaction, so the locked row can't
+        # change again before save_model.
+        version = (
+            Ride.objects.select_for_update()
+            .filter(pk=self.instance.pk)
+            .values_list("version", flat=True)
+            .first()
+        )
+        if version != read_version:
+            raise forms.ValidationError(
+                "This ride was changed since it was opened. Reload it and try again."
+            )
+        return cleaned_data
+
+
+@admin.register(Ride)
+class RideAdmin(admin.ModelAdmin):
+    form = RideAdminForm
+    list_display = ("id", "driver", "rider", "status", "created_at")
+    list_filter = ("status",)
+    actions = ("cancel_rides", "complete_rides")
+
+    def transition(self, request, queryset, target):
+        # One UPDATE for the whole selection. Rides that can't move to target
+        # under the transition table are skipped.
+        moved = len(bulk_transition(queryset, target))
+        self.message_user(
+            request, f"{moved} of {queryset.count()} rides marked {target.lower()}."
+        )
+
+    @admin.action(description="Cancel selected rides")
+    def cancel_rides(self, request, queryset):
+        self.transition(request, queryset, "CANCELLED")
+
+    @admin.action(description="Complete selected rides")
+    def complete_rides(self, request, queryset):
+        self.transition(request, queryset, "COMPLETED")
@@ -0,0 +1,142 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import detail_cache, heatmap, tiles
+from .models import ArchivedRide, ArchivedRideRequest, Ride, RideRequest
+
+
+FINISHED_STATUSES = ("COMPLETED", "CANCELLED")
+
+# Columns copied verbatim from the hot tables into the archive tables.
+RIDE_COLUMNS = (
+    "id",
+    "rider_id",
+    "driver_id",
+    "current_location",
+    "pickup_location",
+    "dropoff_location",
+    "status",
+    "pickup_distance_m",
+    "created_at",
+    "updated_at",
+)
+RIDE_REQUEST_COLUMNS = (
+    "id",
+    "ride_id",
+    "rider_id",
+    "is_accepted",
+    "status",
+    "created_at",
+    "updated_at",
+)
+
+
+def month_start(value):
+    value = value.astimezone(dt_timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def next_month(value):
+    if value.month == 12:
+        return value.replace(year=value.year + 1, month=1)
+    return value.replace(month=value.month + 1)
+
+
+def ensure_partitions(table, months):
+    # Monthly partitions are created on demand, right before rows land in them.
+    with connection.cursor() as cursor:
+        for month in sorted(set(months)):
+            partition = f"{table}_{month:%Y_%m}"
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table} "
+                "FOR VALUES FROM (%s) TO (%s)",
+                [month, next_month(month)],
+            )
+
+
+def move_rows(table, archive_table, columns, key, ids, archived_at):
+    column_list = ", ".join(columns)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {table} WHERE {key} = ANY(%s) "
+            f"RETURNING {column_list}) "
+            f"INSERT INTO {archive_table} ({column_list}, archived_at) "
+            f"SELECT {column_list}, %s FROM moved RETURNING id",
+            [list(ids), archived_at],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def archive_batch(cutoff, batch_size):
+    # Moves one chunk of finished rides, and their requests, in a short
+    # transaction. Rows locked by other sessions are skipped and picked up by a
+    # later batch, so the command can be interrupted and re-run at any time.
+    with transaction.atomic():
+        rows = list(
+            Ride.objects.filter(status__in=FINISHED_STATUSES, updated_at__lt=cutoff)
+            .order_by("pk")
+            .select_for_update(skip_locked=True)
+            .values_list("pk", "created_at")[:batch_size]
+        )
+        if not rows:
+            return 0
+
+        ride_ids = [pk for pk, _ in rows]
+        request_dates = RideRequest.objects.filter(ride_id__in=ride_ids).values_list(
+            "created_at", flat=True
+        )
+        ensure_partitions(
+            ArchivedRideRequest._meta.db_table,
+            [month_start(created_at) for created_at in request_dates],
+        )
+        ensure_partitions(
+            ArchivedRide._meta.db_table,
+            [month_start(created_at) for _, created_at in rows],
+        )
+
+        archived_at = timezone.now()
+        ride_request_ids = move_rows(
+            RideRequest._meta.db_table,
+            ArchivedRideRequest._meta.db_table,
+            RIDE_REQUEST_COLUMNS,
+            "ride_id",
+            ride_ids,
+            archived_at,
+        )
+        archived_ride_ids = move_rows(
+            Ride._meta.db_table,
+            ArchivedRide._meta.db_table,
+            RIDE_COLUMNS,
+            "id",
+            ride_ids,
+            archived_at,
+        )
+
+        # The rows left without Model.delete(), so drop them from the heat map,
+        # the tiles and the detail cache here
+        heatmap.ride_requests_deleted(ride_request_ids)
+        heatmap.rides_deleted(archived_ride_ids)
+        tiles.rides_deleted(archived_ride_ids)
+        detail_cache.invalidate(archived_ride_ids)
+        return len(archived_ride_ids)
+
+
+def archive_finished_rides(older_than=None, batch_size=None, max_batches=None):
+    if older_than is None:
+        older_than = timedelta(days=settings.RIDE_ARCHIVE_AFTER_DAYS)
+    if batch_size is None:
+        batch_size = settings.RIDE_ARCHIVE_BATCH_SIZE
+
+    cutoff = timezone.now() - older_than
+    archived = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        moved = archive_batch(cutoff, batch_size)
+        if not moved:
+            break
+        archived += moved
+        batches += 1
+    return archived
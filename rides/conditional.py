@@ -0,0 +1,132 @@
+import json
+from datetime import datetime
+
+import redis
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils.http import parse_etags
+
+from .connections import get_redis
+
+# Conditional GET support. The updated_at of a ride or ride request is cached in
+# the shared Redis, so an unchanged poll is answered with a 304 from a single
+# lookup, or a single primary key lookup on a cache miss, without serializing
+# anything. Writes from any process (web, relay or Celery workers) drop the
+# entry for all of them. When Redis is unavailable every poll reads the row.
+# Versioned models (Ride) also support If-Match on writes.
+
+
+def freshness_key(model, pk):
+    return f"rides:freshness:{model._meta.model_name}:{pk}"
+
+
+def get_freshness(model, pk):
+    # (updated_at, version) of the row, version is None for models without one.
+    try:
+        pk = model._meta.pk.to_python(pk)
+    except ValidationError:
+        return None
+
+    key = freshness_key(model, pk)
+    client = get_redis()
+    try:
+        cached = client.get(key)
+    except redis.RedisError:
+        cached = client = None
+    if cached is not None:
+        updated_at, version = json.loads(cached)
+        return datetime.fromisoformat(updated_at), version
+
+    fields = ["updated_at", "version"] if versioned(model) else ["updated_at"]
+    row = model.objects.filter(pk=pk).values_list(*fields).first()
+    if row is None:
+        return None
+    freshness = (row[0], row[1] if versioned(model) else None)
+    if client is not None:
+        try:
+            client.set(
+                key,
+                json.dumps([freshness[0].isoformat(), freshness[1]]),
+                ex=settings.RIDES_FRESHNESS_CACHE_TIMEOUT,
+            )
+        except redis.RedisError:
+            pass
+    return freshness
+
+
+def get_updated_at(model, pk):
+    freshness = get_freshness(model, pk)
+    return None if freshness is None else freshness[0]
+
+
+def versioned(model):
+    return any(field.name == "version" for field in model._meta.concrete_fields)
+
+
+def forget_updated_at(model, pks):
+    # Called on every write. The entry is dropped right away and again once the
+    # transaction commits, so a concurrent read can't re-cache the old value.
+    keys = [freshness_key(model, pk) for pk in pks]
+    if not keys:
+        return
+
+    def forget():
+        try:
+            get_redis().delete(*keys)
+        except redis.RedisError:
+            pass
+
+    forget()
+    transaction.on_commit(forget)
+
+
+def clear():
+    client = get_redis()
+    keys = list(client.scan_iter(match="rides:freshness:*"))
+    if keys:
+        client.delete(*keys)
+
+
+def etag_func(model):
+    # Versioned models are tagged with their version, which If-Match on writes
+    # refers to, see if_match_version.
+    def etag(request, pk=None, **kwargs):
+        freshness = get_freshness(model, pk)
+        if freshness is None:
+            return None
+        updated_at, version = freshness
+        if version is not None:
+            return version_etag(model, pk, version)
+        return f"{model._meta.model_name}-{pk}-{updated_at.timestamp():.6f}"
+
+    return etag
+
+
+def version_etag(model, pk, version):
+    return f"{model._meta.model_name}-{pk}-v{version}"
+
+
+def if_match_version(request, model, pk):
+    # The version a write is conditional on: None without If-Match or with
+    # "If-Match: *", otherwise the version named by the first ETag of the
+    # object, or 0 (which no row has) if none of them is.
+    header = request.headers.get("If-Match")
+    if header is None:
+        return None
+    etags = parse_etags(header)
+    if etags == ["*"]:
+        return None
+    prefix = f"{model._meta.model_name}-{pk}-v"
+    for etag in etags:
+        etag = etag.removeprefix("W/").strip('"')
+        if etag.startswith(prefix) and etag[len(prefix) :].isdigit():
+            return int(etag[len(prefix) :])
+    return 0
+
+
+def last_modified_func(model):
+    def last_modified(request, pk=None, **kwargs):
+        return get_updated_at(model, pk)
+
+    return last_modified
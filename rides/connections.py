@@ -0,0 +1,17 @@
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+
+
+@lru_cache(maxsize=None)
+def get_redis():
+    # One connection pool per process, shared by everything that needs Redis
+    # features the Django cache API doesn't expose.
+    return redis.Redis.from_url(settings.RIDES_REDIS_URL)
+
+
+@lru_cache(maxsize=None)
+def get_broker_redis():
+    # The Celery broker, read to measure the task backlog.
+    return redis.Redis.from_url(settings.CELERY_BROKER_URL)
@@ -0,0 +1,185 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+from django.conf import settings
+from django.db import transaction
+
+from .connections import get_redis
+from .listeners import RedisListener
+
+# Read-through cache of serialized ride detail, in two tiers: a bounded LRU in
+# each process in front of a shared Redis layer. Writes bump a per-ride
+# generation, drop the Redis entry and publish the ride ids on
+# INVALIDATION_CHANNEL. Every process listens on that channel and evicts its
+# local entries, and only serves from the local tier while it is subscribed.
+#
+# A reader that loaded a ride before a concurrent write committed could cache
+# the old data after the write's invalidation. Entries are therefore stored
+# only if the ride's generation, read before the database, hasn't moved.
+
+INVALIDATION_CHANNEL = "rides:detail:invalidate"
+
+# Stores ARGV[2] under KEYS[1] for ARGV[3] seconds unless the generation in
+# KEYS[2] is no longer ARGV[1].
+SET_IF_GENERATION_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+
+def detail_key(ride_id):
+    return f"rides:detail:{ride_id}"
+
+
+def generation_key(ride_id):
+    return f"rides:detail:generation:{ride_id}"
+
+
+class LocalCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        # Bumped by every eviction, so a reader can tell whether an eviction
+        # raced with its fill.
+        self.evictions = 0
+        self.listening = False
+
+    def get(self, ride_id):
+        with self.lock:
+            if not self.listening:
+                return None
+            entry = self.entries.get(ride_id)
+            if entry is None:
+                return None
+            expires, data = entry
+            if expires < time.monotonic():
+                del self.entries[ride_id]
+                return None
+            self.entries.move_to_end(ride_id)
+            return data
+
+    def set(self, ride_id, data, evictions):
+        with self.lock:
+            if not self.listening or evictions != self.evictions:
+                return
+            self.entries[ride_id] = (
+                time.monotonic() + settings.RIDES_DETAIL_CACHE_LOCAL_TIMEOUT,
+                data,
+            )
+            self.entries.move_to_end(ride_id)
+            while len(self.entries) > settings.RIDES_DETAIL_CACHE_LOCAL_SIZE:
+                self.entries.popitem(last=False)
+
+    def start_listening(self):
+        with self.lock:
+            self.listening = True
+
+    def evict(self, ride_ids):
+        with self.lock:
+            self.evictions += 1
+            for ride_id in ride_ids:
+                self.entries.pop(ride_id, None)
+
+    def stop_listening(self):
+        with self.lock:
+            self.evictions += 1
+            self.listening = False
+            self.entries.clear()
+
+
+local_cache = LocalCache()
+
+
+# Messages may have been missed while disconnected, so nothing local can be
+# trusted until the subscription is back.
+listener = RedisListener(
+    "ride-detail-invalidation",
+    INVALIDATION_CHANNEL,
+    on_message=lambda messages: local_cache.evict(
+        [ride_id for ride_ids in messages for ride_id in ride_ids]
+    ),
+    on_connect=local_cache.start_listening,
+    on_disconnect=local_cache.stop_listening,
+)
+
+
+def ensure_listener():
+    listener.ensure_started()
+
+
+def get_or_load(ride_id, load):
+    # load() returns the serialized ride, and is only called on a miss.
+    ride_id = int(ride_id)
+    ensure_listener()
+
+    data = local_cache.get(ride_id)
+    if data is not None:
+        return data
+
+    evictions = local_cache.evictions
+    client = get_redis()
+    try:
+        cached, generation = client.mget(detail_key(ride_id), generation_key(ride_id))
+    except redis.RedisError:
+        return load()
+
+    if cached is not None:
+        data = json.loads(cached)
+        local_cache.set(ride_id, data, evictions)
+        return data
+
+    data = load()
+    try:
+        stored = client.register_script(SET_IF_GENERATION_SCRIPT)(
+            keys=[detail_key(ride_id), generation_key(ride_id)],
+            args=[
+                generation or b"",
+                json.dumps(data),
+                settings.RIDES_DETAIL_CACHE_TIMEOUT,
+            ],
+        )
+    except redis.RedisError:
+        return data
+    if stored:
+        local_cache.set(ride_id, data, evictions)
+    return data
+
+
+def invalidate_now(ride_ids):
+    local_cache.evict(ride_ids)
+    try:
+        with get_redis().pipeline() as pipe:
+            for ride_id in ride_ids:
+                pipe.incr(generation_key(ride_id))
+                pipe.expire(
+                    generation_key(ride_id), settings.RIDES_DETAIL_CACHE_TIMEOUT
+                )
+                pipe.delete(detail_key(ride_id))
+            pipe.publish(INVALIDATION_CHANNEL, json.dumps(ride_ids))
+            pipe.execute()
+    except redis.RedisError:
+        pass
+
+
+def invalidate(ride_ids):
+    # Called on every write. Like conditional.forget_updated_at, entries are
+    # dropped right away and again once the transaction commits.
+    ride_ids = sorted({int(ride_id) for ride_id in ride_ids})
+    if not ride_ids:
+        return
+    invalidate_now(ride_ids)
+    transaction.on_commit(lambda: invalidate_now(ride_ids))
+
+
+def clear():
+    local_cache.evict(list(local_cache.entries))
+    client = get_redis()
+    keys = list(client.scan_iter(match="rides:detail:*"))
+    if keys:
+        client.delete(*keys)
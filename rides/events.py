@@ -0,0 +1,134 @@
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+from .listeners import PostgresListener
+
+# Feed of ride and request state changes for long polling clients. Database
+# triggers (migrations 0013 and 0019) NOTIFY every change on CHANNEL. Each process
+# holds one LISTEN connection in a background thread (rides.listeners), which
+# appends the events to an in-memory ring buffer and wakes the waiting requests,
+# so waiting costs no queries.
+#
+# Every event carries seq, a global sequence number following commit order, and
+# the cursor is the seq of the last event a client has seen. Every process gets
+# the same events in the same order, so a poll can resume from a cursor handed
+# out by any other process. When the listener (re)connects it reads the last seq
+# handed out (after waiting for the commits holding the sequence lock), since
+# earlier events may have been sent while it was away. A client whose cursor is
+# older than that, or than the oldest buffered event, is told to reset, i.e. to
+# reload what it shows through the REST endpoints.
+
+CHANNEL = "rides_events"
+
+
+class EventBuffer:
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.events = deque(maxlen=settings.RIDES_EVENTS_BUFFER_SIZE)
+        # seq of the last event received, and the seq after which every event is
+        # either buffered or still to come. None while not listening.
+        self.last = None
+        self.floor = None
+
+    def start_stream(self, seq):
+        with self.condition:
+            self.last = self.floor = seq
+            self.events.clear()
+            self.condition.notify_all()
+
+    def stop_stream(self):
+        with self.condition:
+            self.last = self.floor = None
+            self.events.clear()
+            self.condition.notify_all()
+
+    def append(self, events):
+        with self.condition:
+            for event in events:
+                if len(self.events) == self.events.maxlen:
+                    self.floor = self.events[0]["seq"]
+                self.events.append(event)
+                self.last = event["seq"]
+            self.condition.notify_all()
+
+    def cursor(self):
+        return str(self.last)
+
+    def read(self, since, user_id):
+        # Returns (events, cursor, reset) for the user's events after since, or
+        # None if there are none. Callers hold the condition.
+        if not since.isdigit() or int(since) < self.floor:
+            return [], self.cursor(), True
+        since = int(since)
+        events = [
+            visible(event)
+            for event in self.events
+            if event["seq"] > since and user_id in event["users"]
+        ]
+        if not events:
+            return None
+        return events, self.cursor(), False
+
+    def wait(self, since, user_id, timeout):
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while True:
+                if self.last is not None:
+                    if since is None:
+                        # New clients start at the end of the feed.
+                        since = self.cursor()
+                    result = self.read(since, user_id)
+                    if result is not None:
+                        return result
+                    # Nothing for this user so far, so later wakeups only
+                    # need to look at newer events. A cursor from a process
+                    # further ahead stays as it is.
+                    since = str(max(int(since), self.last))
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return [], since, False
+                self.condition.wait(remaining)
+
+
+def visible(event):
+    # The users list only routes the event, and seq is in the cursor.
+    return {key: value for key, value in event.items() if key not in ("users", "seq")}
+
+
+def last_seq(listener):
+    # The lock is held by commits drawing event numbers, so once it is taken
+    # every number handed out so far belongs to a committed event.
+    with listener.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_lock(hashtext(%s))", [CHANNEL])
+        try:
+            cursor.execute(
+                "SELECT CASE WHEN is_called THEN last_value ELSE 0 END "
+                "FROM rides_event_seq"
+            )
+            return cursor.fetchone()[0]
+        finally:
+            cursor.execute("SELECT pg_advisory_unlock(hashtext(%s))", [CHANNEL])
+
+
+event_buffer = EventBuffer()
+
+
+listener = PostgresListener(
+    "ride-events",
+    CHANNEL,
+    on_message=event_buffer.append,
+    on_connect=lambda listener: event_buffer.start_stream(last_seq(listener)),
+    on_disconnect=event_buffer.stop_stream,
+)
+
+
+def ensure_listener():
+    listener.ensure_started()
+
+
+def wait_for_events(since, user_id, timeout):
+    ensure_listener()
+    return event_buffer.wait(since, user_id, timeout)
@@ -0,0 +1,32 @@
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class ServiceOverloaded(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Service temporarily overloaded, try again later."
+    default_code = "service_overloaded"
+
+    def __init__(self, detail=None, code=None, wait=None):
+        super().__init__(detail, code)
+        # Sent as Retry-After by the DRF exception handler.
+        self.wait = settings.RIDES_SHED_RETRY_AFTER if wait is None else wait
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = "The ride has changed since the version in If-Match."
+    default_code = "precondition_failed"
+
+
+class EditConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "The ride was changed concurrently, reload it and try again."
+    default_code = "edit_conflict"
+
+
+class InvalidFilter(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = "Invalid filter."
+    default_code = "invalid_filter"
@@ -0,0 +1,233 @@
+import json
+from datetime import timedelta, timezone as dt_timezone
+from importlib.util import find_spec
+from itertools import islice
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import (
+    ArchivedRide,
+    ArchivedRideRequest,
+    Ride,
+    RideRequest,
+    RideTracePoint,
+)
+
+# Bulk export of rides and ride requests, hot and archived, as NDJSON or Parquet.
+# Rows are read through server-side cursors (QuerySet.iterator) in chunks of
+# RIDES_EXPORT_CHUNK_SIZE and written out chunk by chunk, each chunk becoming a
+# Parquet row group, so memory stays flat whatever the size of the export.
+#
+# Exports are ordered by updated_at, and Export.watermark holds the largest
+# updated_at written, which is the since of the next incremental export. updated_at
+# is set before its transaction commits, so incremental exports re-read
+# RIDES_EXPORT_OVERLAP_SECONDS before since to catch rows that committed late,
+# and consumers keep the latest row per id. bound() caps an export at the latest
+# updated_at there is, so its watermark is known before streaming starts, as the
+# HTTP export needs it for a header. Parquet needs pyarrow, which is imported only
+# when used.
+
+LOCATIONS = ("current", "pickup", "dropoff")
+
+MODELS = {
+    "rides": (Ride, ArchivedRide),
+    "requests": (RideRequest, ArchivedRideRequest),
+}
+
+FIELDS = {
+    "rides": ("id", "driver_id", "rider_id", "status", "created_at", "updated_at"),
+    "requests": (
+        "id",
+        "ride_id",
+        "rider_id",
+        "is_accepted",
+        "status",
+        "created_at",
+        "updated_at",
+    ),
+}
+
+
+class ParquetUnavailable(Exception):
+    pass
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class ChunkSink:
+    # File object collecting what pyarrow writes, drained after each row group.
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.parts.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+class Export:
+    def __init__(
+        self, name, since=None, archived=False, trajectories=False, chunk_size=None
+    ):
+        if name not in MODELS:
+            raise ValueError(f"Unknown export {name}")
+        if since is not None and timezone.is_naive(since):
+            since = timezone.make_aware(since, dt_timezone.utc)
+        self.name = name
+        self.since = since
+        self.archived = archived
+        self.trajectories = trajectories and name == "rides"
+        self.chunk_size = chunk_size or settings.RIDES_EXPORT_CHUNK_SIZE
+        self.until = None
+        self.rows = 0
+        self.watermark = since
+
+    def querysets(self):
+        hot, archive = MODELS[self.name]
+        models = [(hot, False)] + ([(archive, True)] if self.archived else [])
+        fields = FIELDS[self.name]
+        if self.name == "rides":
+            fields += tuple(f"{location}_location" for location in LOCATIONS)
+        for model, archived in models:
+            queryset = model.objects.order_by("updated_at", "pk")
+            if self.since is not None:
+                overlap = timedelta(seconds=settings.RIDES_EXPORT_OVERLAP_SECONDS)
+                queryset = queryset.filter(updated_at__gt=self.since - overlap)
+            if self.until is not None:
+                queryset = queryset.filter(updated_at__lte=self.until)
+            yield queryset.values(*fields), archived
+
+    def bound(self):
+        # Returns the watermark the export will end with.
+        latest = [
+            queryset.aggregate(latest=Max("updated_at"))["latest"]
+            for queryset, _ in self.querysets()
+        ]
+        latest = [value for value in latest if value is not None]
+        if latest and (self.since is None or max(latest) > self.since):
+            self.until = max(latest)
+        else:
+            self.until = self.since
+        return self.until
+
+    def row(self, values, archived):
+        for location in LOCATIONS:
+            point = values.pop(f"{location}_location", None)
+            if point is not None:
+                values[f"{location}_longitude"] = point.x
+                values[f"{location}_latitude"] = point.y
+        values["archived"] = archived
+        return values
+
+    def add_trajectories(self, chunk):
+        trajectories = {row["id"]: [] for row in chunk}
+        for point in RideTracePoint.objects.filter(
+            ride_id__in=list(trajectories)
+        ).order_by("ride_id", "recorded_at"):
+            trajectories[point.ride_id].append(
+                {
+                    "recorded_at": point.recorded_at,
+                    "raw_longitude": point.raw_location.x,
+                    "raw_latitude": point.raw_location.y,
+                    "longitude": None if point.location is None else point.location.x,
+                    "latitude": None if point.location is None else point.location.y,
+                }
+            )
+        for row in chunk:
+            row["trajectory"] = trajectories[row["id"]]
+
+    def chunks(self):
+        # Lists of up to chunk_size rows.
+        for queryset, archived in self.querysets():
+            rows = queryset.iterator(chunk_size=self.chunk_size)
+            for chunk in chunked(rows, self.chunk_size):
+                chunk = [self.row(values, archived) for values in chunk]
+                if self.trajectories:
+                    self.add_trajectories(chunk)
+                self.rows += len(chunk)
+                latest = chunk[-1]["updated_at"]
+                if self.watermark is None or latest > self.watermark:
+                    self.watermark = latest
+                yield chunk
+
+    def ndjson(self):
+        for chunk in self.chunks():
+            yield "".join(
+                json.dumps(row, cls=DjangoJSONEncoder) + "\n" for row in chunk
+            ).encode()
+
+    def parquet_schema(self, pyarrow):
+        timestamp = pyarrow.timestamp("us", tz="UTC")
+        columns = [
+            ("id", pyarrow.int64()),
+            ("ride_id", pyarrow.int64()),
+            ("driver_id", pyarrow.int64()),
+            ("rider_id", pyarrow.int64()),
+            ("is_accepted", pyarrow.bool_()),
+            ("status", pyarrow.string()),
+            ("created_at", timestamp),
+            ("updated_at", timestamp),
+        ]
+        columns = [column for column in columns if column[0] in FIELDS[self.name]]
+        if self.name == "rides":
+            for location in LOCATIONS:
+                columns.append((f"{location}_longitude", pyarrow.float64()))
+                columns.append((f"{location}_latitude", pyarrow.float64()))
+        columns.append(("archived", pyarrow.bool_()))
+        if self.trajectories:
+            point = pyarrow.struct(
+                [
+                    ("recorded_at", timestamp),
+                    ("raw_longitude", pyarrow.float64()),
+                    ("raw_latitude", pyarrow.float64()),
+                    ("longitude", pyarrow.float64()),
+                    ("latitude", pyarrow.float64()),
+                ]
+            )
+            columns.append(("trajectory", pyarrow.list_(point)))
+        return pyarrow.schema(columns)
+
+    def parquet(self):
+        import pyarrow
+        import pyarrow.parquet
+
+        schema = self.parquet_schema(pyarrow)
+        sink = ChunkSink()
+        with pyarrow.parquet.ParquetWriter(sink, schema) as writer:
+            for chunk in self.chunks():
+                writer.write_table(pyarrow.Table.from_pylist(chunk, schema=schema))
+                yield sink.drain()
+        yield sink.drain()
+
+    def stream(self, format):
+        # An iterator of the bytes of the export.
+        if format == "parquet":
+            if find_spec("pyarrow") is None:
+                raise ParquetUnavailable("Parquet exports need pyarrow installed")
+            return self.parquet()
+        return self.ndjson()
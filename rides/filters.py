@@ -0,0 +1,77 @@
+from datetime import timezone as dt_timezone
+
+from django.contrib.gis.geos import Polygon
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.filters import BaseFilterBackend
+
+from .exceptions import InvalidFilter
+from .models import Ride
+
+# Server-side filters for ride listings and history. Every filter is backed by
+# an index on Ride: role by (driver, created_at) and (rider, created_at), status
+# by (status, created_at), the created_at range by created_at and bbox by the
+# spatial index on current_location, so no combination scans the table. History
+# applies them to archived rides as well, which it always narrows to the user's
+# own through the driver and rider indexes.
+#
+#   role=driver|rider        rides of the current user in that role
+#   status=PENDING,STARTED   any of these statuses
+#   created_after=<ISO>      created at or after
+#   created_before=<ISO>     created before
+#   bbox=min_longitude,min_latitude,max_longitude,max_latitude
+#                            current location within the box
+
+
+def parse_created(value, name):
+    try:
+        created = parse_datetime(value)
+    except ValueError:
+        created = None
+    if created is None:
+        raise InvalidFilter(f"Invalid {name}, use an ISO 8601 datetime.")
+    if timezone.is_naive(created):
+        created = timezone.make_aware(created, dt_timezone.utc)
+    return created
+
+
+def filter_rides(queryset, params, user):
+    role = params.get("role")
+    if role == "driver":
+        queryset = queryset.filter(driver=user)
+    elif role == "rider":
+        queryset = queryset.filter(rider=user)
+    elif role is not None:
+        raise InvalidFilter("Invalid role. Accepted values = ['driver', 'rider']")
+
+    if params.get("status"):
+        statuses = params["status"].split(",")
+        if not set(statuses) <= set(dict(Ride.STATUS_CHOICES)):
+            raise InvalidFilter(
+                "Invalid status choice. Accepted values = ['PENDING', 'STARTED', 'COMPLETED', 'CANCELLED']"
+            )
+        queryset = queryset.filter(status__in=statuses)
+
+    if params.get("created_after"):
+        queryset = queryset.filter(
+            created_at__gte=parse_created(params["created_after"], "created_after")
+        )
+    if params.get("created_before"):
+        queryset = queryset.filter(
+            created_at__lt=parse_created(params["created_before"], "created_before")
+        )
+
+    if params.get("bbox"):
+        try:
+            bbox = [float(value) for value in params["bbox"].split(",")]
+        except ValueError:
+            bbox = []
+        if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+            raise InvalidFilter("Invalid bbox")
+        queryset = queryset.filter(current_location__intersects=Polygon.from_bbox(bbox))
+    return queryset
+
+
+class RideFilterBackend(BaseFilterBackend):
+    def filter_queryset(self, request, queryset, view):
+        return filter_rides(queryset, request.query_params, request.user)
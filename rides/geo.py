@@ -0,0 +1,122 @@
+import math
+
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def distance_m(longitude1, latitude1, longitude2, latitude2):
+    # Great-circle distance between two WGS84 coordinates, in metres.
+    phi1 = math.radians(latitude1)
+    phi2 = math.radians(latitude2)
+    delta_phi = phi2 - phi1
+    delta_lambda = math.radians(longitude2 - longitude1)
+    a = (
+        math.sin(delta_phi / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_encode(longitude, latitude, precision):
+    # Same encoding as PostGIS ST_GeoHash.
+    longitude_range = [-180.0, 180.0]
+    latitude_range = [-90.0, 90.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(geohash) < precision:
+        value, value_range = (
+            (longitude, longitude_range) if even else (latitude, latitude_range)
+        )
+        mid = (value_range[0] + value_range[1]) / 2
+        if value > mid:
+            bits = (bits << 1) | 1
+            value_range[0] = mid
+        else:
+            bits = bits << 1
+            value_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(geohash)
+
+
+def geohash_cell_size(precision):
+    # Width and height of a geohash cell in degrees.
+    total_bits = precision * 5
+    longitude_bits = (total_bits + 1) // 2
+    latitude_bits = total_bits // 2
+    return 360.0 / 2**longitude_bits, 180.0 / 2**latitude_bits
+
+
+def geohash_bounds(geohash):
+    # (min_longitude, min_latitude, max_longitude, max_latitude) of a cell.
+    longitude_range = [-180.0, 180.0]
+    latitude_range = [-90.0, 90.0]
+    even = True
+    for character in geohash:
+        bits = GEOHASH_ALPHABET.index(character)
+        for shift in range(4, -1, -1):
+            value_range = longitude_range if even else latitude_range
+            mid = (value_range[0] + value_range[1]) / 2
+            if bits >> shift & 1:
+                value_range[0] = mid
+            else:
+                value_range[1] = mid
+            even = not even
+    return longitude_range[0], latitude_range[0], longitude_range[1], latitude_range[1]
+
+
+def geohash_cover(min_longitude, min_latitude, max_longitude, max_latitude, precision):
+    # Geohash cells of the given precision overlapping a bounding box.
+    width, height = geohash_cell_size(precision)
+    first_column = math.floor((max(min_longitude, -180.0) + 180.0) / width)
+    last_column = math.floor((min(max_longitude, 180.0 - width / 2) + 180.0) / width)
+    first_row = math.floor((max(min_latitude, -90.0) + 90.0) / height)
+    last_row = math.floor((min(max_latitude, 90.0 - height / 2) + 90.0) / height)
+    return [
+        geohash_encode(
+            -180.0 + (column + 0.5) * width, -90.0 + (row + 0.5) * height, precision
+        )
+        for row in range(first_row, last_row + 1)
+        for column in range(first_column, last_column + 1)
+    ]
+
+
+def geohash_cover_count(
+    min_longitude, min_latitude, max_longitude, max_latitude, precision
+):
+    width, height = geohash_cell_size(precision)
+    columns = math.floor((max_longitude + 180.0) / width) - math.floor(
+        (min_longitude + 180.0) / width
+    )
+    rows = math.floor((max_latitude + 90.0) / height) - math.floor(
+        (min_latitude + 90.0) / height
+    )
+    return (columns + 1) * (rows + 1)
+
+
+# Metres per degree of latitude, rounded down so boxes err on the large side.
+METRES_PER_DEGREE = 111000.0
+
+
+def radius_bbox(longitude, latitude, radius):
+    # A bounding box containing every point within radius metres of a point.
+    latitude_delta = radius / METRES_PER_DEGREE
+    widest_latitude = min(abs(latitude) + latitude_delta, 89.0)
+    longitude_delta = radius / (
+        METRES_PER_DEGREE * math.cos(math.radians(widest_latitude))
+    )
+    return (
+        longitude - longitude_delta,
+        latitude - latitude_delta,
+        longitude + longitude_delta,
+        latitude + latitude_delta,
+    )
@@ -0,0 +1,242 @@
+import json
+import logging
+
+import redis
+from django.conf import settings
+from django.db import transaction
+
+from .connections import get_redis
+from .geo import geohash_cover, geohash_encode
+from .models import Ride, RideRequest
+
+
+# Live demand/supply counters per geohash cell, kept in one Redis hash per
+# precision. Every ride and ride request remembers the counters it contributes
+# to, so a create, move, status change or delete only moves that contribution
+# from the old cells to the new ones, atomically in a Lua script.
+#
+# Counters are moved once the write commits. If Redis is unavailable the write
+# still succeeds and the error is logged; python manage.py rebuild_heatmap then
+# repairs the counters.
+
+logger = logging.getLogger(__name__)
+
+METRICS = ("open_rides", "pending_requests", "started_rides")
+
+CONTRIBUTIONS_KEY = "rides:heatmap:contributions"
+COUNTERS_KEY_PREFIX = "rides:heatmap:counters:"
+
+MOVE_CONTRIBUTION_SCRIPT = """
+local old = redis.call('HGET', KEYS[1], ARGV[1])
+if old then
+    for _, entry in ipairs(cjson.decode(old)) do
+        redis.call('HINCRBY', KEYS[2] .. entry[1], entry[2], -1)
+    end
+end
+local new = cjson.decode(ARGV[2])
+for _, entry in ipairs(new) do
+    redis.call('HINCRBY', KEYS[2] .. entry[1], entry[2], 1)
+end
+if #new > 0 then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+else
+    redis.call('HDEL', KEYS[1], ARGV[1])
+end
+"""
+
+
+def counters_key(precision):
+    return f"{COUNTERS_KEY_PREFIX}{precision}"
+
+
+def ride_member(ride_id):
+    return f"ride:{ride_id}"
+
+
+def ride_request_member(ride_request_id):
+    return f"request:{ride_request_id}"
+
+
+def ride_metrics(ride):
+    if ride.status == "PENDING" and ride.rider_id is None:
+        return {"open_rides": ride.current_location}
+    if ride.status == "STARTED":
+        return {"started_rides": ride.current_location}
+    return {}
+
+
+def ride_request_metrics(ride_request, pickup_location):
+    if ride_request.status != "PENDING":
+        return {}
+    return {"pending_requests": pickup_location}
+
+
+def contribution(metrics):
+    # [precision, "cell:metric"] entries for every configured precision.
+    return [
+        [precision, f"{geohash_encode(point.x, point.y, precision)}:{metric}"]
+        for metric, point in metrics.items()
+        for precision in settings.RIDES_HEATMAP_PRECISIONS
+    ]
+
+
+def move_contributions(contributions):
+    # contributions is an iterable of (member, entries) pairs.
+    client = get_redis()
+    script = client.register_script(MOVE_CONTRIBUTION_SCRIPT)
+    with client.pipeline(transaction=False) as pipe:
+        for member, entries in contributions:
+            script(
+                keys=[CONTRIBUTIONS_KEY, COUNTERS_KEY_PREFIX],
+                args=[member, json.dumps(entries)],
+                client=pipe,
+            )
+        pipe.execute()
+
+
+def on_commit(update):
+    # Counters only follow writes that actually commit.
+    def run():
+        try:
+            update()
+        except redis.RedisError:
+            logger.exception("Heatmap update failed, rebuild it with rebuild_heatmap")
+
+    transaction.on_commit(run)
+
+
+def on_commit_move(contributions):
+    contributions = list(contributions)
+    on_commit(lambda: move_contributions(contributions))
+
+
+def ride_saved(ride):
+    on_commit_move([(ride_member(ride.pk), contribution(ride_metrics(ride)))])
+
+
+def rides_deleted(ride_ids):
+    on_commit_move([(ride_member(ride_id), []) for ride_id in ride_ids])
+
+
+def ride_request_saved(ride_request):
+    metrics = ride_request_metrics(ride_request, ride_request.ride.pickup_location)
+    on_commit_move([(ride_request_member(ride_request.pk), contribution(metrics))])
+
+
+def ride_requests_deleted(ride_request_ids):
+    on_commit_move(
+        [
+            (ride_request_member(ride_request_id), [])
+            for ride_request_id in ride_request_ids
+        ]
+    )
+
+
+def rides_changed(ride_ids):
+    # For write paths that bypass Model.save(). One query for the whole batch.
+    rides = Ride.objects.filter(pk__in=ride_ids).only(
+        "pk", "status", "rider", "current_location"
+    )
+    on_commit_move(
+        (ride_member(ride.pk), contribution(ride_metrics(ride))) for ride in rides
+    )
+
+
+def ride_requests_changed(ride_request_ids):
+    ride_requests = (
+        RideRequest.objects.filter(pk__in=ride_request_ids)
+        .select_related("ride")
+        .only("pk", "status", "ride__pickup_location")
+    )
+    on_commit_move(
+        (
+            ride_request_member(ride_request.pk),
+            contribution(
+                ride_request_metrics(ride_request, ride_request.ride.pickup_location)
+            ),
+        )
+        for ride_request in ride_requests
+    )
+
+
+def ride_moved(ride_id, location):
+    # A location-only write keeps the metrics the ride already counts towards,
+    # so no database read is needed to move them to the new cells.
+    def move():
+        entries = get_redis().hget(CONTRIBUTIONS_KEY, ride_member(ride_id))
+        if not entries:
+            return
+        metrics = {entry[1].split(":")[1] for entry in json.loads(entries)}
+        move_contributions(
+            [
+                (
+                    ride_member(ride_id),
+                    contribution({metric: location for metric in metrics}),
+                )
+            ]
+        )
+
+    on_commit(move)
+
+
+def cell_counts(bbox, precision):
+    cells = geohash_cover(*bbox, precision)
+    fields = [f"{cell}:{metric}" for cell in cells for metric in METRICS]
+    values = get_redis().hmget(counters_key(precision), fields) if fields else []
+
+    counts = {}
+    for field, value in zip(fields, values):
+        if value is None or int(value) <= 0:
+            continue
+        cell, metric = field.split(":")
+        counts.setdefault(cell, dict.fromkeys(METRICS, 0))[metric] = int(value)
+    return counts
+
+
+def rebuild():
+    # Recomputes every counter from the database into fresh keys and swaps them
+    # in, repairing any drift. Meant for deploys and off-peak repairs.
+    client = get_redis()
+    suffix = ":rebuild"
+    counters = {precision: {} for precision in settings.RIDES_HEATMAP_PRECISIONS}
+    contributions = {}
+
+    def add(member, entries):
+        if not entries:
+            return
+        contributions[member] = json.dumps(entries)
+        for precision, field in entries:
+            counters[precision][field] = counters[precision].get(field, 0) + 1
+
+    rides = Ride.objects.filter(status__in=("PENDING", "STARTED")).only(
+        "pk", "status", "rider", "current_location"
+    )
+    for ride in rides.iterator():
+        add(ride_member(ride.pk), contribution(ride_metrics(ride)))
+
+    ride_requests = RideRequest.objects.filter(status="PENDING").select_related("ride")
+    for ride_request in ride_requests.only(
+        "pk", "status", "ride__pickup_location"
+    ).iterator():
+        add(
+            ride_request_member(ride_request.pk),
+            contribution(
+                ride_request_metrics(ride_request, ride_request.ride.pickup_location)
+            ),
+        )
+
+    with client.pipeline() as pipe:
+        for key, values in [
+            (CONTRIBUTIONS_KEY, contributions),
+            *(
+                (counters_key(precision), values)
+                for precision, values in counters.items()
+            ),
+        ]:
+            pipe.delete(key + suffix)
+            if values:
+                pipe.hset(key + suffix, mapping=values)
+                pipe.rename(key + suffix, key)
+            else:
+                pipe.delete(key)
+        pipe.execute()
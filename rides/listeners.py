@@ -0,0 +1,101 @@
+import json
+import os
+import select
+import threading
+import time
+
+import psycopg2
+import redis
+from django.db import connection
+
+from .connections import get_redis
+
+# Background threads following a notification channel, one per process and
+# channel, started again in forked workers. on_connect runs once the channel is
+# listened to (given the LISTEN connection, for Postgres), on_message with each
+# batch of decoded JSON payloads, and on_disconnect whenever the connection
+# drops, since whatever was sent while away is lost. The thread reconnects after
+# RECONNECT_DELAY seconds.
+
+RECONNECT_DELAY = 1
+
+
+class Listener:
+    errors = ()
+
+    def __init__(self, name, channel, on_message, on_connect, on_disconnect):
+        self.name = name
+        self.channel = channel
+        self.on_message = on_message
+        self.on_connect = on_connect
+        self.on_disconnect = on_disconnect
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def ensure_started(self):
+        pid = os.getpid()
+        if self.pid == pid:
+            return
+        with self.lock:
+            if self.pid == pid:
+                return
+            self.pid = pid
+        # A forked worker inherits the state its parent's thread maintained,
+        # but not the thread.
+        self.on_disconnect()
+        threading.Thread(target=self.run, name=self.name, daemon=True).start()
+
+    def run(self):
+        while True:
+            try:
+                self.listen()
+            except self.errors:
+                pass
+            self.on_disconnect()
+            time.sleep(RECONNECT_DELAY)
+
+    def listen(self):
+        raise NotImplementedError
+
+
+class PostgresListener(Listener):
+    # LISTEN on a dedicated connection, outside Django's connection handling.
+    errors = (psycopg2.Error,)
+
+    def listen(self):
+        listener = psycopg2.connect(**connection.get_connection_params())
+        try:
+            listener.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with listener.cursor() as cursor:
+                cursor.execute(f"LISTEN {self.channel}")
+            self.on_connect(listener)
+            while True:
+                if select.select([listener], [], [], 60) == ([], [], []):
+                    # Idle, make sure the connection is still alive.
+                    with listener.cursor() as cursor:
+                        cursor.execute("SELECT 1")
+                    continue
+                listener.poll()
+                payloads = []
+                while listener.notifies:
+                    payloads.append(json.loads(listener.notifies.pop(0).payload))
+                self.on_message(payloads)
+        finally:
+            listener.close()
+
+
+class RedisListener(Listener):
+    # A pub/sub subscription on the shared Redis.
+    errors = (redis.RedisError,)
+
+    def listen(self):
+        pubsub = get_redis().pubsub(ignore_subscribe_messages=False)
+        try:
+            pubsub.subscribe(self.channel)
+            for message in pubsub.listen():
+                if message["type"] == "subscribe":
+                    self.on_connect()
+                elif message["type"] == "message":
+                    self.on_message([json.loads(message["data"])])
+        finally:
+            pubsub.close()
@@ -0,0 +1,74 @@
+import time
+
+import redis
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connection
+from django.dispatch import receiver
+
+from .connections import get_broker_redis
+
+# Adaptive load shedding. Each process samples the database round trip time and
+# the Celery backlog every RIDES_LOAD_SAMPLE_INTERVAL seconds and derives a load
+# level from the RIDES_LOAD_* thresholds. Non-critical work checks the level:
+# nearby searches are narrowed or refused, and tracked rides update less often.
+
+NORMAL = 0
+DEGRADED = 1
+OVERLOADED = 2
+
+_sample = {}
+
+
+def db_latency_ms():
+    start = time.perf_counter()
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1")
+    return (time.perf_counter() - start) * 1000
+
+
+def celery_backlog():
+    try:
+        return get_broker_redis().llen(settings.RIDES_LOAD_CELERY_QUEUE)
+    except redis.RedisError:
+        return 0
+
+
+def threshold_level(value, thresholds):
+    # thresholds holds the DEGRADED and OVERLOADED limits.
+    return sum(value >= threshold for threshold in thresholds)
+
+
+def current_level():
+    now = time.monotonic()
+    if _sample.get("expires", 0) > now:
+        return _sample["level"]
+
+    level = max(
+        threshold_level(db_latency_ms(), settings.RIDES_LOAD_DB_LATENCY_MS),
+        threshold_level(celery_backlog(), settings.RIDES_LOAD_CELERY_BACKLOG),
+    )
+    _sample.update(level=level, expires=now + settings.RIDES_LOAD_SAMPLE_INTERVAL)
+    return level
+
+
+def nearby_radius():
+    # None once nearby searches are shed altogether.
+    level = current_level()
+    if level >= OVERLOADED:
+        return None
+    if level >= DEGRADED:
+        return min(settings.RIDES_NEARBY_RADIUS_M, settings.RIDES_SHED_NEARBY_RADIUS_M)
+    return settings.RIDES_NEARBY_RADIUS_M
+
+
+def tracking_interval():
+    if current_level() >= DEGRADED:
+        return settings.RIDES_TRACKING_INTERVAL * settings.RIDES_SHED_TRACKING_FACTOR
+    return settings.RIDES_TRACKING_INTERVAL
+
+
+@receiver(setting_changed)
+def reset_sample(setting, **kwargs):
+    if setting.startswith("RIDES_LOAD_"):
+        _sample.clear()
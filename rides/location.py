@@ -0,0 +1,96 @@
+import json
+
+import redis
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .connections import get_redis
+from .geo import distance_m
+from .models import Ride, RideVersionConflict
+from .signals import rides_updated
+
+
+# Dead-banding of location writes. The last persisted location of each ride is
+# kept in Redis for RIDES_LOCATION_MAX_SKIP_SECONDS, shared by the web and Celery
+# workers, so deciding whether a new location is worth writing needs no database
+# read: while the entry exists, movements shorter than
+# RIDES_LOCATION_MIN_DISTANCE_M are skipped. Only location writes are remembered,
+# once committed. Other saves of a ride forget its entry, and without Redis every
+# location is written.
+
+
+def last_location_key(ride_id):
+    return f"rides:location:{ride_id}"
+
+
+def remember_location(ride_id, location):
+    if settings.RIDES_LOCATION_MAX_SKIP_SECONDS <= 0:
+        return
+    last_location = json.dumps([location.x, location.y])
+
+    def remember():
+        try:
+            get_redis().set(
+                last_location_key(ride_id),
+                last_location,
+                ex=settings.RIDES_LOCATION_MAX_SKIP_SECONDS,
+            )
+        except redis.RedisError:
+            pass
+
+    transaction.on_commit(remember)
+
+
+def forget_location(ride_id):
+    try:
+        get_redis().delete(last_location_key(ride_id))
+    except redis.RedisError:
+        pass
+
+
+def clear():
+    client = get_redis()
+    keys = list(client.scan_iter(match="rides:location:*"))
+    if keys:
+        client.delete(*keys)
+
+
+def should_write_location(ride_id, location):
+    try:
+        last_location = get_redis().get(last_location_key(ride_id))
+    except redis.RedisError:
+        return True
+    if last_location is None:
+        return True
+    longitude, latitude = json.loads(last_location)
+    moved = distance_m(longitude, latitude, location.x, location.y)
+    return moved >= settings.RIDES_LOCATION_MIN_DISTANCE_M
+
+
+def write_ride_location(ride_id, location, force=False, version=None):
+    # Returns whether the location was persisted. With a version, the write only
+    # applies to that version of the ride and raises RideVersionConflict if the
+    # ride has moved on.
+    if not force and not should_write_location(ride_id, location):
+        return False
+
+    rides = Ride.objects.filter(pk=ride_id)
+    if version is not None:
+        rides = rides.filter(version=version)
+    updated = rides.update(
+        current_location=location,
+        updated_at=timezone.now(),
+        version=F("version") + 1,
+    )
+    if not updated:
+        if version is not None and Ride.objects.filter(pk=ride_id).exists():
+            raise RideVersionConflict(f"Ride {ride_id} changed since version {version}")
+        return False
+
+    remember_location(ride_id, location)
+    rides_updated.send(
+        sender=Ride, ride_ids=[ride_id], changes={"current_location": location}
+    )
+    return True
@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from rides.archive import archive_finished_rides
+
+
+class Command(BaseCommand):
+    help = "Move completed and cancelled rides into the monthly archive tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than-days",
+            type=int,
+            default=settings.RIDE_ARCHIVE_AFTER_DAYS,
+            help="Only archive rides finished at least this many days ago.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.RIDE_ARCHIVE_BATCH_SIZE,
+            help="Number of rides moved per transaction.",
+        )
+        parser.add_argument(
+            "--max-batches",
+            type=int,
+            default=None,
+            help="Stop after this many batches. The next run resumes from there.",
+        )
+
+    def handle(self, *args, **options):
+        archived = archive_finished_rides(
+            older_than=timedelta(days=options["older_than_days"]),
+            batch_size=options["batch_size"],
+            max_batches=options["max_batches"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} rides"))
@@ -0,0 +1,122 @@
+import heapq
+import math
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from rides.routing.graph import RoadGraph, build
+from rides.routing.router import Router
+from rides.routing.synthetic import grid_network
+
+
+def dijkstra_seconds(graph, source, target):
+    # Plain Dijkstra over the hierarchy flattened back into one graph (its
+    # shortcuts keep every distance), as the baseline.
+    distances = {source: 0.0}
+    heap = [(0.0, source)]
+    while heap:
+        distance, node = heapq.heappop(heap)
+        if node == target:
+            return distance
+        if distance > distances[node]:
+            continue
+        for neighbour, weight in graph[node]:
+            candidate = distance + weight
+            if candidate < distances.get(neighbour, math.inf):
+                distances[neighbour] = candidate
+                heapq.heappush(heap, (candidate, neighbour))
+    return None
+
+
+class Command(BaseCommand):
+    help = "Measure ETA batches on the road graph against plain Dijkstra"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--graph",
+            default=settings.RIDES_ROAD_GRAPH_PATH,
+            help="Road graph file, RIDES_ROAD_GRAPH_PATH by default.",
+        )
+        parser.add_argument(
+            "--grid",
+            type=int,
+            default=None,
+            help="Benchmark a generated grid of this many streets per side instead.",
+        )
+        parser.add_argument("--batches", type=int, default=100)
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=20,
+            help="Candidate rides per batch, i.e. per nearby call.",
+        )
+        parser.add_argument(
+            "--verify",
+            type=int,
+            default=50,
+            help="Number of routes also computed with plain Dijkstra.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        if options["grid"]:
+            start = time.perf_counter()
+            graph = build(*grid_network(options["grid"], rng))
+            self.stdout.write(
+                f"Built and contracted a {len(graph)} node grid "
+                f"in {time.perf_counter() - start:.1f} s"
+            )
+        elif options["graph"]:
+            graph = RoadGraph.load(options["graph"])
+        else:
+            raise CommandError("Pass --graph, --grid or set RIDES_ROAD_GRAPH_PATH.")
+
+        router = Router(graph, settings.RIDES_ROAD_SNAP_MAX_M)
+        nodes = len(graph)
+        batches = [
+            (
+                [rng.randrange(nodes) for _ in range(options["batch_size"])],
+                rng.randrange(nodes),
+            )
+            for _ in range(options["batches"])
+        ]
+
+        start = time.perf_counter()
+        results = [router.node_seconds(sources, target) for sources, target in batches]
+        per_batch = (time.perf_counter() - start) / len(batches)
+
+        flat = [[] for _ in range(nodes)]
+        for node in range(nodes):
+            for target, weight in graph.up.edges(node):
+                flat[node].append((target, weight))
+            for source, weight in graph.down.edges(node):
+                flat[source].append((node, weight))
+
+        routes = [
+            (source, target, seconds)
+            for (sources, target), batch in zip(batches, results)
+            for source, seconds in zip(sources, batch)
+        ][: options["verify"]]
+        start = time.perf_counter()
+        mismatches = 0
+        for source, target, seconds in routes:
+            expected = dijkstra_seconds(flat, source, target)
+            if (expected is None) != (seconds is None) or (
+                expected is not None and abs(expected - seconds) > 0.01 * expected + 1
+            ):
+                mismatches += 1
+        per_route = (time.perf_counter() - start) / max(len(routes), 1)
+
+        self.stdout.write(
+            f"Graph: {nodes} nodes, {len(graph.up.targets) + len(graph.down.targets)} "
+            "hierarchy edges"
+        )
+        self.stdout.write(
+            f"Contraction hierarchy: {per_batch * 1000:.2f} ms per batch of "
+            f"{options['batch_size']}"
+        )
+        self.stdout.write(f"Plain Dijkstra: {per_route * 1000:.2f} ms per route")
+        self.stdout.write(f"Routes differing from Dijkstra: {mismatches}/{len(routes)}")
@@ -0,0 +1,96 @@
+import math
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from rides.geo import METRES_PER_DEGREE, distance_m
+from rides.routing.graph import RoadGraph, build
+from rides.routing.mapmatch import MapMatcher
+from rides.routing.synthetic import grid_network, random_drive
+
+
+class Command(BaseCommand):
+    help = "Measure map matching throughput and accuracy on simulated GPS traces"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--graph",
+            default=settings.RIDES_ROAD_GRAPH_PATH,
+            help="Road graph file, RIDES_ROAD_GRAPH_PATH by default.",
+        )
+        parser.add_argument(
+            "--grid",
+            type=int,
+            default=None,
+            help="Benchmark a generated grid of this many streets per side instead.",
+        )
+        parser.add_argument("--traces", type=int, default=50)
+        parser.add_argument(
+            "--pings", type=int, default=200, help="Pings per simulated trace."
+        )
+        parser.add_argument(
+            "--noise",
+            type=float,
+            default=15.0,
+            help="Standard deviation of the GPS noise added, in metres.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        if options["grid"]:
+            graph = build(*grid_network(options["grid"], rng))
+        elif options["graph"]:
+            graph = RoadGraph.load(options["graph"])
+        else:
+            raise CommandError("Pass --graph, --grid or set RIDES_ROAD_GRAPH_PATH.")
+
+        start = time.perf_counter()
+        matcher = MapMatcher(graph, settings.RIDES_MAP_MATCH_RADIUS_M)
+        self.stdout.write(
+            f"Indexed {len(matcher.segment_starts)} segments "
+            f"in {time.perf_counter() - start:.1f} s"
+        )
+
+        traces = []
+        for _ in range(options["traces"]):
+            truth = random_drive(graph, options["pings"], rng)
+            noisy = []
+            for longitude, latitude in truth:
+                scale_x = METRES_PER_DEGREE * math.cos(math.radians(latitude))
+                noisy.append(
+                    (
+                        longitude + rng.gauss(0, options["noise"]) / scale_x,
+                        latitude + rng.gauss(0, options["noise"]) / METRES_PER_DEGREE,
+                    )
+                )
+            traces.append((truth, noisy))
+
+        # One process, so this is the throughput of one core.
+        start = time.perf_counter()
+        results = [matcher.match(noisy) for _, noisy in traces]
+        elapsed = time.perf_counter() - start
+
+        raw_errors = []
+        matched_errors = []
+        unmatched = 0
+        for (truth, noisy), matched in zip(traces, results):
+            for actual, raw, snapped in zip(truth, noisy, matched):
+                raw_errors.append(distance_m(*actual, *raw))
+                if snapped is None:
+                    unmatched += 1
+                else:
+                    matched_errors.append(distance_m(*actual, *snapped))
+
+        pings = sum(len(noisy) for _, noisy in traces)
+        self.stdout.write(f"Graph: {len(graph)} nodes, {pings} pings")
+        self.stdout.write(
+            f"Throughput: {pings / elapsed:.0f} pings per second per core"
+        )
+        self.stdout.write(
+            f"Mean error: {sum(raw_errors) / len(raw_errors):.1f} m raw, "
+            f"{sum(matched_errors) / max(len(matched_errors), 1):.1f} m matched"
+        )
+        self.stdout.write(f"Unmatched pings: {unmatched}/{pings}")
@@ -0,0 +1,116 @@
+import random
+import time
+
+from django.conf import settings
+from django.contrib.gis.db.models.functions import Distance as DistanceFunction
+from django.contrib.gis.geos import Point
+from django.contrib.gis.measure import Distance
+from django.core.management.base import BaseCommand, CommandError
+
+from rides.geo import METRES_PER_DEGREE
+from rides.matching import (
+    geography_nearby_rides,
+    od_cell_nearby_rides,
+    planar_nearby_rides,
+)
+from rides.models import Ride
+
+
+class Command(BaseCommand):
+    help = "Compare accuracy and speed of geography, planar and OD cell ride matching"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--samples",
+            type=int,
+            default=100,
+            help="Number of nearby queries to run on each path.",
+        )
+        parser.add_argument(
+            "--radius",
+            type=float,
+            default=settings.RIDES_NEARBY_RADIUS_M,
+            help="Matching radius in metres.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        radius = options["radius"]
+        rng = random.Random(options["seed"])
+
+        # Query around existing rides so both paths return realistic result sets.
+        locations = list(
+            Ride.objects.values_list("current_location", "dropoff_location")[
+                : options["samples"]
+            ]
+        )
+        if not locations:
+            raise CommandError("No rides to benchmark against.")
+
+        def jitter(point):
+            offset = radius / METRES_PER_DEGREE
+            return Point(
+                point.x + rng.uniform(-offset, offset),
+                point.y + rng.uniform(-offset, offset),
+                srid=4326,
+            )
+
+        queries = [(jitter(current), jitter(dropoff)) for current, dropoff in locations]
+
+        timings = {}
+        results = {}
+        for name, matcher in (
+            ("geography", geography_nearby_rides),
+            ("planar", planar_nearby_rides),
+            ("od_cell", od_cell_nearby_rides),
+        ):
+            start = time.perf_counter()
+            results[name] = [
+                set(matcher(origin, destination, radius).values_list("pk", flat=True))
+                for origin, destination in queries
+            ]
+            timings[name] = (time.perf_counter() - start) / len(queries)
+
+        mismatches = {
+            name: sum(
+                geography != other
+                for geography, other in zip(results["geography"], results[name])
+            )
+            for name in ("planar", "od_cell")
+        }
+
+        max_error = 0.0
+        max_relative_error = 0.0
+        for origin, _ in queries:
+            planar_origin = origin.transform(settings.RIDES_PROJECTED_SRID, clone=True)
+            distances = (
+                Ride.objects.filter(
+                    current_location__dwithin=(origin, Distance(m=radius * 10))
+                )
+                .annotate(
+                    geography_distance=DistanceFunction("current_location", origin),
+                    planar_distance=DistanceFunction(
+                        "current_location_planar", planar_origin
+                    ),
+                )
+                .values_list("geography_distance", "planar_distance")[:50]
+            )
+            for geography_distance, planar_distance in distances:
+                error = abs(geography_distance.m - planar_distance.m)
+                max_error = max(max_error, error)
+                if geography_distance.m:
+                    max_relative_error = max(
+                        max_relative_error, error / geography_distance.m
+                    )
+
+        self.stdout.write(f"Queries per path: {len(queries)}, radius: {radius} m")
+        for name, seconds in timings.items():
+            self.stdout.write(f"{name:>10}: {seconds * 1000:.3f} ms per query")
+        for name, count in mismatches.items():
+            self.stdout.write(
+                f"Result sets differing from geography ({name}): "
+                f"{count}/{len(queries)}"
+            )
+        self.stdout.write(
+            f"Max distance error: {max_error:.3f} m ({max_relative_error:.4%})"
+        )
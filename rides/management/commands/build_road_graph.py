@@ -0,0 +1,46 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from rides.routing.graph import build
+from rides.routing.osm import read_osm
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the contracted road graph used for ETAs from a local OSM XML "
+        "extract. Metro-sized extracts take a few minutes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("osm", help="Path of the OSM XML extract.")
+        parser.add_argument(
+            "--output",
+            default=settings.RIDES_ROAD_GRAPH_PATH,
+            help="Where to write the graph, RIDES_ROAD_GRAPH_PATH by default.",
+        )
+
+    def handle(self, *args, **options):
+        if not options["output"]:
+            raise CommandError("Pass --output or set RIDES_ROAD_GRAPH_PATH.")
+
+        start = time.perf_counter()
+        coordinates, edges = read_osm(options["osm"])
+        if not edges:
+            raise CommandError("No drivable roads in the extract.")
+        self.stdout.write(
+            f"Read {len(coordinates)} nodes and {len(edges)} edges "
+            f"in {time.perf_counter() - start:.1f} s"
+        )
+
+        start = time.perf_counter()
+        graph = build(coordinates, edges)
+        self.stdout.write(
+            f"Contracted into {len(graph.up.targets)} upward and "
+            f"{len(graph.down.targets)} downward edges "
+            f"in {time.perf_counter() - start:.1f} s"
+        )
+
+        graph.save(options["output"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
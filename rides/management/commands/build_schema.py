@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from rides.schema import build_artifacts
+
+
+class Command(BaseCommand):
+    help = "Generate the OpenAPI schema artifact served from /api/schema/"
+
+    def handle(self, *args, **options):
+        for path in build_artifacts():
+            self.stdout.write(self.style.SUCCESS(f"Wrote {path}"))
@@ -0,0 +1,67 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from rides.export import MODELS, Export, ParquetUnavailable
+
+
+class Command(BaseCommand):
+    help = "Stream rides or ride requests to NDJSON or Parquet in constant memory"
+
+    def add_arguments(self, parser):
+        parser.add_argument("model", choices=sorted(MODELS))
+        parser.add_argument(
+            "--output", default="-", help="File to write, standard output by default."
+        )
+        parser.add_argument("--format", choices=["ndjson", "parquet"], default="ndjson")
+        parser.add_argument(
+            "--since",
+            default=None,
+            help="Only rows updated after this ISO datetime, e.g. the watermark "
+            "reported by the previous export.",
+        )
+        parser.add_argument(
+            "--archived", action="store_true", help="Include the archive tables."
+        )
+        parser.add_argument(
+            "--trajectories",
+            action="store_true",
+            help="Include the map-matched trace of each ride.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=None)
+
+    def handle(self, *args, **options):
+        since = None
+        if options["since"] is not None:
+            since = parse_datetime(options["since"])
+            if since is None:
+                raise CommandError("--since must be an ISO datetime")
+
+        export = Export(
+            options["model"],
+            since=since,
+            archived=options["archived"],
+            trajectories=options["trajectories"],
+            chunk_size=options["chunk_size"],
+        )
+        try:
+            stream = export.stream(options["format"])
+        except ParquetUnavailable as exc:
+            raise CommandError(str(exc))
+
+        if options["output"] == "-":
+            output = sys.stdout.buffer
+            for data in stream:
+                output.write(data)
+            output.flush()
+        else:
+            with open(options["output"], "wb") as output:
+                for data in stream:
+                    output.write(data)
+
+        watermark = "none" if export.watermark is None else export.watermark.isoformat()
+        # Reported on stderr, so it never mixes with an export on stdout.
+        self.stderr.write(
+            f"Exported {export.rows} {options['model']}, watermark {watermark}"
+        )
@@ -0,0 +1,71 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Runs in a fresh interpreter, boots Django and Celery the way a worker does
+# and reports peak RSS in KiB and the number of loaded modules.
+BOOT_SCRIPT = """
+import resource
+import sys
+
+import django
+
+django.setup()
+
+from ridesharer.celery import app
+
+app.loader.import_default_modules()
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, len(sys.modules))
+"""
+
+
+class Command(BaseCommand):
+    help = "Measure Celery worker startup time and memory per settings module"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "settings_modules",
+            nargs="*",
+            default=["ridesharer.settings", "ridesharer.settings_worker"],
+        )
+        parser.add_argument(
+            "--runs",
+            type=int,
+            default=5,
+            help="Number of cold starts measured per settings module.",
+        )
+
+    def handle(self, *args, **options):
+        for settings_module in options["settings_modules"]:
+            timings = []
+            rss = []
+            for _ in range(options["runs"]):
+                start = time.perf_counter()
+                result = subprocess.run(
+                    [sys.executable, "-c", BOOT_SCRIPT],
+                    cwd=settings.BASE_DIR,
+                    env={**os.environ, "DJANGO_SETTINGS_MODULE": settings_module},
+                    capture_output=True,
+                    text=True,
+                )
+                elapsed = time.perf_counter() - start
+                if result.returncode:
+                    raise CommandError(
+                        f"{settings_module} failed to boot:\n{result.stderr}"
+                    )
+                max_rss, modules = map(int, result.stdout.split()[-2:])
+                timings.append(elapsed)
+                rss.append(max_rss)
+
+            self.stdout.write(
+                f"{settings_module}: "
+                f"{statistics.median(timings) * 1000:.0f} ms median startup, "
+                f"{statistics.median(rss) / 1024:.1f} MiB peak RSS, "
+                f"{modules} modules"
+            )
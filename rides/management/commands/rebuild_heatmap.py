@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from rides import heatmap
+
+
+class Command(BaseCommand):
+    help = "Recompute the demand/supply heat map counters from the database"
+
+    def handle(self, *args, **options):
+        heatmap.rebuild()
+        self.stdout.write(self.style.SUCCESS("Rebuilt heat map counters"))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from rides.rollups import refresh_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the analytics rollups of the hours changed since the last run"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Recompute every hour, e.g. after changing RIDES_ROLLUP_CELL_PRECISION.",
+        )
+
+    def handle(self, *args, **options):
+        hours = refresh_rollups(rebuild=options["rebuild"])
+        self.stdout.write(self.style.SUCCESS(f"Refreshed {hours} hours of rollups"))
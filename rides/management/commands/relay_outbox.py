@@ -0,0 +1,41 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from rides.outbox import relay_batch
+
+
+class Command(BaseCommand):
+    help = "Publish the side effects recorded in the outbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.RIDES_OUTBOX_BATCH_SIZE,
+            help="Number of messages published per transaction.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=settings.RIDES_OUTBOX_POLL_INTERVAL,
+            help="Seconds to wait once the outbox is drained.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Drain the outbox and exit instead of polling.",
+        )
+
+    def handle(self, *args, **options):
+        relayed = 0
+        while True:
+            published = relay_batch(options["batch_size"])
+            relayed += published
+            if published < options["batch_size"]:
+                if options["once"]:
+                    break
+                time.sleep(options["poll_interval"])
+
+        self.stdout.write(self.style.SUCCESS(f"Relayed {relayed} messages"))
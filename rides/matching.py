@@ -0,0 +1,92 @@
+from django.conf import settings
+from django.contrib.gis.db.models.functions import Distance as DistanceFunction
+from django.contrib.gis.measure import Distance
+
+from . import routing
+from .geo import geohash_cover, radius_bbox
+from .models import Ride
+
+
+def nearby_rides(user_location, destination_location, radius=None):
+    # Rides without a rider whose current location is near the user and whose
+    # dropoff location is near the user's destination, closest first.
+    if radius is None:
+        radius = settings.RIDES_NEARBY_RADIUS_M
+
+    if settings.RIDES_USE_PROJECTED_MATCHING:
+        return planar_nearby_rides(user_location, destination_location, radius)
+    if settings.RIDES_USE_OD_CELL_MATCHING:
+        return od_cell_nearby_rides(user_location, destination_location, radius)
+    return geography_nearby_rides(user_location, destination_location, radius)
+
+
+def order_by_eta(rides, user_location):
+    # Annotates the rides (a list) with eta_seconds, the driving time from their
+    # current location to the user, and sorts them by it, rides without an ETA
+    # last. Returns False and leaves the rides alone without a road graph.
+    etas = routing.eta_seconds([ride.current_location for ride in rides], user_location)
+    if etas is None:
+        return False
+    for ride, eta in zip(rides, etas):
+        ride.eta_seconds = eta
+    rides.sort(key=lambda ride: (ride.eta_seconds is None, ride.eta_seconds or 0))
+    return True
+
+
+def od_cell_pairs(user_location, destination_location, radius):
+    precision = settings.RIDES_OD_CELL_PRECISION
+    origins = geohash_cover(
+        *radius_bbox(user_location.x, user_location.y, radius), precision
+    )
+    destinations = geohash_cover(
+        *radius_bbox(destination_location.x, destination_location.y, radius), precision
+    )
+    return [
+        f"{origin}:{destination}" for origin in origins for destination in destinations
+    ]
+
+
+def geography_nearby_rides(user_location, destination_location, radius):
+    return (
+        Ride.objects.filter(
+            rider=None,
+            current_location__distance_lt=(user_location, Distance(m=radius)),
+            dropoff_location__distance_lt=(destination_location, Distance(m=radius)),
+        )
+        .annotate(distance=DistanceFunction("current_location", user_location))
+        .order_by("distance")
+    )
+
+
+def planar_nearby_rides(user_location, destination_location, radius):
+    # Same as geography_nearby_rides, but on the planar columns so PostGIS does
+    # cartesian instead of spheroidal math.
+    user_location = user_location.transform(settings.RIDES_PROJECTED_SRID, clone=True)
+    destination_location = destination_location.transform(
+        settings.RIDES_PROJECTED_SRID, clone=True
+    )
+    return (
+        Ride.objects.filter(
+            rider=None,
+            current_location_planar__dwithin=(user_location, Distance(m=radius)),
+            dropoff_location_planar__dwithin=(
+                destination_location,
+                Distance(m=radius),
+            ),
+        )
+        .annotate(distance=DistanceFunction("current_location_planar", user_location))
+        .order_by("distance")
+    )
+
+
+def od_cell_nearby_rides(user_location, destination_location, radius):
+    # Candidates come from one lookup of the (origin cell, destination cell)
+    # index over the cells around both ends, and the exact distance checks only
+    # run on those. Radii covering too many cell pairs fall back to the spatial
+    # index.
+    pairs = od_cell_pairs(user_location, destination_location, radius)
+    if len(pairs) > settings.RIDES_OD_CELL_MAX_PAIRS:
+        return geography_nearby_rides(user_location, destination_location, radius)
+    return geography_nearby_rides(user_location, destination_location, radius).filter(
+        od_cell__in=pairs
+    )
@@ -0,0 +1,72 @@
+import re
+
+import brotli
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+
+re_accept_encoding = re.compile(r"([a-z*]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?")
+
+
+def accepted_encodings(header):
+    encodings = set()
+    for coding, quality in re_accept_encoding.findall(header.lower()):
+        try:
+            if quality and float(quality) <= 0:
+                continue
+        except ValueError:
+            continue
+        encodings.add(coding)
+    return encodings
+
+
+class CompressionMiddleware:
+    # Like django.middleware.gzip.GZipMiddleware, with brotli support and a
+    # configurable size threshold below which responses are sent as is. Only
+    # the content types in RESPONSE_COMPRESSION_CONTENT_TYPES are compressed.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        return self.compress(request, response)
+
+    def compress(self, request, response):
+        content_type = response.get("Content-Type", "").split(";")[0].strip()
+        if (
+            response.streaming
+            or response.has_header("Content-Encoding")
+            or content_type.lower() not in settings.RESPONSE_COMPRESSION_CONTENT_TYPES
+            or len(response.content) < settings.RESPONSE_COMPRESSION_MIN_SIZE
+        ):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encodings = accepted_encodings(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if "br" in encodings:
+            encoding = "br"
+            content = brotli.compress(
+                response.content, quality=settings.RESPONSE_COMPRESSION_BROTLI_QUALITY
+            )
+        elif "gzip" in encodings:
+            encoding = "gzip"
+            content = compress_string(response.content)
+        else:
+            return response
+
+        # Return the original response if compression doesn't pay off.
+        if len(content) >= len(response.content):
+            return response
+
+        response.content = content
+        response.headers["Content-Length"] = str(len(content))
+        response.headers["Content-Encoding"] = encoding
+
+        # A compressed body is no longer byte-for-byte identical to the
+        # uncompressed one, so strong ETags are weakened (RFC 9110 8.8.1).
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        return response
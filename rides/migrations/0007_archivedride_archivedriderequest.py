@@ -0,0 +1,153 @@
+# Generated by Django 4.2.3 on 2026-10-19 09:12
+
+from django.conf import settings
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+ARCHIVE_TABLES_SQL = """
+CREATE TABLE rides_archivedride (
+    id bigint NOT NULL,
+    rider_id bigint NULL,
+    driver_id bigint NOT NULL,
+    current_location geography(POINT, 4326) NOT NULL,
+    pickup_location geography(POINT, 4326) NOT NULL,
+    dropoff_location geography(POINT, 4326) NOT NULL,
+    status varchar(20) NOT NULL,
+    created_at timestamp with time zone NOT NULL,
+    updated_at timestamp with time zone NOT NULL,
+    archived_at timestamp with time zone NOT NULL,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+CREATE INDEX rides_archivedride_driver_idx
+    ON rides_archivedride (driver_id, created_at);
+CREATE INDEX rides_archivedride_rider_idx
+    ON rides_archivedride (rider_id, created_at);
+
+CREATE TABLE rides_archivedriderequest (
+    id bigint NOT NULL,
+    ride_id bigint NOT NULL,
+    rider_id bigint NULL,
+    is_accepted boolean NOT NULL,
+    created_at timestamp with time zone NOT NULL,
+    updated_at timestamp with time zone NOT NULL,
+    archived_at timestamp with time zone NOT NULL,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+CREATE INDEX rides_archivedriderequest_ride_idx
+    ON rides_archivedriderequest (ride_id);
+CREATE INDEX rides_archivedriderequest_rider_idx
+    ON rides_archivedriderequest (rider_id, created_at);
+"""
+
+DROP_ARCHIVE_TABLES_SQL = """
+DROP TABLE IF EXISTS rides_archivedriderequest;
+DROP TABLE IF EXISTS rides_archivedride;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("rides", "0006_alter_ride_rider"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedRide",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                (
+                    "current_location",
+                    django.contrib.gis.db.models.fields.PointField(
+                        geography=True, srid=4326
+                    ),
+                ),
+                (
+                    "pickup_location",
+                    django.contrib.gis.db.models.fields.PointField(
+                        geography=True, srid=4326
+                    ),
+                ),
+                (
+                    "dropoff_location",
+                    django.contrib.gis.db.models.fields.PointField(
+                        geography=True, srid=4326
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("PENDING", "Pending"),
+                            ("STARTED", "Started"),
+                            ("COMPLETED", "Completed"),
+                            ("CANCELLED", "Cancelled"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("created_at", models.DateTimeField()),
+                ("updated_at", models.DateTimeField()),
+                ("archived_at", models.DateTimeField()),
+                (
+                    "driver",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "rider",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "rides_archivedride",
+                "managed": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="ArchivedRideRequest",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("is_accepted", models.BooleanField(default=False)),
+                ("created_at", models.DateTimeField()),
+                ("updated_at", models.DateTimeField()),
+                ("archived_at", models.DateTimeField()),
+                (
+                    "ride",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="ride_requests",
+                        to="rides.archivedride",
+                    ),
+                ),
+                (
+                    "rider",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "rides_archivedriderequest",
+                "managed": False,
+            },
+        ),
+        migrations.RunSQL(ARCHIVE_TABLES_SQL, DROP_ARCHIVE_TABLES_SQL),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 4.2.3 on 2026-10-19 10:04
+
+from django.conf import settings
+import django.contrib.gis.db.models.fields
+from django.db import migrations
+
+
+SYNC_PLANAR_LOCATIONS_SQL = f"""
+CREATE OR REPLACE FUNCTION rides_ride_sync_planar_locations() RETURNS trigger AS $$
+BEGIN
+    NEW.current_location_planar := ST_Transform(
+        NEW.current_location::geometry, {settings.RIDES_PROJECTED_SRID}
+    );
+    NEW.pickup_location_planar := ST_Transform(
+        NEW.pickup_location::geometry, {settings.RIDES_PROJECTED_SRID}
+    );
+    NEW.dropoff_location_planar := ST_Transform(
+        NEW.dropoff_location::geometry, {settings.RIDES_PROJECTED_SRID}
+    );
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER rides_ride_sync_planar_locations
+    BEFORE INSERT OR UPDATE OF current_location, pickup_location, dropoff_location
+    ON rides_ride
+    FOR EACH ROW EXECUTE FUNCTION rides_ride_sync_planar_locations();
+
+UPDATE rides_ride SET
+    current_location_planar = ST_Transform(
+        current_location::geometry, {settings.RIDES_PROJECTED_SRID}
+    ),
+    pickup_location_planar = ST_Transform(
+        pickup_location::geometry, {settings.RIDES_PROJECTED_SRID}
+    ),
+    dropoff_location_planar = ST_Transform(
+        dropoff_location::geometry, {settings.RIDES_PROJECTED_SRID}
+    );
+"""
+
+DROP_SYNC_PLANAR_LOCATIONS_SQL = """
+DROP TRIGGER IF EXISTS rides_ride_sync_planar_locations ON rides_ride;
+DROP FUNCTION IF EXISTS rides_ride_sync_planar_locations();
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("rides", "0007_archivedride_archivedriderequest"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ride",
+            name="current_location_planar",
+            field=django.contrib.gis.db.models.fields.PointField(
+                blank=True,
+                editable=False,
+                null=True,
+                srid=settings.RIDES_PROJECTED_SRID,
+            ),
+        ),
+        migrations.AddField(
+            model_name="ride",
+            name="dropoff_location_planar",
+            field=django.contrib.gis.db.models.fields.PointField(
+                blank=True,
+                editable=False,
+                null=True,
+                srid=settings.RIDES_PROJECTED_SRID,
+            ),
+        ),
+        migrations.AddField(
+            model_name="ride",
+            name="pickup_location_planar",
+            field=django.contrib.gis.db.models.fields.PointField(
+                blank=True,
+                editable=False,
+                null=True,
+                srid=settings.RIDES_PROJECTED_SRID,
+            ),
+        ),
+        migrations.RunSQL(SYNC_PLANAR_LOCATIONS_SQL, DROP_SYNC_PLANAR_LOCATIONS_SQL),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.3 on 2026-10-19 15:02
+
+from django.db import migrations, models
+
+
+RIDE_REQUEST_STATUS_SQL = """
+UPDATE rides_riderequest SET status = 'ACCEPTED' WHERE is_accepted;
+
+ALTER TABLE rides_archivedriderequest
+    ADD COLUMN status varchar(20) NOT NULL DEFAULT 'PENDING';
+UPDATE rides_archivedriderequest SET status = 'ACCEPTED' WHERE is_accepted;
+"""
+
+DROP_RIDE_REQUEST_STATUS_SQL = """
+ALTER TABLE rides_archivedriderequest DROP COLUMN IF EXISTS status;
+"""
+
+STATUS_CHOICES = [
+    ("PENDING", "Pending"),
+    ("ACCEPTED", "Accepted"),
+    ("REJECTED", "Rejected"),
+    ("EXPIRED", "Expired"),
+]
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("rides", "0009_outboxmessage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="riderequest",
+            name="status",
+            field=models.CharField(
+                choices=STATUS_CHOICES, default="PENDING", max_length=20
+            ),
+        ),
+        migrations.AddField(
+            model_name="archivedriderequest",
+            name="status",
+            field=models.CharField(
+                choices=STATUS_CHOICES, default="PENDING", max_length=20
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="riderequest",
+            index=models.Index(
+                condition=models.Q(("status", "PENDING")),
+                fields=["created_at"],
+                name="rides_riderequest_pending_idx",
+            ),
+        ),
+        migrations.RunSQL(RIDE_REQUEST_STATUS_SQL, DROP_RIDE_REQUEST_STATUS_SQL),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.3 on 2026-10-19 15:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+SYNC_OD_CELL_SQL = f"""
+CREATE OR REPLACE FUNCTION rides_ride_sync_od_cell() RETURNS trigger AS $$
+BEGIN
+    IF NEW.rider_id IS NULL THEN
+        NEW.od_cell := ST_GeoHash(
+            NEW.current_location::geometry, {settings.RIDES_OD_CELL_PRECISION}
+        ) || ':' || ST_GeoHash(
+            NEW.dropoff_location::geometry, {settings.RIDES_OD_CELL_PRECISION}
+        );
+    ELSE
+        NEW.od_cell := NULL;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER rides_ride_sync_od_cell
+    BEFORE INSERT OR UPDATE OF current_location, dropoff_location, rider_id
+    ON rides_ride
+    FOR EACH ROW EXECUTE FUNCTION rides_ride_sync_od_cell();
+
+UPDATE rides_ride SET od_cell =
+    ST_GeoHash(current_location::geometry, {settings.RIDES_OD_CELL_PRECISION})
+    || ':' ||
+    ST_GeoHash(dropoff_location::geometry, {settings.RIDES_OD_CELL_PRECISION})
+WHERE rider_id IS NULL;
+"""
+
+DROP_SYNC_OD_CELL_SQL = """
+DROP TRIGGER IF EXISTS rides_ride_sync_od_cell ON rides_ride;
+DROP FUNCTION IF EXISTS rides_ride_sync_od_cell();
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("rides", "0010_riderequest_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ride",
+            name="od_cell",
+            field=models.CharField(
+                blank=True, editable=False, max_length=25, null=True
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="ride",
+            index=models.Index(
+                condition=models.Q(("od_cell__isnull", False)),
+                fields=["od_cell"],
+                name="rides_ride_od_cell_idx",
+            ),
+        ),
+        migrations.RunSQL(SYNC_OD_CELL_SQL, DROP_SYNC_OD_CELL_SQL),
+    ]
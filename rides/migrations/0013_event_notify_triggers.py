@@ -0,0 +1,80 @@
+# Generated by Django 4.2.3 on 2026-10-19 16:52
+
+from django.db import migrations
+
+
+# Ride and request state changes are published on the rides_events channel
+# (rides.events.CHANNEL). NOTIFY is transactional, so listeners only hear about
+# committed changes, whichever code path made them.
+NOTIFY_EVENTS_SQL = """
+CREATE OR REPLACE FUNCTION rides_ride_notify_event() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('rides_events', json_build_object(
+        'type', 'ride',
+        'id', NEW.id,
+        'status', NEW.status,
+        'rider', NEW.rider_id,
+        'users', json_build_array(NEW.driver_id, NEW.rider_id)
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER rides_ride_notify_insert
+    AFTER INSERT ON rides_ride
+    FOR EACH ROW EXECUTE FUNCTION rides_ride_notify_event();
+
+CREATE TRIGGER rides_ride_notify_update
+    AFTER UPDATE OF status, rider_id ON rides_ride
+    FOR EACH ROW
+    WHEN (
+        OLD.status IS DISTINCT FROM NEW.status
+        OR OLD.rider_id IS DISTINCT FROM NEW.rider_id
+    )
+    EXECUTE FUNCTION rides_ride_notify_event();
+
+CREATE OR REPLACE FUNCTION rides_riderequest_notify_event() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('rides_events', json_build_object(
+        'type', 'ride_request',
+        'id', NEW.id,
+        'ride', NEW.ride_id,
+        'status', NEW.status,
+        'users', json_build_array(
+            NEW.rider_id,
+            (SELECT driver_id FROM rides_ride WHERE id = NEW.ride_id)
+        )
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER rides_riderequest_notify_insert
+    AFTER INSERT ON rides_riderequest
+    FOR EACH ROW EXECUTE FUNCTION rides_riderequest_notify_event();
+
+CREATE TRIGGER rides_riderequest_notify_update
+    AFTER UPDATE OF status ON rides_riderequest
+    FOR EACH ROW
+    WHEN (OLD.status IS DISTINCT FROM NEW.status)
+    EXECUTE FUNCTION rides_riderequest_notify_event();
+"""
+
+DROP_NOTIFY_EVENTS_SQL = """
+DROP TRIGGER IF EXISTS rides_ride_notify_insert ON rides_ride;
+DROP TRIGGER IF EXISTS rides_ride_notify_update ON rides_ride;
+DROP FUNCTION IF EXISTS rides_ride_notify_event();
+DROP TRIGGER IF EXISTS rides_riderequest_notify_insert ON rides_riderequest;
+DROP TRIGGER IF EXISTS rides_riderequest_notify_update ON rides_riderequest;
+DROP FUNCTION IF EXISTS rides_riderequest_notify_event();
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("rides", "0012_standingmatch"),
+    ]
+
+    operations = [
+        migrations.RunSQL(NOTIFY_EVENTS_SQL, DROP_NOTIFY_EVENTS_SQL),
+    ]
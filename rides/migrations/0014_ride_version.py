@@ -0,0 +1,17 @@
+# Generated by Django 4.2.3 on 2026-10-19 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("rides", "0013_event_notify_triggers"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ride",
+            name="version",
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
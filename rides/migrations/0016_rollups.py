@@ -0,0 +1,133 @@
+# Generated by Django 4.2.3 on 2026-10-19 18:40
+
+from django.db import migrations, models
+
+# Rollup refreshes read the archived rows of each hour they recompute. Indexes
+# on the partitioned tables cascade to every partition.
+ARCHIVE_CREATED_INDEXES_SQL = """
+CREATE INDEX rides_archivedride_created_idx
+    ON rides_archivedride (created_at);
+CREATE INDEX rides_archivedriderequest_created_idx
+    ON rides_archivedriderequest (created_at);
+"""
+
+DROP_ARCHIVE_CREATED_INDEXES_SQL = """
+DROP INDEX rides_archivedride_created_idx;
+DROP INDEX rides_archivedriderequest_created_idx;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("rides", "0015_ridetracepoint"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="ride",
+            index=models.Index(fields=["updated_at"], name="rides_ride_updated_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="ride",
+            index=models.Index(fields=["created_at"], name="rides_ride_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="riderequest",
+            index=models.Index(
+                fields=["updated_at"], name="rides_riderequest_updated_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="riderequest",
+            index=models.Index(
+                fields=["created_at"], name="rides_riderequest_created_idx"
+            ),
+        ),
+        migrations.CreateModel(
+            name="RideRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("hour", models.DateTimeField()),
+                ("cell", models.CharField(max_length=12)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("PENDING", "Pending"),
+                            ("STARTED", "Started"),
+                            ("COMPLETED", "Completed"),
+                            ("CANCELLED", "Cancelled"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("rides", models.PositiveIntegerField()),
+                ("trip_distance_m", models.FloatField()),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("hour", "cell", "status"), name="rides_riderollup_key"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="RideRequestRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("hour", models.DateTimeField()),
+                ("cell", models.CharField(max_length=12)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("PENDING", "Pending"),
+                            ("ACCEPTED", "Accepted"),
+                            ("REJECTED", "Rejected"),
+                            ("EXPIRED", "Expired"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("requests", models.PositiveIntegerField()),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("hour", "cell", "status"),
+                        name="rides_riderequestrollup_key",
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="RollupWatermark",
+            fields=[
+                (
+                    "name",
+                    models.CharField(max_length=50, primary_key=True, serialize=False),
+                ),
+                ("watermark", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunSQL(
+            ARCHIVE_CREATED_INDEXES_SQL, DROP_ARCHIVE_CREATED_INDEXES_SQL
+        ),
+    ]
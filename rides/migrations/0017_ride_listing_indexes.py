@@ -0,0 +1,30 @@
+# Generated by Django 4.2.3 on 2026-10-19 19:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("rides", "0016_rollups"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="ride",
+            index=models.Index(
+                fields=["driver", "created_at"], name="rides_ride_driver_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="ride",
+            index=models.Index(
+                fields=["rider", "created_at"], name="rides_ride_rider_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="ride",
+            index=models.Index(
+                fields=["status", "created_at"], name="rides_ride_status_created_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.3 on 2026-10-19 21:10
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("rides", "0017_ride_listing_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="outboxmessage",
+            name="attempts",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="outboxmessage",
+            name="available_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name="outboxmessage",
+            name="failed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 4.2.3 on 2026-10-19 22:40
+
+from importlib import import_module
+
+from django.db import migrations
+
+# Events carry a global sequence number, the cursor of the event feed in every
+# process. The notify triggers become deferred constraint triggers, so they run
+# at commit, and take an advisory lock held until the commit ends before drawing
+# the number. The numbers then follow commit order, which is the order every
+# listener receives the notifications in.
+EVENT_SEQUENCE_SQL = """
+CREATE SEQUENCE rides_event_seq;
+
+CREATE OR REPLACE FUNCTION rides_ride_notify_event() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('rides_events'));
+    PERFORM pg_notify('rides_events', json_build_object(
+        'seq', nextval('rides_event_seq'),
+        'type', 'ride',
+        'id', NEW.id,
+        'status', NEW.status,
+        'rider', NEW.rider_id,
+        'users', json_build_array(NEW.driver_id, NEW.rider_id)
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rides_riderequest_notify_event() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('rides_events'));
+    PERFORM pg_notify('rides_events', json_build_object(
+        'seq', nextval('rides_event_seq'),
+        'type', 'ride_request',
+        'id', NEW.id,
+        'ride', NEW.ride_id,
+        'status', NEW.status,
+        'users', json_build_array(
+            NEW.rider_id,
+            (SELECT driver_id FROM rides_ride WHERE id = NEW.ride_id)
+        )
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER rides_ride_notify_insert ON rides_ride;
+DROP TRIGGER rides_ride_notify_update ON rides_ride;
+DROP TRIGGER rides_riderequest_notify_insert ON rides_riderequest;
+DROP TRIGGER rides_riderequest_notify_update ON rides_riderequest;
+
+CREATE CONSTRAINT TRIGGER rides_ride_notify_insert
+    AFTER INSERT ON rides_ride
+    DEFERRABLE INITIALLY DEFERRED
+    FOR EACH ROW EXECUTE FUNCTION rides_ride_notify_event();
+
+CREATE CONSTRAINT TRIGGER rides_ride_notify_update
+    AFTER UPDATE OF status, rider_id ON rides_ride
+    DEFERRABLE INITIALLY DEFERRED
+    FOR EACH ROW
+    WHEN (
+        OLD.status IS DISTINCT FROM NEW.status
+        OR OLD.rider_id IS DISTINCT FROM NEW.rider_id
+    )
+    EXECUTE FUNCTION rides_ride_notify_event();
+
+CREATE CONSTRAINT TRIGGER rides_riderequest_notify_insert
+    AFTER INSERT ON rides_riderequest
+    DEFERRABLE INITIALLY DEFERRED
+    FOR EACH ROW EXECUTE FUNCTION rides_riderequest_notify_event();
+
+CREATE CONSTRAINT TRIGGER rides_riderequest_notify_update
+    AFTER UPDATE OF status ON rides_riderequest
+    DEFERRABLE INITIALLY DEFERRED
+    FOR EACH ROW
+    WHEN (OLD.status IS DISTINCT FROM NEW.status)
+    EXECUTE FUNCTION rides_riderequest_notify_event();
+"""
+
+# Back to the immediate triggers of 0013.
+notify_triggers = import_module("rides.migrations.0013_event_notify_triggers")
+DROP_EVENT_SEQUENCE_SQL = (
+    notify_triggers.DROP_NOTIFY_EVENTS_SQL
+    + notify_triggers.NOTIFY_EVENTS_SQL
+    + "DROP SEQUENCE rides_event_seq;"
+)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("rides", "0018_outboxmessage_retries"),
+    ]
+
+    operations = [
+        migrations.RunSQL(EVENT_SEQUENCE_SQL, DROP_EVENT_SEQUENCE_SQL),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 4.2.3 on 2026-10-19 21:10
+
+from django.db import migrations, models
+
+
+# The driver's distance to the pickup when the ride gets its rider, frozen from
+# then on. Rides matched before this migration have no recorded distance, since
+# their current_location has moved since.
+PICKUP_DISTANCE_SQL = """
+CREATE OR REPLACE FUNCTION rides_ride_pickup_distance() RETURNS trigger AS $$
+BEGIN
+    IF NEW.rider_id IS NULL THEN
+        NEW.pickup_distance_m := NULL;
+    ELSIF TG_OP = 'INSERT' OR OLD.rider_id IS DISTINCT FROM NEW.rider_id THEN
+        NEW.pickup_distance_m := ST_Distance(
+            NEW.current_location, NEW.pickup_location
+        );
+    ELSE
+        NEW.pickup_distance_m := OLD.pickup_distance_m;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER rides_ride_pickup_distance
+    BEFORE INSERT OR UPDATE ON rides_ride
+    FOR EACH ROW EXECUTE FUNCTION rides_ride_pickup_distance();
+
+ALTER TABLE rides_archivedride ADD COLUMN pickup_distance_m double precision;
+
+-- The rollups summed trip distances, rebuild them on the next refresh.
+DELETE FROM rides_riderollup;
+DELETE FROM rides_riderequestrollup;
+UPDATE rides_rollupwatermark SET watermark = NULL;
+"""
+
+DROP_PICKUP_DISTANCE_SQL = """
+DROP TRIGGER IF EXISTS rides_ride_pickup_distance ON rides_ride;
+DROP FUNCTION IF EXISTS rides_ride_pickup_distance();
+ALTER TABLE rides_archivedride DROP COLUMN IF EXISTS pickup_distance_m;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("rides", "0019_event_sequence"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ride",
+            name="pickup_distance_m",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="archivedride",
+            name="pickup_distance_m",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RemoveField(
+            model_name="riderollup",
+            name="trip_distance_m",
+        ),
+        migrations.AddField(
+            model_name="riderollup",
+            name="matched_rides",
+            field=models.PositiveIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="riderollup",
+            name="pickup_distance_m",
+            field=models.FloatField(default=0),
+            preserve_default=False,
+        ),
+        migrations.RunSQL(PICKUP_DISTANCE_SQL, DROP_PICKUP_DISTANCE_SQL),
+    ]
@@ -1,6 +1,14 @@
+from django.conf import settings
 from django.contrib.gis.db import models
 from django.contrib.gis.geos import Point
 from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.utils import timezone
+
+
+class RideVersionConflict(Exception):
+    # The ride was written by someone else since it was read.
+    pass
 
 
 class Ride(models.Model):
@@ -32,11 +40,93 @@ class Ride(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Planar copies of the locations above in settings.RIDES_PROJECTED_SRID.
+    # They are kept in sync by a database trigger on every write, the geography
+    # columns remain the source of truth.
+    current_location_planar = models.PointField(
+        srid=settings.RIDES_PROJECTED_SRID, null=True, blank=True, editable=False
+    )
+    pickup_location_planar = models.PointField(
+        srid=settings.RIDES_PROJECTED_SRID, null=True, blank=True, editable=False
+    )
+    dropoff_location_planar = models.PointField(
+        srid=settings.RIDES_PROJECTED_SRID, null=True, blank=True, editable=False
+    )
+
+    # "<origin cell>:<destination cell>", the geohashes of current_location and
+    # dropoff_location at settings.RIDES_OD_CELL_PRECISION, while the ride has no
+    # rider. Maintained by a database trigger and used by rides.matching to find
+    # candidates for both ends with one index lookup.
+    od_cell = models.CharField(max_length=25, null=True, blank=True, editable=False)
+
+    # The driver's distance to the pickup when the ride got its rider, in metres.
+    # Set by a database trigger and kept from then on, for the rollups.
+    pickup_distance_m = models.FloatField(null=True, blank=True, editable=False)
+
+    # Bumped by every write. Saves only update the row while it still has the
+    # version the instance was read with, and raise RideVersionConflict
+    # otherwise. Set-based writes bump it with F("version") + 1.
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["od_cell"],
+                condition=models.Q(od_cell__isnull=False),
+                name="rides_ride_od_cell_idx",
+            ),
+            # For the rollup refresh in rides.rollups: rows changed since its
+            # watermark, and all rides of the hours it recomputes.
+            models.Index(fields=["updated_at"], name="rides_ride_updated_idx"),
+            models.Index(fields=["created_at"], name="rides_ride_created_idx"),
+            # Listing filters in rides.filters, each usable with a created_at
+            # range.
+            models.Index(
+                fields=["driver", "created_at"], name="rides_ride_driver_created_idx"
+            ),
+            models.Index(
+                fields=["rider", "created_at"], name="rides_ride_rider_created_idx"
+            ),
+            models.Index(
+                fields=["status", "created_at"], name="rides_ride_status_created_idx"
+            ),
+        ]
+
     def __str__(self):
         return f"Ride from {self.pickup_location} to {self.dropoff_location}"
 
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        version_field = self._meta.get_field("version")
+        values = [value for value in values if value[0] is not version_field]
+        values.append((version_field, None, F("version") + 1))
+        updated = super()._do_update(
+            base_qs.filter(version=self.version),
+            using,
+            pk_val,
+            values,
+            update_fields,
+            forced_update,
+        )
+        if updated:
+            self.version += 1
+        elif base_qs.filter(pk=pk_val).exists():
+            raise RideVersionConflict(
+                f"Ride {pk_val} changed since version {self.version}"
+            )
+        return updated
+
 
 class RideRequest(models.Model):
+    # Requests start PENDING and are ACCEPTED or REJECTED when their ride gets a
+    # rider, or EXPIRED by rides.ride_requests when left pending for too long.
+
+    STATUS_CHOICES = [
+        ("PENDING", "Pending"),
+        ("ACCEPTED", "Accepted"),
+        ("REJECTED", "Rejected"),
+        ("EXPIRED", "Expired"),
+    ]
+
     ride = models.ForeignKey(
         Ride, on_delete=models.CASCADE, related_name="ride_requests"
     )
@@ -48,8 +138,212 @@ class RideRequest(models.Model):
         default=None,
     )
     is_accepted = models.BooleanField(default=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="PENDING")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Pending requests by age, for the expiry sweeper.
+            models.Index(
+                fields=["created_at"],
+                condition=models.Q(status="PENDING"),
+                name="rides_riderequest_pending_idx",
+            ),
+            models.Index(fields=["updated_at"], name="rides_riderequest_updated_idx"),
+            models.Index(fields=["created_at"], name="rides_riderequest_created_idx"),
+        ]
+
     def __str__(self):
         return f"Ride requested on {self.ride.pk} by {self.rider.username}"
+
+
+class ArchivedRide(models.Model):
+    # Finished rides moved out of the Ride table by rides.archive.
+    # The table is partitioned by month of created_at and is created with raw SQL
+    # in the migrations, so Django does not manage it.
+
+    id = models.BigIntegerField(primary_key=True)
+    rider = models.ForeignKey(
+        get_user_model(),
+        on_delete=models.DO_NOTHING,
+        related_name="+",
+        null=True,
+        blank=True,
+    )
+    driver = models.ForeignKey(
+        get_user_model(), on_delete=models.DO_NOTHING, related_name="+"
+    )
+    current_location = models.PointField(geography=True)
+    pickup_location = models.PointField(geography=True)
+    dropoff_location = models.PointField(geography=True)
+    status = models.CharField(max_length=20, choices=Ride.STATUS_CHOICES)
+    pickup_distance_m = models.FloatField(null=True, blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = "rides_archivedride"
+
+    def __str__(self):
+        return f"Archived ride from {self.pickup_location} to {self.dropoff_location}"
+
+
+class ArchivedRideRequest(models.Model):
+    # Requests of archived rides, partitioned the same way as ArchivedRide.
+
+    id = models.BigIntegerField(primary_key=True)
+    ride = models.ForeignKey(
+        ArchivedRide, on_delete=models.DO_NOTHING, related_name="ride_requests"
+    )
+    rider = models.ForeignKey(
+        get_user_model(),
+        on_delete=models.DO_NOTHING,
+        related_name="+",
+        null=True,
+        blank=True,
+    )
+    is_accepted = models.BooleanField(default=False)
+    status = models.CharField(
+        max_length=20, choices=RideRequest.STATUS_CHOICES, default="PENDING"
+    )
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = "rides_archivedriderequest"
+
+    def __str__(self):
+        return f"Archived ride request on {self.ride_id}"
+
+
+class OutboxMessage(models.Model):
+    # Side effects of a write, such as starting or stopping ride tracking, saved
+    # in the same transaction as the write and published by rides.outbox.
+
+    topic = models.CharField(max_length=100)
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Failed messages are retried from available_at, and dead-lettered, with
+    # failed_at set, after RIDES_OUTBOX_MAX_ATTEMPTS attempts.
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    failed_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.topic} {self.payload}"
+
+
+class StandingMatch(models.Model):
+    # A rider waiting for a ride from pickup_location to destination_location.
+    # New and moving rides are tested against the waiting matches near them by
+    # rides.standing, and the rider is notified once one is within radius of
+    # both ends.
+
+    rider = models.ForeignKey(
+        get_user_model(), on_delete=models.CASCADE, related_name="standing_matches"
+    )
+    pickup_location = models.PointField(geography=True)
+    destination_location = models.PointField(geography=True)
+    radius = models.FloatField()
+    expires_at = models.DateTimeField()
+    # Rides are archived with raw SQL, so the matched ride may be gone without
+    # this being cleared. There is no constraint to stop that.
+    matched_ride = models.ForeignKey(
+        Ride,
+        on_delete=models.SET_NULL,
+        related_name="+",
+        null=True,
+        blank=True,
+        db_constraint=False,
+    )
+    matched_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Standing match of {self.rider.username} to {self.destination_location}"
+
+
+class RideTracePoint(models.Model):
+    # A persisted location of a ride, snapped onto the road network by
+    # rides.traces. location is None for points too far from any road.
+    # Trace points outlive the archival of their ride, which deletes rides with
+    # raw SQL, so there is no constraint on ride.
+
+    ride = models.ForeignKey(
+        Ride,
+        on_delete=models.CASCADE,
+        related_name="trace_points",
+        db_constraint=False,
+        db_index=False,
+    )
+    recorded_at = models.DateTimeField()
+    raw_location = models.PointField(geography=True)
+    location = models.PointField(geography=True, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["ride", "recorded_at"], name="rides_ridetracepoint_ride_idx"
+            ),
+        ]
+
+
+class RideRollup(models.Model):
+    # Rides created in an hour with their pickup in a geohash cell of
+    # settings.RIDES_ROLLUP_CELL_PRECISION, by status, over the hot and archive
+    # tables. Recomputed by rides.rollups, reports read these instead of rides.
+
+    hour = models.DateTimeField()
+    cell = models.CharField(max_length=12)
+    status = models.CharField(max_length=20, choices=Ride.STATUS_CHOICES)
+    rides = models.PositiveIntegerField()
+    # Rides with a rider, and the sum of their pickup distances, so averages add
+    # up across rows.
+    matched_rides = models.PositiveIntegerField()
+    pickup_distance_m = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["hour", "cell", "status"], name="rides_riderollup_key"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.rides} {self.status} rides in {self.cell} at {self.hour}"
+
+
+class RideRequestRollup(models.Model):
+    # Ride requests created in an hour, by the pickup cell of their ride and
+    # their status. Maintained along with RideRollup.
+
+    hour = models.DateTimeField()
+    cell = models.CharField(max_length=12)
+    status = models.CharField(max_length=20, choices=RideRequest.STATUS_CHOICES)
+    requests = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["hour", "cell", "status"], name="rides_riderequestrollup_key"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.requests} {self.status} requests in {self.cell} at {self.hour}"
+
+
+class RollupWatermark(models.Model):
+    # Start time of the last completed rollup refresh, None until the first one.
+    # Refreshes lock the row, so only one recomputes rollups at a time.
+
+    name = models.CharField(max_length=50, primary_key=True)
+    watermark = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} at {self.watermark}"
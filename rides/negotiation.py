@@ -0,0 +1,14 @@
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.negotiation import DefaultContentNegotiation
+
+
+class FallbackContentNegotiation(DefaultContentNegotiation):
+    # For views returning a fixed binary format, such as vector tiles. Clients
+    # ask for those with all kinds of Accept headers, so instead of a 406 the
+    # first renderer is used, which only ever renders error responses.
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        try:
+            return super().select_renderer(request, renderers, format_suffix)
+        except NotAcceptable:
+            return (renderers[0], renderers[0].media_type)
@@ -0,0 +1,192 @@
+import logging
+from datetime import timedelta
+from itertools import groupby
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import standing, tracking
+from .models import OutboxMessage, Ride
+from .tasks import match_standing_matches, refresh_rollup_hours, update_ride_location
+
+# Transactional outbox. Writes record their side effects as OutboxMessage rows
+# in their own transaction, so nothing is published for writes that roll back,
+# and nothing before the data it refers to is committed. The relay_outbox
+# command publishes the rows in batches and deletes them, in one transaction
+# per batch. Delivery is at least once, so handlers must be idempotent.
+#
+# Handlers either handle all of their messages or none, or raise PartialFailure
+# naming the ones that failed. When none were handled, the messages are retried
+# one at a time, so only the messages that fail are held back. Those are retried
+# after RIDES_OUTBOX_RETRY_DELAY seconds, doubling with every attempt, while the
+# relay carries on with the rest, and are dead-lettered (failed_at set, kept for
+# inspection) after RIDES_OUTBOX_MAX_ATTEMPTS attempts. A retried message runs
+# after the messages that followed it, so a retried tracking start checks that
+# its ride is still in progress.
+
+logger = logging.getLogger(__name__)
+
+TRACKING_START = "tracking.start"
+TRACKING_STOP = "tracking.stop"
+# Rides without a rider that were created or moved, sent with ride_ids.
+RIDES_MATCHABLE = "rides.matchable"
+# Hours whose rollups lost a deleted ride or request, sent with hour.
+ROLLUPS_STALE = "rollups.stale"
+
+
+def enqueue(topic, payload):
+    return OutboxMessage.objects.create(topic=topic, payload=payload)
+
+
+def enqueue_many(topic, payloads):
+    return OutboxMessage.objects.bulk_create(
+        [OutboxMessage(topic=topic, payload=payload) for payload in payloads]
+    )
+
+
+class PartialFailure(Exception):
+    # Raised by handlers that got through some of their payloads, with the
+    # indexes of the ones that failed. Any other exception means none were
+    # handled.
+
+    def __init__(self, failed):
+        super().__init__(f"{len(failed)} payloads failed")
+        self.failed = failed
+
+
+def start_tracking(payloads):
+    # A start relayed again is a no-op: each chain is started once, and only
+    # for rides still in progress, as the start may be retried after the stop.
+    ride_ids = [payload["ride_id"] for payload in payloads]
+    in_progress = set(
+        Ride.objects.filter(pk__in=ride_ids)
+        .exclude(status__in=tracking.UNTRACKED_STATUSES)
+        .values_list("pk", flat=True)
+    )
+    failed = []
+    # One broker connection for the whole batch.
+    with update_ride_location.app.producer_or_acquire() as producer:
+        for index, payload in enumerate(payloads):
+            ride_id, tracking_id = payload["ride_id"], payload["tracking_id"]
+            if ride_id not in in_progress:
+                continue
+            try:
+                if not tracking.claim_start(tracking_id):
+                    continue
+                try:
+                    tracking.register(ride_id, tracking_id)
+                    update_ride_location.apply_async(
+                        args=[ride_id, tracking_id], countdown=3, producer=producer
+                    )
+                except Exception:
+                    tracking.release_start(tracking_id)
+                    raise
+            except Exception:
+                logger.exception("Could not start tracking ride %s", ride_id)
+                failed.append(index)
+    if failed:
+        raise PartialFailure(failed)
+
+
+def stop_tracking(payloads):
+    tracking.unregister([payload["ride_id"] for payload in payloads])
+
+
+def match_rides(payloads):
+    # One matching task for the whole batch.
+    ride_ids = sorted({pk for payload in payloads for pk in payload["ride_ids"]})
+    match_standing_matches.delay(ride_ids)
+    standing.rides_published(ride_ids)
+
+
+def refresh_rollups(payloads):
+    refresh_rollup_hours.delay(sorted({payload["hour"] for payload in payloads}))
+
+
+HANDLERS = {
+    TRACKING_START: start_tracking,
+    TRACKING_STOP: stop_tracking,
+    RIDES_MATCHABLE: match_rides,
+    ROLLUPS_STALE: refresh_rollups,
+}
+
+
+def handle(topic, messages):
+    # Returns the messages that failed.
+    handler = HANDLERS.get(topic)
+    if handler is None:
+        logger.warning(
+            "Dropping %d outbox messages of unknown topic %s", len(messages), topic
+        )
+        return []
+
+    try:
+        with transaction.atomic():
+            handler([message.payload for message in messages])
+        return []
+    except PartialFailure as exc:
+        return [messages[index] for index in exc.failed]
+    except Exception:
+        if len(messages) == 1:
+            logger.exception(
+                "Outbox message %s of topic %s failed", messages[0].pk, topic
+            )
+            return messages
+
+    # None of them were handled, so each is tried on its own to find the ones
+    # that fail.
+    failed = []
+    for message in messages:
+        failed += handle(topic, [message])
+    return failed
+
+
+def retry_later(messages):
+    now = timezone.now()
+    for message in messages:
+        message.attempts += 1
+        if message.attempts >= settings.RIDES_OUTBOX_MAX_ATTEMPTS:
+            logger.error(
+                "Dead-lettering outbox message %s of topic %s after %d attempts",
+                message.pk,
+                message.topic,
+                message.attempts,
+            )
+            message.failed_at = now
+        else:
+            delay = settings.RIDES_OUTBOX_RETRY_DELAY * 2 ** (message.attempts - 1)
+            message.available_at = now + timedelta(seconds=delay)
+    OutboxMessage.objects.bulk_update(
+        messages, ["attempts", "available_at", "failed_at"]
+    )
+
+
+def relay_batch(batch_size=None):
+    if batch_size is None:
+        batch_size = settings.RIDES_OUTBOX_BATCH_SIZE
+
+    with transaction.atomic():
+        # Other relays skip the locked rows and take the next batch.
+        messages = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(failed_at__isnull=True, available_at__lte=timezone.now())
+            .order_by("pk")[:batch_size]
+        )
+        if not messages:
+            return 0
+
+        # Runs of the same topic are handled together, in order, so a stop
+        # never overtakes the start it follows.
+        failed = []
+        for topic, group in groupby(messages, key=attrgetter("topic")):
+            failed += handle(topic, list(group))
+
+        if failed:
+            retry_later(failed)
+        failed_ids = {message.pk for message in failed}
+        OutboxMessage.objects.filter(
+            pk__in=[message.pk for message in messages if message.pk not in failed_ids]
+        ).delete()
+        return len(messages)
@@ -0,0 +1,42 @@
+import msgpack
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+def expand_points(data):
+    # [longitude, latitude] pairs sent for *_location fields become GeoJSON
+    # points, which the geometry serializer fields accept.
+    if isinstance(data, dict):
+        return {
+            key: (
+                {"type": "Point", "coordinates": list(value)}
+                if key.endswith("_location") and is_coordinate_pair(value)
+                else expand_points(value)
+            )
+            for key, value in data.items()
+        }
+    if isinstance(data, list):
+        return [expand_points(value) for value in data]
+    return data
+
+
+def is_coordinate_pair(value):
+    return (
+        isinstance(value, (list, tuple))
+        and len(value) == 2
+        and all(
+            isinstance(coordinate, (int, float)) and not isinstance(coordinate, bool)
+            for coordinate in value
+        )
+    )
+
+
+class MessagePackParser(BaseParser):
+    media_type = "application/x-msgpack"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            data = msgpack.unpackb(stream.read(), raw=False)
+        except ValueError as exc:
+            raise ParseError(f"MessagePack parse error - {exc}")
+        return expand_points(data)
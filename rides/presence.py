@@ -0,0 +1,55 @@
+import redis
+from django.conf import settings
+
+from .connections import get_redis
+
+# Driver presence. Drivers heartbeat every few seconds and each heartbeat
+# refreshes a Redis key that expires after RIDES_PRESENCE_TTL seconds, so
+# liveness never touches the database and drivers who went quiet drop out of
+# nearby and standing match dispatch within the TTL. Ride creation and location
+# updates count as heartbeats. Heartbeats come in through the web workers and
+# are read by the Celery standing match job too, so presence lives in the shared
+# Redis, not the Django cache, which may be per process. While Redis is down
+# every driver counts as present.
+#
+# Clients without heartbeats would hide every ride, so the filter only applies
+# once RIDES_REQUIRE_DRIVER_PRESENCE is enabled.
+
+
+def presence_key(user_id):
+    return f"rides:presence:{user_id}"
+
+
+def heartbeat(user_id):
+    try:
+        get_redis().set(presence_key(user_id), 1, ex=settings.RIDES_PRESENCE_TTL)
+    except redis.RedisError:
+        pass
+
+
+def online_drivers(driver_ids):
+    # One round trip for the whole batch.
+    driver_ids = sorted(set(driver_ids))
+    if not driver_ids:
+        return set()
+    try:
+        present = get_redis().mget([presence_key(pk) for pk in driver_ids])
+    except redis.RedisError:
+        return set(driver_ids)
+    return {pk for pk, value in zip(driver_ids, present) if value is not None}
+
+
+def online_rides(rides):
+    # Drops the rides of drivers who stopped heartbeating, keeping the order.
+    rides = list(rides)
+    if not settings.RIDES_REQUIRE_DRIVER_PRESENCE:
+        return rides
+    online = online_drivers(ride.driver_id for ride in rides)
+    return [ride for ride in rides if ride.driver_id in online]
+
+
+def clear():
+    client = get_redis()
+    keys = list(client.scan_iter(match="rides:presence:*"))
+    if keys:
+        client.delete(*keys)
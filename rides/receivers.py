@@ -0,0 +1,150 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import (
+    conditional,
+    detail_cache,
+    heatmap,
+    location,
+    outbox,
+    rollups,
+    standing,
+    tiles,
+    traces,
+)
+from .models import Ride, RideRequest
+from .signals import ride_requests_updated, rides_updated
+
+
+@receiver(post_save, sender=Ride)
+@receiver(post_save, sender=RideRequest)
+@receiver(post_delete, sender=Ride)
+@receiver(post_delete, sender=RideRequest)
+def forget_freshness(sender, instance, **kwargs):
+    conditional.forget_updated_at(sender, [instance.pk])
+
+
+@receiver(rides_updated, sender=Ride)
+def forget_rides_freshness(sender, ride_ids, **kwargs):
+    conditional.forget_updated_at(Ride, ride_ids)
+
+
+@receiver(post_save, sender=Ride)
+def update_ride_heatmap(sender, instance, **kwargs):
+    heatmap.ride_saved(instance)
+
+
+@receiver(post_delete, sender=Ride)
+def remove_ride_from_heatmap(sender, instance, **kwargs):
+    heatmap.rides_deleted([instance.pk])
+
+
+@receiver(post_save, sender=RideRequest)
+def update_ride_request_heatmap(sender, instance, **kwargs):
+    heatmap.ride_request_saved(instance)
+
+
+@receiver(post_delete, sender=RideRequest)
+def remove_ride_request_from_heatmap(sender, instance, **kwargs):
+    heatmap.ride_requests_deleted([instance.pk])
+
+
+@receiver(rides_updated, sender=Ride)
+def update_rides_heatmap(sender, ride_ids, changes=None, **kwargs):
+    if changes is not None and set(changes) == {"current_location"}:
+        for ride_id in ride_ids:
+            heatmap.ride_moved(ride_id, changes["current_location"])
+    else:
+        heatmap.rides_changed(ride_ids)
+
+
+@receiver(post_save, sender=Ride)
+def remember_location(sender, instance, created, update_fields=None, **kwargs):
+    # Full saves write back whatever location the instance was loaded with, so
+    # they only drop the remembered one.
+    if created or (update_fields is not None and "current_location" in update_fields):
+        location.remember_location(instance.pk, instance.current_location)
+    elif update_fields is None:
+        location.forget_location(instance.pk)
+
+
+@receiver(post_delete, sender=Ride)
+def stop_tracking(sender, instance, **kwargs):
+    outbox.enqueue(outbox.TRACKING_STOP, {"ride_id": instance.pk})
+
+
+@receiver(post_save, sender=Ride)
+def invalidate_ride_tiles(sender, instance, **kwargs):
+    tiles.ride_saved(instance)
+
+
+@receiver(post_delete, sender=Ride)
+def invalidate_deleted_ride_tiles(sender, instance, **kwargs):
+    tiles.rides_deleted([instance.pk])
+
+
+@receiver(rides_updated, sender=Ride)
+def invalidate_updated_rides_tiles(sender, ride_ids, changes=None, **kwargs):
+    if changes is not None and set(changes) == {"current_location"}:
+        for ride_id in ride_ids:
+            tiles.ride_moved(ride_id, changes["current_location"])
+    else:
+        tiles.rides_changed(ride_ids)
+
+
+@receiver(post_save, sender=Ride)
+@receiver(post_delete, sender=Ride)
+def invalidate_ride_detail(sender, instance, **kwargs):
+    detail_cache.invalidate([instance.pk])
+
+
+@receiver(post_save, sender=RideRequest)
+@receiver(post_delete, sender=RideRequest)
+def invalidate_ride_request_ride_detail(sender, instance, **kwargs):
+    detail_cache.invalidate([instance.ride_id])
+
+
+@receiver(rides_updated, sender=Ride)
+def invalidate_rides_detail(sender, ride_ids, **kwargs):
+    detail_cache.invalidate(ride_ids)
+
+
+@receiver(ride_requests_updated, sender=RideRequest)
+def ride_requests_changed(sender, ride_request_ids, ride_ids, **kwargs):
+    conditional.forget_updated_at(RideRequest, ride_request_ids)
+    heatmap.ride_requests_changed(ride_request_ids)
+    detail_cache.invalidate(ride_ids)
+
+
+@receiver(post_save, sender=Ride)
+def match_saved_ride(sender, instance, created, update_fields=None, **kwargs):
+    if not standing.is_matchable(instance):
+        standing.rides_closed([instance.pk])
+        return
+    if created or update_fields is None or "current_location" in update_fields:
+        outbox.enqueue(outbox.RIDES_MATCHABLE, {"ride_ids": [instance.pk]})
+
+
+@receiver(rides_updated, sender=Ride)
+def match_moved_rides(sender, ride_ids, changes=None, **kwargs):
+    if changes is not None and set(changes) == {"current_location"}:
+        ride_ids = standing.moved_rides_to_queue(ride_ids)
+        if ride_ids:
+            outbox.enqueue(outbox.RIDES_MATCHABLE, {"ride_ids": ride_ids})
+    else:
+        standing.rides_changed(ride_ids)
+
+
+@receiver(rides_updated, sender=Ride)
+def buffer_trace_pings(sender, ride_ids, changes=None, **kwargs):
+    if changes is not None and set(changes) == {"current_location"}:
+        for ride_id in ride_ids:
+            traces.buffer_ping(ride_id, changes["current_location"])
+
+
+@receiver(post_delete, sender=Ride)
+@receiver(post_delete, sender=RideRequest)
+def mark_rollups_stale(sender, instance, **kwargs):
+    outbox.enqueue(
+        outbox.ROLLUPS_STALE, {"hour": rollups.hour_of(instance.created_at).isoformat()}
+    )
@@ -0,0 +1,39 @@
+import datetime
+import decimal
+import uuid
+
+import msgpack
+from rest_framework.renderers import BaseRenderer
+
+
+def compact_points(data):
+    # GeoJSON points become bare [longitude, latitude] pairs.
+    if isinstance(data, dict):
+        if data.get("type") == "Point" and "coordinates" in data:
+            return list(data["coordinates"])
+        return {key: compact_points(value) for key, value in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [compact_points(value) for value in data]
+    return data
+
+
+def encode_default(value):
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = "application/x-msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(
+            compact_points(data), default=encode_default, use_bin_type=True
+        )
@@ -0,0 +1,102 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Ride, RideRequest
+from .signals import ride_requests_updated, rides_updated
+
+# Assigns the rider of the accepted request to its ride, accepts that request
+# and rejects its pending siblings in one statement. The ride is only updated
+# while it has no rider and the request is still pending, so concurrent accepts
+# of the same ride can't both win.
+ACCEPT_SQL = f"""
+WITH assigned AS (
+    UPDATE {Ride._meta.db_table} SET
+        rider_id = request.rider_id,
+        updated_at = now(),
+        version = {Ride._meta.db_table}.version + 1
+    FROM {RideRequest._meta.db_table} AS request
+    WHERE request.id = %(request_id)s
+        AND request.status = 'PENDING'
+        AND {Ride._meta.db_table}.id = request.ride_id
+        AND {Ride._meta.db_table}.rider_id IS NULL
+    RETURNING {Ride._meta.db_table}.id
+)
+UPDATE {RideRequest._meta.db_table} SET
+    status = CASE WHEN id = %(request_id)s THEN 'ACCEPTED' ELSE 'REJECTED' END,
+    is_accepted = (id = %(request_id)s),
+    updated_at = now()
+WHERE ride_id IN (SELECT id FROM assigned)
+    AND (id = %(request_id)s OR status = 'PENDING')
+RETURNING id, ride_id
+"""
+
+# One chunk of stale pending requests, oldest first, served by the partial
+# index on pending requests. Rows locked by other sessions are left for the
+# next run.
+EXPIRE_SQL = f"""
+UPDATE {RideRequest._meta.db_table} SET status = 'EXPIRED', updated_at = now()
+WHERE id IN (
+    SELECT id FROM {RideRequest._meta.db_table}
+    WHERE status = 'PENDING' AND created_at < %s
+    ORDER BY created_at
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING id, ride_id
+"""
+
+
+def accept_ride_request(ride_request_id):
+    # Returns False if the ride already has a rider or the request is no longer
+    # pending.
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(ACCEPT_SQL, {"request_id": ride_request_id})
+            rows = cursor.fetchall()
+        if not rows:
+            return False
+
+        ride_ids = sorted({ride_id for _, ride_id in rows})
+        rides_updated.send(sender=Ride, ride_ids=ride_ids)
+        ride_requests_updated.send(
+            sender=RideRequest,
+            ride_request_ids=[pk for pk, _ in rows],
+            ride_ids=ride_ids,
+        )
+        return True
+
+
+def expire_batch(cutoff, batch_size):
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(EXPIRE_SQL, [cutoff, batch_size])
+            rows = cursor.fetchall()
+        if rows:
+            ride_requests_updated.send(
+                sender=RideRequest,
+                ride_request_ids=[pk for pk, _ in rows],
+                ride_ids=sorted({ride_id for _, ride_id in rows}),
+                changes={"status": "EXPIRED"},
+            )
+        return len(rows)
+
+
+def expire_stale_ride_requests(older_than=None, batch_size=None, max_batches=None):
+    if older_than is None:
+        older_than = timedelta(minutes=settings.RIDE_REQUEST_TTL_MINUTES)
+    if batch_size is None:
+        batch_size = settings.RIDE_REQUEST_EXPIRY_BATCH_SIZE
+
+    cutoff = timezone.now() - older_than
+    expired = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        moved = expire_batch(cutoff, batch_size)
+        if not moved:
+            break
+        expired += moved
+        batches += 1
+    return expired
@@ -0,0 +1,210 @@
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from .models import RideRequestRollup, RideRollup, RollupWatermark
+
+# Trip analytics rollups. RideRollup and RideRequestRollup count the rides and
+# requests created per (hour, pickup cell, status) over the hot and archive
+# tables together, so reports read a few rows per hour instead of scanning rides.
+# The average pickup distance comes from Ride.pickup_distance_m, recorded when a
+# ride gets its rider, so rides never matched don't count towards it.
+#
+# The refresh_rollups Celery job recomputes every hour with rows changed since
+# its watermark. created_at never changes, so recomputing the whole hour picks up
+# status changes, moved pickups and archiving alike, and is idempotent. The scan
+# starts RIDES_ROLLUP_OVERLAP_SECONDS before the watermark to catch transactions
+# that committed late. Hard deletes leave nothing to scan, so they send their
+# hour through the outbox instead (ROLLUPS_STALE).
+
+WATERMARK_NAME = "rollups"
+
+CHANGED_HOURS_SQL = """
+SELECT date_trunc('hour', created_at) FROM rides_ride
+WHERE updated_at > %(since)s
+UNION
+SELECT date_trunc('hour', created_at) FROM rides_riderequest
+WHERE updated_at > %(since)s
+UNION
+-- Requests take the cell of their ride, which may have moved.
+SELECT date_trunc('hour', request.created_at)
+FROM rides_riderequest request JOIN rides_ride ride ON ride.id = request.ride_id
+WHERE ride.updated_at > %(since)s
+"""
+
+ALL_HOURS_SQL = """
+SELECT date_trunc('hour', created_at) FROM rides_ride
+UNION
+SELECT date_trunc('hour', created_at) FROM rides_archivedride
+UNION
+SELECT date_trunc('hour', created_at) FROM rides_riderequest
+UNION
+SELECT date_trunc('hour', created_at) FROM rides_archivedriderequest
+"""
+
+RIDE_ROLLUP_SQL = """
+INSERT INTO rides_riderollup
+    (hour, cell, status, rides, matched_rides, pickup_distance_m)
+SELECT
+    hours.hour,
+    ST_GeoHash(ride.pickup_location::geometry, %(precision)s),
+    ride.status,
+    count(*),
+    count(ride.pickup_distance_m),
+    coalesce(sum(ride.pickup_distance_m), 0)
+FROM unnest(%(hours)s::timestamptz[]) AS hours(hour)
+CROSS JOIN LATERAL (
+    SELECT pickup_location, status, pickup_distance_m FROM rides_ride
+    WHERE created_at >= hours.hour AND created_at < hours.hour + interval '1 hour'
+    UNION ALL
+    SELECT pickup_location, status, pickup_distance_m FROM rides_archivedride
+    WHERE created_at >= hours.hour AND created_at < hours.hour + interval '1 hour'
+) AS ride
+GROUP BY 1, 2, 3
+"""
+
+REQUEST_ROLLUP_SQL = """
+INSERT INTO rides_riderequestrollup (hour, cell, status, requests)
+SELECT
+    hours.hour,
+    ST_GeoHash(requested.pickup_location::geometry, %(precision)s),
+    requested.status,
+    count(*)
+FROM unnest(%(hours)s::timestamptz[]) AS hours(hour)
+CROSS JOIN LATERAL (
+    SELECT ride.pickup_location, request.status
+    FROM rides_riderequest request JOIN rides_ride ride ON ride.id = request.ride_id
+    WHERE request.created_at >= hours.hour
+        AND request.created_at < hours.hour + interval '1 hour'
+    UNION ALL
+    SELECT ride.pickup_location, request.status
+    FROM rides_archivedriderequest request
+    JOIN rides_archivedride ride ON ride.id = request.ride_id
+    WHERE request.created_at >= hours.hour
+        AND request.created_at < hours.hour + interval '1 hour'
+) AS requested
+GROUP BY 1, 2, 3
+"""
+
+
+def hour_of(value):
+    return value.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def lock_watermark():
+    watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(
+        name=WATERMARK_NAME
+    )
+    return watermark
+
+
+def refresh_hours(hours, batch_size=None):
+    # Recomputes the rollups of hours, batch_size hours per transaction.
+    if batch_size is None:
+        batch_size = settings.RIDES_ROLLUP_BATCH_HOURS
+
+    hours = sorted({hour_of(hour) for hour in hours})
+    for start in range(0, len(hours), batch_size):
+        batch = hours[start : start + batch_size]
+        params = {"hours": batch, "precision": settings.RIDES_ROLLUP_CELL_PRECISION}
+        with transaction.atomic():
+            lock_watermark()
+            RideRollup.objects.filter(hour__in=batch).delete()
+            RideRequestRollup.objects.filter(hour__in=batch).delete()
+            with connection.cursor() as cursor:
+                cursor.execute(RIDE_ROLLUP_SQL, params)
+                cursor.execute(REQUEST_ROLLUP_SQL, params)
+    return len(hours)
+
+
+def refresh_rollups(rebuild=False):
+    # Returns the number of hours recomputed. The first run, and rebuilds,
+    # recompute every hour.
+    started_at = timezone.now()
+    with transaction.atomic():
+        watermark = lock_watermark().watermark
+    with connection.cursor() as cursor:
+        if watermark is None or rebuild:
+            cursor.execute(ALL_HOURS_SQL)
+        else:
+            since = watermark - timedelta(seconds=settings.RIDES_ROLLUP_OVERLAP_SECONDS)
+            cursor.execute(CHANGED_HOURS_SQL, {"since": since})
+        hours = [row[0] for row in cursor.fetchall()]
+
+    if rebuild:
+        # Also drops the hours left without any rows.
+        with transaction.atomic():
+            lock_watermark()
+            RideRollup.objects.all().delete()
+            RideRequestRollup.objects.all().delete()
+    refreshed = refresh_hours(hours)
+    RollupWatermark.objects.filter(name=WATERMARK_NAME).update(watermark=started_at)
+    return refreshed
+
+
+def report(since, until, interval="hour", cell=None):
+    # Rows per (period, cell) between since and until, from the rollups only.
+    # cell limits them to the cells starting with that geohash prefix.
+    trunc = {"hour": TruncHour, "day": TruncDay}[interval]
+    rides = RideRollup.objects.filter(hour__gte=since, hour__lt=until)
+    requests = RideRequestRollup.objects.filter(hour__gte=since, hour__lt=until)
+    if cell:
+        rides = rides.filter(cell__startswith=cell)
+        requests = requests.filter(cell__startswith=cell)
+
+    rows = {}
+
+    def row(period, row_cell):
+        if (period, row_cell) not in rows:
+            rows[(period, row_cell)] = {
+                "period": period,
+                "cell": row_cell,
+                "rides": {},
+                "matched_rides": 0,
+                "pickup_distance_m": 0.0,
+                "requests": {},
+            }
+        return rows[(period, row_cell)]
+
+    for group in (
+        rides.annotate(period=trunc("hour", tzinfo=dt_timezone.utc))
+        .values("period", "cell", "status")
+        .annotate(
+            count=Sum("rides"),
+            matched=Sum("matched_rides"),
+            distance=Sum("pickup_distance_m"),
+        )
+    ):
+        current = row(group["period"], group["cell"])
+        current["rides"][group["status"]] = group["count"]
+        current["matched_rides"] += group["matched"]
+        current["pickup_distance_m"] += group["distance"]
+
+    for group in (
+        requests.annotate(period=trunc("hour", tzinfo=dt_timezone.utc))
+        .values("period", "cell", "status")
+        .annotate(count=Sum("requests"))
+    ):
+        row(group["period"], group["cell"])["requests"][group["status"]] = group[
+            "count"
+        ]
+
+    results = []
+    for key in sorted(rows):
+        current = rows.pop(key)
+        total = sum(current["rides"].values())
+        matched = current.pop("matched_rides")
+        distance = current.pop("pickup_distance_m")
+        current["completion_rate"] = (
+            current["rides"].get("COMPLETED", 0) / total if total else None
+        )
+        current["cancellation_rate"] = (
+            current["rides"].get("CANCELLED", 0) / total if total else None
+        )
+        current["average_pickup_m"] = round(distance / matched) if matched else None
+        results.append(current)
+    return results
@@ -0,0 +1,56 @@
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .graph import RoadGraph
+from .mapmatch import MapMatcher
+from .router import Router
+
+# Offline driving ETAs and map matching. python manage.py build_road_graph turns
+# a local OSM extract into a contracted road graph file, and each process loads
+# the file named by RIDES_ROAD_GRAPH_PATH on first use. Without it there are no
+# ETAs and traces aren't matched.
+
+
+@lru_cache(maxsize=None)
+def get_graph():
+    if not settings.RIDES_ROAD_GRAPH_PATH:
+        return None
+    return RoadGraph.load(settings.RIDES_ROAD_GRAPH_PATH)
+
+
+@lru_cache(maxsize=None)
+def get_router():
+    graph = get_graph()
+    if graph is None:
+        return None
+    return Router(graph, settings.RIDES_ROAD_SNAP_MAX_M)
+
+
+@lru_cache(maxsize=None)
+def get_map_matcher():
+    graph = get_graph()
+    if graph is None:
+        return None
+    return MapMatcher(graph, settings.RIDES_MAP_MATCH_RADIUS_M)
+
+
+def eta_seconds(sources, target):
+    # Driving seconds from each Point in sources to the target Point, None where
+    # unknown. Returns None altogether when no road graph is configured.
+    router = get_router()
+    if router is None:
+        return None
+    return router.eta_seconds(
+        [(source.x, source.y) for source in sources], (target.x, target.y)
+    )
+
+
+@receiver(setting_changed)
+def reset_router(setting, **kwargs):
+    if setting.startswith("RIDES_ROAD_") or setting.startswith("RIDES_MAP_MATCH_"):
+        get_graph.cache_clear()
+        get_router.cache_clear()
+        get_map_matcher.cache_clear()
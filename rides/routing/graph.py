@@ -0,0 +1,222 @@
+import heapq
+import json
+from array import array
+
+# Road graphs in compressed sparse row form: the edges leaving node n are
+# targets[offsets[n]:offsets[n + 1]] with the matching weights (seconds). Nodes
+# are numbered 0..n-1, with their coordinates in longitudes and latitudes.
+#
+# Queries run on the contraction hierarchy of the graph, which is stored as two
+# such graphs: "up" holds the edges to higher ranked nodes, "down" the reversed
+# edges arriving from higher ranked nodes. Every shortest path is an upward
+# path followed by a downward one, so a query only searches upwards from both
+# ends, which settles a few hundred nodes even on metro-sized graphs.
+#
+# The original road segments are kept as a third graph, "roads", weighted in
+# metres, for map matching.
+
+FORMAT_VERSION = 2
+
+# Witness searches give up after settling this many nodes and add the shortcut,
+# which is always correct, only possibly redundant.
+WITNESS_SETTLE_LIMIT = 500
+# Smaller limit used to estimate the priority of nodes still to contract.
+PRIORITY_SETTLE_LIMIT = 50
+
+
+class CSRGraph:
+    def __init__(self, offsets, targets, weights):
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+
+    @classmethod
+    def from_adjacency(cls, adjacency):
+        offsets = array("l", [0])
+        targets = array("l")
+        weights = array("f")
+        for edges in adjacency:
+            for target, weight in sorted(edges.items()):
+                targets.append(target)
+                weights.append(weight)
+            offsets.append(len(targets))
+        return cls(offsets, targets, weights)
+
+    def edges(self, node):
+        start, end = self.offsets[node], self.offsets[node + 1]
+        return zip(self.targets[start:end], self.weights[start:end])
+
+
+class RoadGraph:
+    def __init__(self, longitudes, latitudes, up, down, roads):
+        self.longitudes = longitudes
+        self.latitudes = latitudes
+        self.up = up
+        self.down = down
+        self.roads = roads
+
+    def __len__(self):
+        return len(self.longitudes)
+
+    def save(self, path):
+        # A JSON header line describing the arrays, followed by their bytes.
+        arrays = self.arrays()
+        header = {
+            "version": FORMAT_VERSION,
+            "arrays": [[name, values.typecode, len(values)] for name, values in arrays],
+        }
+        with open(path, "wb") as file:
+            file.write(json.dumps(header).encode() + b"\n")
+            for _, values in arrays:
+                values.tofile(file)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as file:
+            header = json.loads(file.readline())
+            if header["version"] != FORMAT_VERSION:
+                raise ValueError(f"Unsupported road graph version in {path}")
+            loaded = {}
+            for name, typecode, length in header["arrays"]:
+                values = array(typecode)
+                values.fromfile(file, length)
+                loaded[name] = values
+        return cls(
+            loaded["longitudes"],
+            loaded["latitudes"],
+            CSRGraph(loaded["up_offsets"], loaded["up_targets"], loaded["up_weights"]),
+            CSRGraph(
+                loaded["down_offsets"], loaded["down_targets"], loaded["down_weights"]
+            ),
+            CSRGraph(
+                loaded["road_offsets"], loaded["road_targets"], loaded["road_weights"]
+            ),
+        )
+
+    def arrays(self):
+        return [
+            ("longitudes", self.longitudes),
+            ("latitudes", self.latitudes),
+            ("up_offsets", self.up.offsets),
+            ("up_targets", self.up.targets),
+            ("up_weights", self.up.weights),
+            ("down_offsets", self.down.offsets),
+            ("down_targets", self.down.targets),
+            ("down_weights", self.down.weights),
+            ("road_offsets", self.roads.offsets),
+            ("road_targets", self.roads.targets),
+            ("road_weights", self.roads.weights),
+        ]
+
+
+def build(coordinates, edges):
+    # Numbers the nodes, contracts the graph and returns the RoadGraph.
+    # coordinates maps node ids to (longitude, latitude), edges are
+    # (from node id, to node id, seconds, metres).
+    node_ids = sorted(coordinates)
+    index = {node_id: n for n, node_id in enumerate(node_ids)}
+    outgoing = [{} for _ in node_ids]
+    incoming = [{} for _ in node_ids]
+    roads = [{} for _ in node_ids]
+    for start, end, seconds, metres in edges:
+        start, end = index[start], index[end]
+        if seconds < outgoing[start].get(end, float("inf")):
+            outgoing[start][end] = seconds
+            incoming[end][start] = seconds
+            roads[start][end] = metres
+
+    up, down = contract(outgoing, incoming)
+    return RoadGraph(
+        array("d", (coordinates[node_id][0] for node_id in node_ids)),
+        array("d", (coordinates[node_id][1] for node_id in node_ids)),
+        CSRGraph.from_adjacency(up),
+        CSRGraph.from_adjacency(down),
+        CSRGraph.from_adjacency(roads),
+    )
+
+
+def witness_distances(outgoing, source, skipped, limit, settle_limit):
+    # Distances from source avoiding skipped, up to limit seconds.
+    distances = {source: 0.0}
+    heap = [(0.0, source)]
+    settled = 0
+    while heap and settled < settle_limit:
+        distance, node = heapq.heappop(heap)
+        if distance > distances[node]:
+            continue
+        if distance > limit:
+            break
+        settled += 1
+        for target, weight in outgoing[node].items():
+            if target == skipped:
+                continue
+            candidate = distance + weight
+            if candidate < distances.get(target, float("inf")):
+                distances[target] = candidate
+                heapq.heappush(heap, (candidate, target))
+    return distances
+
+
+def shortcuts(outgoing, incoming, node, settle_limit):
+    # The shortcuts contracting node needs: (from, to, seconds) for every
+    # in/out neighbour pair whose shortest path runs through node.
+    needed = []
+    if not incoming[node] or not outgoing[node]:
+        return needed
+    longest_out = max(outgoing[node].values())
+    for source, in_weight in incoming[node].items():
+        distances = witness_distances(
+            outgoing, source, node, in_weight + longest_out, settle_limit
+        )
+        for target, out_weight in outgoing[node].items():
+            if target == source:
+                continue
+            via = in_weight + out_weight
+            if distances.get(target, float("inf")) > via:
+                needed.append((source, target, via))
+    return needed
+
+
+def contract(outgoing, incoming):
+    # Contracts the nodes in order of edge difference (shortcuts added minus
+    # edges removed) plus the number of contracted neighbours, which keeps the
+    # order spread over the graph. Priorities are updated lazily.
+    # Returns the upward and downward adjacency of the hierarchy.
+    size = len(outgoing)
+    contracted_neighbours = [0] * size
+    up = [{} for _ in range(size)]
+    down = [{} for _ in range(size)]
+
+    def priority(node):
+        added = len(shortcuts(outgoing, incoming, node, PRIORITY_SETTLE_LIMIT))
+        removed = len(outgoing[node]) + len(incoming[node])
+        return added - removed + contracted_neighbours[node]
+
+    heap = [(priority(node), node) for node in range(size)]
+    heapq.heapify(heap)
+    while heap:
+        _, node = heapq.heappop(heap)
+        current = priority(node)
+        if heap and current > heap[0][0]:
+            heapq.heappush(heap, (current, node))
+            continue
+
+        for source, target, seconds in shortcuts(
+            outgoing, incoming, node, WITNESS_SETTLE_LIMIT
+        ):
+            if seconds < outgoing[source].get(target, float("inf")):
+                outgoing[source][target] = seconds
+                incoming[target][source] = seconds
+
+        # Every remaining neighbour is contracted later, so ranks higher.
+        for target, weight in outgoing[node].items():
+            up[node][target] = weight
+            del incoming[target][node]
+            contracted_neighbours[target] += 1
+        for source, weight in incoming[node].items():
+            down[node][source] = weight
+            del outgoing[source][node]
+            contracted_neighbours[source] += 1
+        outgoing[node] = {}
+        incoming[node] = {}
+    return up, down
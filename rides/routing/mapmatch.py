@@ -0,0 +1,209 @@
+import heapq
+import math
+from array import array
+from collections import defaultdict
+
+from ..geo import METRES_PER_DEGREE, distance_m
+
+# Map matching of GPS traces onto the road segments of a RoadGraph, with a
+# hidden Markov model in the style of Newson and Krumm: the candidates of each
+# ping are the points closest to it on the segments within the search radius,
+# emissions favour candidates near the ping and transitions favour candidate
+# pairs whose driving distance is close to the straight-line distance between
+# the pings. Viterbi picks the most likely sequence. Pings without candidates,
+# or that can't be reached from the previous ones, start a new chain.
+
+# Grid cells of the segment index, in degrees (about 200 m).
+GRID_CELL_DEGREES = 0.002
+# Standard deviation of GPS noise, and the scale of the difference between
+# driving and straight-line distance, in metres.
+SIGMA_M = 20.0
+BETA_M = 30.0
+# Candidates kept per ping.
+MAX_CANDIDATES = 6
+
+
+class Candidate:
+    __slots__ = ("segment", "fraction", "longitude", "latitude", "metres")
+
+    def __init__(self, segment, fraction, longitude, latitude, metres):
+        self.segment = segment
+        self.fraction = fraction
+        self.longitude = longitude
+        self.latitude = latitude
+        self.metres = metres
+
+
+class MapMatcher:
+    def __init__(self, graph, radius_m):
+        self.graph = graph
+        self.radius_m = radius_m
+        # Segments are the edges of graph.roads, numbered in CSR order.
+        roads = graph.roads
+        self.segment_starts = array("l")
+        for node in range(len(graph)):
+            self.segment_starts.extend(
+                [node] * (roads.offsets[node + 1] - roads.offsets[node])
+            )
+        self.grid = defaultdict(list)
+        for segment, start in enumerate(self.segment_starts):
+            end = roads.targets[segment]
+            min_x, max_x = sorted(
+                (
+                    self.cell_x(graph.longitudes[start]),
+                    self.cell_x(graph.longitudes[end]),
+                )
+            )
+            min_y, max_y = sorted(
+                (self.cell_y(graph.latitudes[start]), self.cell_y(graph.latitudes[end]))
+            )
+            for x in range(min_x, max_x + 1):
+                for y in range(min_y, max_y + 1):
+                    self.grid[(x, y)].append(segment)
+
+    def cell_x(self, longitude):
+        return math.floor(longitude / GRID_CELL_DEGREES)
+
+    def cell_y(self, latitude):
+        return math.floor(latitude / GRID_CELL_DEGREES)
+
+    def candidates(self, longitude, latitude):
+        graph = self.graph
+        # Local equirectangular projection around the ping, in metres.
+        scale_x = METRES_PER_DEGREE * math.cos(math.radians(latitude))
+        scale_y = METRES_PER_DEGREE
+        reach = math.ceil(self.radius_m / METRES_PER_DEGREE / GRID_CELL_DEGREES)
+        reach_x = math.ceil(reach / max(math.cos(math.radians(latitude)), 0.01))
+        cell_x, cell_y = self.cell_x(longitude), self.cell_y(latitude)
+
+        segments = set()
+        for x in range(cell_x - reach_x, cell_x + reach_x + 1):
+            for y in range(cell_y - reach, cell_y + reach + 1):
+                segments.update(self.grid.get((x, y), ()))
+
+        found = []
+        for segment in segments:
+            start = self.segment_starts[segment]
+            end = graph.roads.targets[segment]
+            start_x = (graph.longitudes[start] - longitude) * scale_x
+            start_y = (graph.latitudes[start] - latitude) * scale_y
+            end_x = (graph.longitudes[end] - longitude) * scale_x
+            end_y = (graph.latitudes[end] - latitude) * scale_y
+            delta_x, delta_y = end_x - start_x, end_y - start_y
+            length = delta_x * delta_x + delta_y * delta_y
+            fraction = 0.0
+            if length:
+                fraction = -(start_x * delta_x + start_y * delta_y) / length
+                fraction = min(max(fraction, 0.0), 1.0)
+            point_x = start_x + fraction * delta_x
+            point_y = start_y + fraction * delta_y
+            metres = math.hypot(point_x, point_y)
+            if metres <= self.radius_m:
+                found.append(
+                    Candidate(
+                        segment,
+                        fraction,
+                        longitude + point_x / scale_x,
+                        latitude + point_y / scale_y,
+                        metres,
+                    )
+                )
+        found.sort(key=lambda candidate: candidate.metres)
+        return found[:MAX_CANDIDATES]
+
+    def road_distances(self, source, limit):
+        # Driving metres from source along the road segments, up to limit.
+        roads = self.graph.roads
+        distances = {source: 0.0}
+        heap = [(0.0, source)]
+        while heap:
+            distance, node = heapq.heappop(heap)
+            if distance > distances[node]:
+                continue
+            for target, metres in roads.edges(node):
+                candidate = distance + metres
+                if candidate <= limit and candidate < distances.get(target, math.inf):
+                    distances[target] = candidate
+                    heapq.heappush(heap, (candidate, target))
+        return distances
+
+    def transitions(self, previous, current, straight_m):
+        # Log probabilities of moving from each previous candidate to each
+        # current one, -inf where there is no route.
+        roads = self.graph.roads
+        limit = 2 * straight_m + 2 * self.radius_m + 100
+        scores = []
+        for before in previous:
+            length = roads.weights[before.segment]
+            distances = self.road_distances(roads.targets[before.segment], limit)
+            row = []
+            for after in current:
+                if (
+                    after.segment == before.segment
+                    and after.fraction >= before.fraction
+                ):
+                    route = (after.fraction - before.fraction) * length
+                else:
+                    between = distances.get(self.segment_starts[after.segment])
+                    if between is None:
+                        row.append(-math.inf)
+                        continue
+                    route = (
+                        (1 - before.fraction) * length
+                        + between
+                        + after.fraction * roads.weights[after.segment]
+                    )
+                row.append(-abs(route - straight_m) / BETA_M)
+            scores.append(row)
+        return scores
+
+    def match(self, pings):
+        # pings are (longitude, latitude) in time order. Returns the matched
+        # (longitude, latitude) of each, or None where nothing was in range.
+        matched = [None] * len(pings)
+        chain = []
+        for index, (longitude, latitude) in enumerate(pings):
+            candidates = self.candidates(longitude, latitude)
+            if not candidates:
+                self.resolve(chain, matched)
+                chain = []
+                continue
+            emissions = [
+                -0.5 * (candidate.metres / SIGMA_M) ** 2 for candidate in candidates
+            ]
+            if not chain:
+                chain.append((index, candidates, emissions, None))
+                continue
+
+            previous_index, previous, scores, _ = chain[-1]
+            straight_m = distance_m(*pings[previous_index], longitude, latitude)
+            transitions = self.transitions(previous, candidates, straight_m)
+            step_scores = []
+            backpointers = []
+            for position, emission in enumerate(emissions):
+                best, best_from = max(
+                    (scores[origin] + transitions[origin][position], origin)
+                    for origin in range(len(previous))
+                )
+                step_scores.append(best + emission)
+                backpointers.append(best_from)
+            if max(step_scores) == -math.inf:
+                # Unreachable from the chain so far, start over here.
+                self.resolve(chain, matched)
+                chain = [(index, candidates, emissions, None)]
+            else:
+                chain.append((index, candidates, step_scores, backpointers))
+        self.resolve(chain, matched)
+        return matched
+
+    def resolve(self, chain, matched):
+        # Backtracks the most likely candidates of a chain into matched.
+        if not chain:
+            return
+        _, _, scores, _ = chain[-1]
+        position = max(range(len(scores)), key=scores.__getitem__)
+        for index, candidates, _, backpointers in reversed(chain):
+            candidate = candidates[position]
+            matched[index] = (candidate.longitude, candidate.latitude)
+            if backpointers is not None:
+                position = backpointers[position]
@@ -0,0 +1,86 @@
+from xml.etree.ElementTree import iterparse
+
+from ..geo import distance_m
+
+# Reads the drivable road network of an OSM XML extract (e.g. from Geofabrik,
+# converted with osmium cat extract.osm.pbf -o extract.osm). Only ways with a
+# highway tag in SPEEDS_KMH are kept, and only the nodes they use.
+
+# Free-flow speeds per highway type, used when a way has no usable maxspeed.
+SPEEDS_KMH = {
+    "motorway": 90,
+    "motorway_link": 50,
+    "trunk": 70,
+    "trunk_link": 40,
+    "primary": 55,
+    "primary_link": 35,
+    "secondary": 45,
+    "secondary_link": 30,
+    "tertiary": 35,
+    "tertiary_link": 25,
+    "unclassified": 30,
+    "residential": 25,
+    "living_street": 10,
+    "service": 15,
+}
+
+
+def way_speed_kmh(tags):
+    maxspeed = tags.get("maxspeed", "").split(" ")[0]
+    if maxspeed.isdigit() and int(maxspeed) > 0:
+        # Traffic rarely lets drivers reach the limit.
+        return min(int(maxspeed) * 0.8, SPEEDS_KMH[tags["highway"]] * 1.5)
+    return SPEEDS_KMH[tags["highway"]]
+
+
+def way_directions(tags):
+    # (forward, backward) along the node order of the way.
+    oneway = tags.get("oneway")
+    if oneway in ("yes", "true", "1"):
+        return True, False
+    if oneway == "-1":
+        return False, True
+    if oneway == "no":
+        return True, True
+    if tags["highway"] == "motorway" or tags.get("junction") == "roundabout":
+        return True, False
+    return True, True
+
+
+def read_osm(path):
+    # Returns (coordinates, edges): coordinates maps node ids to (longitude,
+    # latitude), edges are (from node id, to node id, seconds, metres) tuples.
+    coordinates = {}
+    ways = []
+    for _, element in iterparse(path, events=("end",)):
+        if element.tag == "node":
+            coordinates[int(element.get("id"))] = (
+                float(element.get("lon")),
+                float(element.get("lat")),
+            )
+            element.clear()
+        elif element.tag == "way":
+            tags = {tag.get("k"): tag.get("v") for tag in element.iter("tag")}
+            if tags.get("highway") in SPEEDS_KMH:
+                nodes = [int(node.get("ref")) for node in element.iter("nd")]
+                ways.append((nodes, way_speed_kmh(tags), way_directions(tags)))
+            element.clear()
+        elif element.tag == "relation":
+            element.clear()
+
+    used = {}
+    edges = []
+    for nodes, speed_kmh, (forward, backward) in ways:
+        nodes = [node for node in nodes if node in coordinates]
+        for start, end in zip(nodes, nodes[1:]):
+            if start == end:
+                continue
+            metres = distance_m(*coordinates[start], *coordinates[end])
+            seconds = metres / (speed_kmh / 3.6)
+            if forward:
+                edges.append((start, end, seconds, metres))
+            if backward:
+                edges.append((end, start, seconds, metres))
+            used[start] = coordinates[start]
+            used[end] = coordinates[end]
+    return used, edges
@@ -0,0 +1,109 @@
+import heapq
+import math
+from collections import defaultdict
+
+from ..geo import METRES_PER_DEGREE, distance_m
+
+# Grid cells of the node index, in degrees (about 1 km).
+GRID_CELL_DEGREES = 0.01
+
+# Speed assumed between a location and the road node it snaps to.
+ACCESS_SPEED_MS = 15 / 3.6
+
+
+class Router:
+    def __init__(self, graph, snap_max_m):
+        self.graph = graph
+        self.snap_max_m = snap_max_m
+        self.grid = defaultdict(list)
+        for node in range(len(graph)):
+            self.grid[self.cell(graph.longitudes[node], graph.latitudes[node])].append(
+                node
+            )
+
+    def cell(self, longitude, latitude):
+        return (
+            math.floor(longitude / GRID_CELL_DEGREES),
+            math.floor(latitude / GRID_CELL_DEGREES),
+        )
+
+    def snap(self, longitude, latitude):
+        # (node, metres) of the closest node within snap_max_m, or None.
+        reach = math.ceil(self.snap_max_m / METRES_PER_DEGREE / GRID_CELL_DEGREES)
+        # Longitude degrees shrink towards the poles.
+        reach_x = math.ceil(reach / max(math.cos(math.radians(latitude)), 0.01))
+        cell_x, cell_y = self.cell(longitude, latitude)
+        best = None
+        for x in range(cell_x - reach_x, cell_x + reach_x + 1):
+            for y in range(cell_y - reach, cell_y + reach + 1):
+                for node in self.grid.get((x, y), ()):
+                    metres = distance_m(
+                        longitude,
+                        latitude,
+                        self.graph.longitudes[node],
+                        self.graph.latitudes[node],
+                    )
+                    if metres <= self.snap_max_m and (best is None or metres < best[1]):
+                        best = (node, metres)
+        return best
+
+    def upward_search(self, csr, source):
+        # Distances of every node reachable upwards from source.
+        distances = {source: 0.0}
+        heap = [(0.0, source)]
+        while heap:
+            distance, node = heapq.heappop(heap)
+            if distance > distances[node]:
+                continue
+            for target, weight in csr.edges(node):
+                candidate = distance + weight
+                if candidate < distances.get(target, math.inf):
+                    distances[target] = candidate
+                    heapq.heappush(heap, (candidate, target))
+        return distances
+
+    def node_seconds(self, sources, target):
+        # Driving seconds from each source node to the target node (None when
+        # unreachable). The search space of the target is shared by the batch.
+        backward = self.upward_search(self.graph.down, target)
+        results = []
+        for source in sources:
+            forward = self.upward_search(self.graph.up, source)
+            if len(forward) > len(backward):
+                meeting = (
+                    seconds + forward[node]
+                    for node, seconds in backward.items()
+                    if node in forward
+                )
+            else:
+                meeting = (
+                    seconds + backward[node]
+                    for node, seconds in forward.items()
+                    if node in backward
+                )
+            best = min(meeting, default=None)
+            results.append(best)
+        return results
+
+    def eta_seconds(self, sources, target):
+        # Driving time from each (longitude, latitude) in sources to target, in
+        # seconds, or None for locations off the road graph or unreachable.
+        target = self.snap(*target)
+        snapped = [self.snap(*source) for source in sources]
+        if target is None:
+            return [None] * len(sources)
+
+        routable = [source for source in snapped if source is not None]
+        seconds = iter(self.node_seconds([node for node, _ in routable], target[0]))
+        results = []
+        for source in snapped:
+            if source is None:
+                results.append(None)
+                continue
+            driving = next(seconds)
+            if driving is None:
+                results.append(None)
+            else:
+                access = (source[1] + target[1]) / ACCESS_SPEED_MS
+                results.append(round(driving + access))
+        return results
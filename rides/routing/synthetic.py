@@ -0,0 +1,54 @@
+from ..geo import distance_m
+
+# Generated road networks and drives for the benchmarks.
+
+
+def grid_network(size, rng):
+    # A size x size street grid around Kochi with 150 m blocks, mixed speeds
+    # and some one-way streets, standing in for a metro extract.
+    coordinates = {}
+    for x in range(size):
+        for y in range(size):
+            coordinates[x * size + y] = (
+                76.2 + x * 0.00137 + rng.uniform(-0.0002, 0.0002),
+                9.9 + y * 0.00135 + rng.uniform(-0.0002, 0.0002),
+            )
+    edges = []
+    for x in range(size):
+        for y in range(size):
+            for neighbour in (x + 1, y), (x, y + 1):
+                if max(neighbour) >= size:
+                    continue
+                arterial = x % 10 == 0 or y % 10 == 0
+                start, end = x * size + y, neighbour[0] * size + neighbour[1]
+                metres = distance_m(*coordinates[start], *coordinates[end])
+                seconds = metres / ((50 if arterial else 25) / 3.6)
+                seconds *= rng.uniform(0.8, 1.2)
+                edges.append((start, end, seconds, metres))
+                if arterial or rng.random() > 0.15:
+                    edges.append((end, start, seconds, metres))
+    return coordinates, edges
+
+
+def random_drive(graph, length, rng):
+    # (longitude, latitude) points every half segment along a random drive over
+    # graph.roads, the ground truth for map matching benchmarks.
+    node = rng.randrange(len(graph))
+    points = []
+    while len(points) < length:
+        edges = list(graph.roads.edges(node))
+        if not edges:
+            node = rng.randrange(len(graph))
+            continue
+        target, _ = rng.choice(edges)
+        for fraction in (0.0, 0.5):
+            points.append(
+                (
+                    graph.longitudes[node]
+                    + fraction * (graph.longitudes[target] - graph.longitudes[node]),
+                    graph.latitudes[node]
+                    + fraction * (graph.latitudes[target] - graph.latitudes[node]),
+                )
+            )
+        node = target
+    return points[:length]
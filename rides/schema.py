@@ -0,0 +1,121 @@
+import gzip
+import hashlib
+import os
+from functools import lru_cache
+from pathlib import Path
+
+import brotli
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+from drf_spectacular.settings import spectacular_settings
+from drf_spectacular.utils import extend_schema
+from drf_spectacular.views import SCHEMA_KWARGS, SpectacularAPIView
+
+from .middleware import accepted_encodings
+
+# The OpenAPI schema is generated once at deploy time by the build_schema
+# command and written to OPENAPI_SCHEMA_DIR, uncompressed and precompressed
+# with brotli and gzip. API workers serve those files, and only generate the
+# schema at runtime while the artifact is missing.
+
+RENDERERS = {
+    "yaml": OpenApiYamlRenderer,
+    "json": OpenApiJsonRenderer,
+}
+
+# Preferred first.
+ENCODINGS = (
+    ("br", ".br"),
+    ("gzip", ".gz"),
+)
+
+
+def artifact_path(format):
+    return Path(settings.OPENAPI_SCHEMA_DIR) / f"schema.{format}"
+
+
+def write_atomic(path, content):
+    # Workers may read the artifact while it's rebuilt, so files are swapped in
+    # whole.
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_bytes(content)
+    os.replace(tmp_path, path)
+
+
+def build_artifacts(generator_class=None):
+    if generator_class is None:
+        generator_class = spectacular_settings.DEFAULT_GENERATOR_CLASS
+    schema = generator_class().get_schema(request=None, public=True)
+
+    Path(settings.OPENAPI_SCHEMA_DIR).mkdir(parents=True, exist_ok=True)
+    paths = []
+    for format, renderer_class in RENDERERS.items():
+        content = renderer_class().render(schema, renderer_context={})
+        path = artifact_path(format)
+        # Compressed files go first, the uncompressed one marks the artifact as
+        # complete.
+        write_atomic(
+            path.with_name(path.name + ".br"), brotli.compress(content, quality=11)
+        )
+        write_atomic(path.with_name(path.name + ".gz"), gzip.compress(content, mtime=0))
+        write_atomic(path, content)
+        paths.append(path)
+    return paths
+
+
+@lru_cache(maxsize=8)
+def read_artifact(path, mtime):
+    # Keyed on the modification time, so a rebuilt artifact is picked up
+    # without restarting the workers.
+    content = path.read_bytes()
+    bodies = {None: content}
+    for encoding, suffix in ENCODINGS:
+        try:
+            bodies[encoding] = path.with_name(path.name + suffix).read_bytes()
+        except FileNotFoundError:
+            pass
+    etag = f'W/"{hashlib.sha256(content).hexdigest()[:32]}"'
+    return etag, bodies
+
+
+def load_artifact(format):
+    path = artifact_path(format)
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    return read_artifact(path, mtime)
+
+
+class PrecomputedSchemaView(SpectacularAPIView):
+    @extend_schema(**SCHEMA_KWARGS)
+    def get(self, request, *args, **kwargs):
+        # Translated and versioned schemas aren't prebuilt.
+        if request.GET.get("lang") or request.GET.get("version"):
+            return super().get(request, *args, **kwargs)
+
+        renderer = request.accepted_renderer
+        artifact = load_artifact(renderer.format)
+        if artifact is None:
+            return super().get(request, *args, **kwargs)
+
+        etag, bodies = artifact
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            encodings = accepted_encodings(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+            encoding = next(
+                (
+                    encoding
+                    for encoding, _ in ENCODINGS
+                    if encoding in encodings and encoding in bodies
+                ),
+                None,
+            )
+            response = HttpResponse(bodies[encoding], content_type=renderer.media_type)
+            if encoding is not None:
+                response.headers["Content-Encoding"] = encoding
+        response.headers["ETag"] = etag
+        patch_vary_headers(response, ("Accept-Encoding",))
+        return response
@@ -1,15 +1,86 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
 
-from .models import Ride, RideRequest
+from .models import ArchivedRide, ArchivedRideRequest, Ride, RideRequest, StandingMatch
+from .transitions import can_transition
 
 
 class RideSerializer(serializers.ModelSerializer):
     class Meta:
         model = Ride
-        fields = "__all__"
+        exclude = (
+            "current_location_planar",
+            "pickup_location_planar",
+            "dropoff_location_planar",
+            "od_cell",
+            "pickup_distance_m",
+        )
+
+    def validate_status(self, value):
+        if self.instance is not None and not can_transition(
+            self.instance.status, value
+        ):
+            raise serializers.ValidationError(
+                f"Invalid status transition from {self.instance.status} to {value}"
+            )
+        return value
+
+
+class NearbyRideSerializer(RideSerializer):
+    # Driving time to the user, set by rides.matching.order_by_eta.
+    eta_seconds = serializers.IntegerField(read_only=True, allow_null=True)
 
 
 class RideRequestSerializer(serializers.ModelSerializer):
     class Meta:
         model = RideRequest
         fields = "__all__"
+        read_only_fields = ("status",)
+
+
+class ArchivedRideSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ArchivedRide
+        exclude = ("pickup_distance_m",)
+
+
+class ArchivedRideRequestSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ArchivedRideRequest
+        fields = "__all__"
+
+
+class StandingMatchSerializer(serializers.ModelSerializer):
+    expires_at = serializers.DateTimeField(required=False)
+
+    class Meta:
+        model = StandingMatch
+        fields = "__all__"
+        read_only_fields = ("rider", "matched_ride", "matched_at")
+
+    def validate_radius(self, value):
+        if not 0 < value <= settings.RIDES_STANDING_MATCH_MAX_RADIUS_M:
+            raise serializers.ValidationError(
+                f"Radius must be between 0 and {settings.RIDES_STANDING_MATCH_MAX_RADIUS_M} metres"
+            )
+        return value
+
+    def validate_expires_at(self, value):
+        now = timezone.now()
+        max_ttl = timedelta(minutes=settings.RIDES_STANDING_MATCH_MAX_TTL_MINUTES)
+        if not now < value <= now + max_ttl:
+            raise serializers.ValidationError(
+                f"Expiry must be in the next {settings.RIDES_STANDING_MATCH_MAX_TTL_MINUTES} minutes"
+            )
+        return value
+
+    def create(self, validated_data):
+        validated_data.setdefault(
+            "expires_at",
+            timezone.now()
+            + timedelta(minutes=settings.RIDES_STANDING_MATCH_TTL_MINUTES),
+        )
+        return super().create(validated_data)
@@ -0,0 +1,12 @@
+from django.dispatch import Signal
+
+
+# Sent with ride_ids by write paths that bypass Model.save(), such as
+# QuerySet.update(), so the same invalidation runs as for saved instances.
+# changes optionally maps the updated fields to their new value when it is the
+# same for every ride.
+rides_updated = Signal()
+
+# The same for ride requests, sent with ride_request_ids and the ids of their
+# rides.
+ride_requests_updated = Signal()
@@ -0,0 +1,159 @@
+import redis
+from django.conf import settings
+from django.core.mail import send_mass_mail
+from django.db import connection, transaction
+
+from . import presence, routing
+from .connections import get_redis
+from .models import Ride, StandingMatch
+
+# Standing matches are tested against rides instead of riders polling nearby.
+# Whenever rides without a rider are created or move, one statement finds the
+# waiting matches within RIDES_STANDING_MATCH_MAX_RADIUS_M of each ride through
+# the spatial index on pickup_location, applies each match's own radius to both
+# ends and marks the hits as matched. Every match is notified once.
+#
+# Moves are the hottest write, so they only queue matching for rides that can
+# still match, and one message per ride at a time. Rides stop being matchable
+# for good once they have a rider or leave PENDING, which is remembered in Redis
+# for CLOSED_TIMEOUT, and a ride stays queued from its first move until the
+# relay publishes it (or for RIDES_STANDING_MATCH_QUEUE_SECONDS at most). Rides
+# Redis knows nothing about, and every ride while Redis is down, are queued.
+
+CLOSED_TIMEOUT = 24 * 60 * 60
+
+MATCH_SQL = f"""
+UPDATE {StandingMatch._meta.db_table} AS standing SET
+    matched_ride_id = ride.id,
+    matched_at = now()
+FROM {Ride._meta.db_table} AS ride
+WHERE ride.id = ANY(%(ride_ids)s)
+    AND ride.rider_id IS NULL
+    AND ride.status = 'PENDING'
+    AND standing.matched_at IS NULL
+    AND standing.expires_at > now()
+    AND ST_DWithin(standing.pickup_location, ride.current_location, %(max_radius)s)
+    AND ST_DWithin(standing.pickup_location, ride.current_location, standing.radius)
+    AND ST_DWithin(
+        standing.destination_location, ride.dropoff_location, standing.radius
+    )
+RETURNING standing.id, standing.rider_id, ride.id
+"""
+
+
+def closed_key(ride_id):
+    return f"rides:standing:closed:{ride_id}"
+
+
+def queued_key(ride_id):
+    return f"rides:standing:queued:{ride_id}"
+
+
+def is_matchable(ride):
+    return ride.rider_id is None and ride.status == "PENDING"
+
+
+def rides_closed(ride_ids):
+    def close():
+        try:
+            with get_redis().pipeline() as pipe:
+                for ride_id in ride_ids:
+                    pipe.set(closed_key(ride_id), 1, ex=CLOSED_TIMEOUT)
+                pipe.execute()
+        except redis.RedisError:
+            pass
+
+    if ride_ids:
+        transaction.on_commit(close)
+
+
+def rides_changed(ride_ids):
+    # For write paths that bypass Model.save(). One query for the whole batch.
+    rides = Ride.objects.filter(pk__in=ride_ids).only("pk", "rider", "status")
+    rides_closed([ride.pk for ride in rides if not is_matchable(ride)])
+
+
+def moved_rides_to_queue(ride_ids):
+    # The moved rides that can still match and aren't queued yet.
+    ride_ids = list(ride_ids)
+    try:
+        with get_redis().pipeline() as pipe:
+            for ride_id in ride_ids:
+                pipe.exists(closed_key(ride_id))
+            closed = pipe.execute()
+            open_ride_ids = [
+                ride_id for ride_id, is_closed in zip(ride_ids, closed) if not is_closed
+            ]
+            for ride_id in open_ride_ids:
+                pipe.set(
+                    queued_key(ride_id),
+                    1,
+                    nx=True,
+                    ex=settings.RIDES_STANDING_MATCH_QUEUE_SECONDS,
+                )
+            queued = pipe.execute()
+    except redis.RedisError:
+        return ride_ids
+    return [ride_id for ride_id, new in zip(open_ride_ids, queued) if new]
+
+
+def rides_published(ride_ids):
+    # Moves after this queue the rides again.
+    try:
+        get_redis().delete(*[queued_key(ride_id) for ride_id in ride_ids])
+    except redis.RedisError:
+        pass
+
+
+def match_rides(ride_ids):
+    # Returns (standing match id, ride id) pairs of the new matches.
+    if settings.RIDES_REQUIRE_DRIVER_PRESENCE:
+        ride_ids = [
+            ride.pk
+            for ride in presence.online_rides(
+                Ride.objects.filter(pk__in=ride_ids).only("pk", "driver_id")
+            )
+        ]
+    if not ride_ids:
+        return []
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                MATCH_SQL,
+                {
+                    "ride_ids": list(ride_ids),
+                    "max_radius": settings.RIDES_STANDING_MATCH_MAX_RADIUS_M,
+                },
+            )
+            rows = cursor.fetchall()
+
+        if rows:
+            matched_rides = {pk: ride_id for pk, _, ride_id in rows}
+            matches = StandingMatch.objects.filter(pk__in=matched_rides).values_list(
+                "pk",
+                "rider__email",
+                "pickup_location",
+                "matched_ride__current_location",
+            )
+            messages = [
+                (
+                    "A ride is available",
+                    f"Ride {matched_rides[pk]} passes near your pickup and destination"
+                    f"{eta_text(ride_location, pickup_location)}. Request it with "
+                    f"POST /api/v1/requests/ and ride={matched_rides[pk]}.",
+                    None,
+                    [email],
+                )
+                for pk, email, pickup_location, ride_location in matches
+                if email
+            ]
+            transaction.on_commit(lambda: send_mass_mail(messages))
+        return [(pk, ride_id) for pk, _, ride_id in rows]
+
+
+def eta_text(ride_location, pickup_location):
+    etas = routing.eta_seconds([ride_location], pickup_location)
+    if not etas or etas[0] is None:
+        return ""
+    return f", and can be at your pickup in about {max(1, round(etas[0] / 60))} min"
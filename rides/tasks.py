@@ -1,21 +1,87 @@
 from random import uniform
+from django.conf import settings
 from django.contrib.gis.geos import Point
+from django.utils.dateparse import parse_datetime
 from celery import shared_task
 
-from .models import Ride
+from . import archive, load, rollups, standing, traces, tracking
+from .location import write_ride_location
+from .ride_requests import expire_stale_ride_requests
+from .models import Ride, RideVersionConflict
 
 
 @shared_task
-def update_ride_location(ride_id):
+def update_ride_location(ride_id, tracking_id=None):
+    # Tracked rides carry the id of their tracking chain and reschedule
+    # themselves until stop_ride_tracking removes it from the registry, or the
+    # ride is no longer in progress.
+    if tracking_id is not None and not tracking.is_tracked(ride_id, tracking_id):
+        return
+
     try:
-        ride = Ride.objects.get(id=ride_id)
-        # Fetch current location
-        current_location = fetch_current_location(ride)
-        ride.current_location = current_location
-        ride.save()
+        # The new location is derived from the one read, so the write is
+        # conditional on the version read and retried if the ride changed. Once
+        # the retries run out this update is skipped, the chain carries on.
+        for _ in range(settings.RIDES_VERSION_CONFLICT_RETRIES + 1):
+            ride = Ride.objects.get(id=ride_id)
+            if tracking_id is not None and ride.status in tracking.UNTRACKED_STATUSES:
+                tracking.unregister([ride_id])
+                return
+            # Fetch current location
+            current_location = fetch_current_location(ride)
+            try:
+                write_ride_location(ride.pk, current_location, version=ride.version)
+                break
+            except RideVersionConflict:
+                continue
 
     except Ride.DoesNotExist:
-        pass
+        tracking.unregister([ride_id])
+        return
+
+    if tracking_id is not None:
+        update_ride_location.apply_async(
+            args=[ride_id, tracking_id], countdown=load.tracking_interval()
+        )
+
+
+@shared_task
+def archive_finished_rides():
+    return archive.archive_finished_rides()
+
+
+@shared_task
+def match_standing_matches(ride_ids):
+    return standing.match_rides(ride_ids)
+
+
+@shared_task
+def match_ride_traces():
+    # One task per batch of pending rides, so matching spreads over the workers.
+    batches = traces.pending_batches()
+    for _ in range(batches):
+        match_ride_trace_batch.delay()
+    return batches
+
+
+@shared_task
+def match_ride_trace_batch():
+    return traces.match_pending_traces()
+
+
+@shared_task
+def refresh_rollups():
+    return rollups.refresh_rollups()
+
+
+@shared_task
+def refresh_rollup_hours(hours):
+    return rollups.refresh_hours([parse_datetime(hour) for hour in hours])
+
+
+@shared_task
+def expire_ride_requests():
+    return expire_stale_ride_requests()
 
 
 def fetch_current_location(ride):
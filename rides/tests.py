@@ -1,15 +1,78 @@
-from datetime import timedelta
+import gzip
+import json
+import math
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from itertools import product
+from unittest import mock
+from uuid import uuid4
+
+import msgpack
+import psycopg2
+import redis
 from django.contrib.auth import get_user_model
 from django.contrib.gis.geos import Point
-from django.test import TestCase
+from django.conf import settings
+from django.core import mail
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.models import Q
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APIClient
 from django.contrib.gis.measure import Distance
 from django.contrib.gis.db.models.functions import Distance as DistanceFunction
 
-from .models import Ride, RideRequest
+from . import (
+    conditional,
+    detail_cache,
+    events,
+    heatmap,
+    location,
+    outbox,
+    presence,
+    rollups,
+    routing,
+    tiles,
+    traces,
+    tracking,
+)
+from .admin import RideAdminForm
+from .archive import archive_finished_rides
+from .connections import get_redis
+from .export import Export
+from .filters import filter_rides
+from .geo import geohash_encode
+from .location import write_ride_location
+from .matching import geography_nearby_rides, od_cell_nearby_rides
+from .models import (
+    ArchivedRide,
+    ArchivedRideRequest,
+    OutboxMessage,
+    Ride,
+    RideRequest,
+    RideRequestRollup,
+    RideRollup,
+    RideTracePoint,
+    RideVersionConflict,
+    StandingMatch,
+)
+from .outbox import relay_batch
+from .ride_requests import expire_stale_ride_requests
 from .serializers import RideSerializer, RideRequestSerializer
-from .tasks import update_ride_location
+from .standing import match_rides
+from .tasks import (
+    match_ride_trace_batch,
+    match_ride_traces,
+    match_standing_matches,
+    update_ride_location,
+)
+from .throttling import bucket_key
+from .views import RideViewSet
 
 
 class RideTests(TestCase):
@@ -82,6 +145,14 @@ class RideTests(TestCase):
             dropoff_location=Point(75.7804, 11.2588, srid=4326),
         )
 
+    def setUp(self):
+        # Cached ride detail, freshness, remembered locations and the tracking
+        # registry outlive the rollback of each test.
+        detail_cache.clear()
+        conditional.clear()
+        location.clear()
+        tracking.unregister([self.ride1.pk, self.ride2.pk, self.ride3.pk])
+
     def test_ride_model(self):
         self.assertEqual(self.ride1.rider, None)
         self.assertEqual(self.ride1.driver.username, "testdriver")
@@ -112,6 +183,95 @@ class RideTests(TestCase):
         expected_data = RideSerializer(ride).data
         self.assertEqual(response.data, expected_data)
 
+    def test_get_ride_not_modified(self):
+        self.client.login(username="testuser", password="secretpassword")
+        ride_id = self.ride2.pk
+        response = self.client.get(f"/api/v1/rides/{ride_id}/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.has_header("Last-Modified"))
+        etag = response["ETag"]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                f"/api/v1/rides/{ride_id}/", HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        # Only the session and user lookups of the authentication hit the database
+        self.assertFalse([query for query in queries if "rides_ride" in query["sql"]])
+        self.assertEqual(response.content, b"")
+
+    def test_get_ride_modified_after_update(self):
+        self.client.login(username="testuser", password="secretpassword")
+        ride_id = self.ride2.pk
+        etag = self.client.get(f"/api/v1/rides/{ride_id}/")["ETag"]
+
+        ride = Ride.objects.get(pk=ride_id)
+        ride.status = "STARTED"
+        ride.save()
+
+        response = self.client.get(f"/api/v1/rides/{ride_id}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["status"], "STARTED")
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_get_ride_modified_by_another_process(self):
+        self.client.login(username="testuser", password="secretpassword")
+        ride_id = self.ride2.pk
+        etag = self.client.get(f"/api/v1/rides/{ride_id}/")["ETag"]
+
+        # e.g. the tracker in a Celery worker, with a local cache of its own.
+        worker_cache = {
+            "default": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": "worker",
+            }
+        }
+        with override_settings(CACHES=worker_cache):
+            with self.captureOnCommitCallbacks(execute=True):
+                write_ride_location(
+                    ride_id, Point(76.2608, 9.9342, srid=4326), force=True
+                )
+
+        response = self.client.get(f"/api/v1/rides/{ride_id}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_get_ride_is_cached(self):
+        self.client.login(username="testuser", password="secretpassword")
+        ride_id = self.ride2.pk
+        first = self.client.get(f"/api/v1/rides/{ride_id}/")
+
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(f"/api/v1/rides/{ride_id}/")
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.data, first.data)
+        self.assertFalse([query for query in queries if "rides_ride" in query["sql"]])
+
+    def test_cached_ride_invalidated_by_location_update(self):
+        self.client.login(username="testuser", password="secretpassword")
+        ride_id = self.ride2.pk
+        self.client.get(f"/api/v1/rides/{ride_id}/")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            write_ride_location(ride_id, Point(75.7804, 11.2588, srid=4326), force=True)
+        response = self.client.get(f"/api/v1/rides/{ride_id}/")
+        self.assertEqual(
+            response.data["current_location"]["coordinates"], [75.7804, 11.2588]
+        )
+
+    def test_cached_ride_invalidated_by_ride_request(self):
+        self.client.login(username="testuser", password="secretpassword")
+        ride_id = self.ride2.pk
+        self.client.get(f"/api/v1/rides/{ride_id}/")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            RideRequest.objects.create(ride=self.ride2, rider=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f"/api/v1/rides/{ride_id}/")
+        self.assertTrue(
+            [query for query in queries if 'FROM "rides_ride"' in query["sql"]]
+        )
+
     def test_get_non_existent_ride(self):
         self.client.login(username="testuser", password="secretpassword")
         ride_id = 666
@@ -194,6 +354,108 @@ class RideTests(TestCase):
         expected_data = RideSerializer(self.ride3).data
         self.assertEqual(response.data, expected_data)
 
+    def test_update_ride_with_if_match(self):
+        self.client.login(username="testdriver", password="secretpassword")
+        ride_id = self.ride1.pk
+        etag = self.client.get(f"/api/v1/rides/{ride_id}/")["ETag"]
+
+        response = self.client.patch(
+            f"/api/v1/rides/{ride_id}/",
+            data={"status": "STARTED"},
+            content_type="application/json",
+            HTTP_IF_MATCH=etag,
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["version"], self.ride1.version + 1)
+        self.assertNotEqual(response["ETag"], etag)
+
+        # The ride moved on since etag, so the second write is refused.
+        response = self.client.patch(
+            f"/api/v1/rides/{ride_id}/",
+            data={"status": "CANCELLED"},
+            content_type="application/json",
+            HTTP_IF_MATCH=etag,
+        )
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.ride1.refresh_from_db()
+        self.assertEqual(self.ride1.status, "STARTED")
+
+    def test_update_location_with_stale_if_match(self):
+        self.client.login(username="testdriver", password="secretpassword")
+        ride_id = self.ride1.pk
+        etag = self.client.get(f"/api/v1/rides/{ride_id}/")["ETag"]
+        write_ride_location(ride_id, Point(75.79, 11.26, srid=4326))
+
+        response = self.client.patch(
+            f"/api/v1/rides/{ride_id}/location/",
+            data={"current_location": "POINT(75.8 11.27)"},
+            content_type="application/json",
+            HTTP_IF_MATCH=etag,
+        )
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+
+    def test_stale_ride_save_conflicts(self):
+        stale = Ride.objects.get(pk=self.ride1.pk)
+        fresh = Ride.objects.get(pk=self.ride1.pk)
+        fresh.status = "STARTED"
+        fresh.save()
+        self.assertEqual(fresh.version, stale.version + 1)
+
+        stale.status = "CANCELLED"
+        with self.assertRaises(RideVersionConflict):
+            stale.save()
+        self.assertEqual(Ride.objects.get(pk=self.ride1.pk).status, "STARTED")
+
+    def test_admin_form_rejects_stale_ride(self):
+        opened = RideAdminForm(instance=self.ride1)
+        data = {name: opened[name].value() for name in opened.fields}
+        data["status"] = "CANCELLED"
+        write_ride_location(self.ride1.pk, Point(75.79, 11.26, srid=4326), force=True)
+
+        form = RideAdminForm(data, instance=Ride.objects.get(pk=self.ride1.pk))
+        self.assertFalse(form.is_valid())
+        self.assertTrue(form.non_field_errors())
+
+        opened = RideAdminForm(instance=Ride.objects.get(pk=self.ride1.pk))
+        data = {name: opened[name].value() for name in opened.fields}
+        data["status"] = "CANCELLED"
+        form = RideAdminForm(data, instance=Ride.objects.get(pk=self.ride1.pk))
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        self.assertEqual(Ride.objects.get(pk=self.ride1.pk).status, "CANCELLED")
+
+    def test_status_retries_after_conflict(self):
+        # A concurrent write lands between the read and the write of the first
+        # attempt, and the status change is applied on the re-read ride.
+        self.client.login(username="testdriver", password="secretpassword")
+        ride_id = self.ride1.pk
+        get_object = RideViewSet.get_object
+        concurrent_writes = []
+
+        def get_object_before_concurrent_write(view):
+            ride = get_object(view)
+            if not concurrent_writes:
+                concurrent_writes.append(
+                    write_ride_location(
+                        ride.pk, Point(75.79, 11.26, srid=4326), force=True
+                    )
+                )
+            return ride
+
+        with mock.patch.object(
+            RideViewSet, "get_object", get_object_before_concurrent_write
+        ):
+            response = self.client.patch(
+                f"/api/v1/rides/{ride_id}/status/",
+                data={"status": "STARTED"},
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.ride1.refresh_from_db()
+        self.assertEqual(self.ride1.status, "STARTED")
+        self.assertEqual(self.ride1.current_location.coords, (75.79, 11.26))
+        self.assertEqual(self.ride1.version, 3)
+
     def test_update_ride_without_authenticating(self):
         ride_id = self.ride1.pk
         updated_ride_data = {
@@ -417,6 +679,25 @@ class RideTests(TestCase):
         )
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
+    def test_update_ride_status_with_invalid_transition(self):
+        Ride.objects.filter(pk=self.ride3.pk).update(status="COMPLETED")
+        self.client.login(username="testdriver", password="secretpassword")
+        response = self.client.patch(
+            f"/api/v1/rides/{self.ride3.pk}/",
+            data={"status": "PENDING"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.patch(
+            f"/api/v1/rides/{self.ride3.pk}/status/",
+            data={"status": "STARTED"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.ride3.refresh_from_db()
+        self.assertEqual(self.ride3.status, "COMPLETED")
+
     def test_match_nearby_rides(self):
         self.client.login(username="testuser", password="secretpassword")
         user_longitude = 76.261
@@ -470,6 +751,192 @@ class RideTests(TestCase):
         response = self.client.post("/api/v1/rides/nearby/", data=request_data)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_nearby_is_throttled(self):
+        self.client.login(username="testuser", password="secretpassword")
+        get_redis().delete(
+            bucket_key("nearby", f"user:{self.user.pk}"),
+            bucket_key("nearby_ip", "ip:127.0.0.1"),
+        )
+        request_data = {
+            "user_longitude": 76.261,
+            "user_latitude": 9.933,
+            "destination_longitude": 75.781,
+            "destination_latitude": 11.259,
+        }
+        rest_framework = {
+            **settings.REST_FRAMEWORK,
+            "DEFAULT_THROTTLE_RATES": {"nearby": "2/min"},
+        }
+        with override_settings(REST_FRAMEWORK=rest_framework):
+            for _ in range(2):
+                response = self.client.post("/api/v1/rides/nearby/", data=request_data)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+            response = self.client.post("/api/v1/rides/nearby/", data=request_data)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertGreater(int(response["Retry-After"]), 0)
+
+    @override_settings(RIDES_LOAD_DB_LATENCY_MS=[0, 0], RIDES_LOAD_SAMPLE_INTERVAL=0)
+    def test_nearby_is_shed_when_overloaded(self):
+        self.client.login(username="testuser", password="secretpassword")
+        request_data = {
+            "user_longitude": 76.261,
+            "user_latitude": 9.933,
+            "destination_longitude": 75.781,
+            "destination_latitude": 11.259,
+        }
+        response = self.client.post("/api/v1/rides/nearby/", data=request_data)
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response["Retry-After"], str(settings.RIDES_SHED_RETRY_AFTER))
+
+    @override_settings(
+        RIDES_LOAD_DB_LATENCY_MS=[0, float("inf")],
+        RIDES_LOAD_SAMPLE_INTERVAL=0,
+        RIDES_SHED_NEARBY_RADIUS_M=1,
+    )
+    def test_nearby_radius_is_capped_when_degraded(self):
+        self.client.login(username="testuser", password="secretpassword")
+        request_data = {
+            "user_longitude": 76.261,
+            "user_latitude": 9.933,
+            "destination_longitude": 75.781,
+            "destination_latitude": 11.259,
+        }
+        response = self.client.post("/api/v1/rides/nearby/", data=request_data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [])
+
+    def test_od_cell_is_kept_in_sync(self):
+        precision = settings.RIDES_OD_CELL_PRECISION
+        ride = Ride.objects.get(pk=self.ride1.pk)
+        self.assertEqual(
+            ride.od_cell,
+            f"{geohash_encode(75.7804, 11.2588, precision)}:"
+            f"{geohash_encode(76.2606304, 9.9340738, precision)}",
+        )
+
+        write_ride_location(ride.pk, Point(76.2606304, 9.9340738, srid=4326))
+        ride.refresh_from_db()
+        self.assertTrue(
+            ride.od_cell.startswith(geohash_encode(76.2606304, 9.9340738, precision))
+        )
+
+        Ride.objects.filter(pk=ride.pk).update(rider=self.rider)
+        ride.refresh_from_db()
+        self.assertIsNone(ride.od_cell)
+
+    def test_od_cell_matching_agrees_with_geography_matching(self):
+        user_location = Point(76.261, 9.933, srid=4326)
+        destination_location = Point(75.781, 11.259, srid=4326)
+        for radius in (100, 1000, 5000):
+            self.assertEqual(
+                list(
+                    od_cell_nearby_rides(
+                        user_location, destination_location, radius
+                    ).values_list("pk", flat=True)
+                ),
+                list(
+                    geography_nearby_rides(
+                        user_location, destination_location, radius
+                    ).values_list("pk", flat=True)
+                ),
+            )
+
+    def test_planar_locations_are_kept_in_sync(self):
+        ride = Ride.objects.get(pk=self.ride1.pk)
+        self.assertEqual(
+            ride.current_location_planar.srid, settings.RIDES_PROJECTED_SRID
+        )
+        expected = self.ride1.current_location.transform(
+            settings.RIDES_PROJECTED_SRID, clone=True
+        )
+        self.assertAlmostEqual(ride.current_location_planar.x, expected.x, places=2)
+        self.assertAlmostEqual(ride.current_location_planar.y, expected.y, places=2)
+
+        Ride.objects.filter(pk=ride.pk).update(
+            current_location=Point(76.2606304, 9.9340738, srid=4326)
+        )
+        ride.refresh_from_db()
+        expected = Point(76.2606304, 9.9340738, srid=4326).transform(
+            settings.RIDES_PROJECTED_SRID, clone=True
+        )
+        self.assertAlmostEqual(ride.current_location_planar.x, expected.x, places=2)
+
+    @override_settings(RIDES_USE_PROJECTED_MATCHING=True)
+    def test_match_nearby_rides_with_projected_matching(self):
+        self.client.login(username="testuser", password="secretpassword")
+        request_data = {
+            "user_longitude": 76.261,
+            "user_latitude": 9.933,
+            "destination_longitude": 75.781,
+            "destination_latitude": 11.259,
+        }
+        response = self.client.post("/api/v1/rides/nearby/", data=request_data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [ride["id"] for ride in response.data],
+            [
+                self.nearby_to_ride3_1.pk,
+                self.nearby_to_ride3_2.pk,
+                self.nearby_to_ride3_3.pk,
+            ],
+        )
+
+    def test_get_ride_as_msgpack(self):
+        self.client.login(username="testuser", password="secretpassword")
+        ride_id = self.ride2.pk
+        response = self.client.get(
+            f"/api/v1/rides/{ride_id}/", HTTP_ACCEPT="application/x-msgpack"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/x-msgpack")
+        ride = msgpack.unpackb(response.content)
+        self.assertEqual(ride["id"], ride_id)
+        self.assertEqual(ride["current_location"], [75.7804, 11.2588])
+        self.assertEqual(ride["dropoff_location"], [76.2606304, 9.9340738])
+
+    def test_create_ride_with_msgpack(self):
+        self.client.login(username="testuser", password="secretpassword")
+        ride_data = {
+            "driver": self.user.pk,
+            "current_location": [76.267303, 9.931233],
+            "pickup_location": [76.267303, 9.931233],
+            "dropoff_location": [75.7804, 11.2588],
+        }
+        response = self.client.post(
+            "/api/v1/rides/",
+            data=msgpack.packb(ride_data),
+            content_type="application/x-msgpack",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        ride = Ride.objects.get(pk=response.data["id"])
+        self.assertEqual(ride.pickup_location.coords, (76.267303, 9.931233))
+
+    @override_settings(RESPONSE_COMPRESSION_MIN_SIZE=0)
+    def test_get_all_rides_compressed(self):
+        self.client.login(username="testuser", password="secretpassword")
+        response = self.client.get("/api/v1/rides/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn(b'"current_location"', gzip.decompress(response.content))
+
+    @override_settings(RESPONSE_COMPRESSION_MIN_SIZE=0)
+    def test_browsable_api_not_compressed(self):
+        self.client.login(username="testuser", password="secretpassword")
+        response = self.client.get(
+            "/api/v1/rides/", HTTP_ACCEPT="text/html", HTTP_ACCEPT_ENCODING="gzip"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response["Content-Type"].startswith("text/html"))
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    @override_settings(RESPONSE_COMPRESSION_MIN_SIZE=1024 * 1024)
+    def test_get_all_rides_below_compression_threshold(self):
+        self.client.login(username="testuser", password="secretpassword")
+        response = self.client.get("/api/v1/rides/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    @override_settings(RIDES_LOCATION_MIN_DISTANCE_M=0)
     def test_update_ride_location(self):
         for _ in range(5):
             initial_location = self.ride3.current_location
@@ -479,6 +946,277 @@ class RideTests(TestCase):
             # Check ride location has changed
             self.assertNotEqual(self.ride3.current_location, initial_location)
 
+    def test_update_ride_location_of_untracked_ride(self):
+        tracking.register(self.ride3.pk, "current")
+        initial_location = self.ride3.current_location
+        update_ride_location(self.ride3.pk, "stale")
+        self.ride3.refresh_from_db()
+        self.assertEqual(self.ride3.current_location, initial_location)
+
+    @override_settings(RIDES_LOCATION_MIN_DISTANCE_M=0)
+    def test_tracking_registry_is_shared_between_processes(self):
+        # The relay registers the ride in its process, the worker checks it
+        # from another one, with a local memory cache of its own.
+        relay_cache = {
+            "default": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": "relay",
+            }
+        }
+        worker_cache = {
+            "default": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": "worker",
+            }
+        }
+        with override_settings(CACHES=relay_cache):
+            tracking.register_many({self.ride3.pk: "chain"})
+
+        initial_location = self.ride3.current_location
+        with override_settings(CACHES=worker_cache), mock.patch.object(
+            update_ride_location, "apply_async"
+        ) as reschedule:
+            self.assertTrue(tracking.is_tracked(self.ride3.pk, "chain"))
+            update_ride_location(self.ride3.pk, "chain")
+        self.ride3.refresh_from_db()
+        self.assertNotEqual(self.ride3.current_location, initial_location)
+        reschedule.assert_called_once()
+
+    def test_tracking_survives_version_conflicts(self):
+        tracking.register(self.ride3.pk, "chain")
+        conflict = RideVersionConflict("changed")
+        with mock.patch(
+            "rides.tasks.write_ride_location", side_effect=conflict
+        ) as write, mock.patch.object(
+            update_ride_location, "apply_async"
+        ) as reschedule:
+            update_ride_location(self.ride3.pk, "chain")
+        self.assertEqual(write.call_count, settings.RIDES_VERSION_CONFLICT_RETRIES + 1)
+        reschedule.assert_called_once()
+
+    def relay_tracking_starts(self, payloads, apply_async=None):
+        outbox.enqueue_many(outbox.TRACKING_START, payloads)
+        with mock.patch.object(
+            update_ride_location.app, "producer_or_acquire"
+        ), mock.patch.object(
+            update_ride_location, "apply_async", side_effect=apply_async
+        ) as start:
+            relay_batch()
+        return start
+
+    def test_relayed_tracking_start_starts_one_chain(self):
+        payload = {"ride_id": self.ride1.pk, "tracking_id": uuid4().hex}
+        start = self.relay_tracking_starts([payload, payload])
+        start.assert_called_once()
+        self.assertTrue(tracking.is_tracked(self.ride1.pk, payload["tracking_id"]))
+
+    def test_tracking_start_after_ride_finished_is_skipped(self):
+        Ride.objects.filter(pk=self.ride1.pk).update(status="COMPLETED")
+        start = self.relay_tracking_starts(
+            [{"ride_id": self.ride1.pk, "tracking_id": uuid4().hex}]
+        )
+        start.assert_not_called()
+        self.assertFalse(tracking.is_tracked(self.ride1.pk))
+
+    def test_only_failed_tracking_starts_are_retried(self):
+        def apply_async(args, **kwargs):
+            if args[0] == self.ride2.pk:
+                raise ConnectionError("broker unavailable")
+
+        start = self.relay_tracking_starts(
+            [
+                {"ride_id": self.ride1.pk, "tracking_id": uuid4().hex},
+                {"ride_id": self.ride2.pk, "tracking_id": uuid4().hex},
+            ],
+            apply_async=apply_async,
+        )
+        self.assertEqual(start.call_count, 2)
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.payload["ride_id"], self.ride2.pk)
+        self.assertEqual(message.attempts, 1)
+
+    def test_tracking_stops_once_ride_is_finished(self):
+        tracking.register(self.ride3.pk, "chain")
+        Ride.objects.filter(pk=self.ride3.pk).update(status="CANCELLED")
+        with mock.patch.object(update_ride_location, "apply_async") as reschedule:
+            update_ride_location(self.ride3.pk, "chain")
+        reschedule.assert_not_called()
+        self.assertFalse(tracking.is_tracked(self.ride3.pk))
+
+    def test_stop_ride_tracking_on_status_change(self):
+        tracking.register(self.ride3.pk, "current")
+        self.assertTrue(tracking.is_tracked(self.ride3.pk))
+        self.client.login(username="testdriver", password="secretpassword")
+        response = self.client.patch(
+            f"/api/v1/rides/{self.ride3.pk}/status/",
+            data={"status": "COMPLETED"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Stopped by the outbox relay, not by the request
+        self.assertTrue(tracking.is_tracked(self.ride3.pk))
+        self.assertEqual(relay_batch(), 1)
+        self.assertFalse(tracking.is_tracked(self.ride3.pk))
+
+    def test_stop_ride_tracking_on_delete(self):
+        tracking.register(self.ride3.pk, "current")
+        self.ride3.delete()
+        relay_batch()
+        self.assertFalse(tracking.is_tracked(self.ride3.pk))
+
+    def test_failing_outbox_message_does_not_stall_the_relay(self):
+        handled = []
+
+        def handler(payloads):
+            if any(payload["bad"] for payload in payloads):
+                raise RuntimeError("broker unavailable")
+            handled.extend(payloads)
+
+        outbox.enqueue_many(
+            "test.topic", [{"bad": False}, {"bad": True}, {"bad": False}]
+        )
+        with mock.patch.dict(outbox.HANDLERS, {"test.topic": handler}):
+            self.assertEqual(relay_batch(), 3)
+            self.assertEqual(handled, [{"bad": False}, {"bad": False}])
+            # The bad message waits for its retry.
+            self.assertEqual(relay_batch(), 0)
+
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.payload, {"bad": True})
+        self.assertEqual(message.attempts, 1)
+        self.assertGreater(message.available_at, timezone.now())
+
+    @override_settings(RIDES_OUTBOX_RETRY_DELAY=0, RIDES_OUTBOX_MAX_ATTEMPTS=2)
+    def test_outbox_message_dead_lettered_after_max_attempts(self):
+        handler = mock.Mock(side_effect=RuntimeError("broker unavailable"))
+        outbox.enqueue("test.topic", {"bad": True})
+        with mock.patch.dict(outbox.HANDLERS, {"test.topic": handler}):
+            self.assertEqual(relay_batch(), 1)
+            self.assertEqual(relay_batch(), 1)
+            self.assertEqual(relay_batch(), 0)
+
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.attempts, 2)
+        self.assertIsNotNone(message.failed_at)
+
+    def test_create_ride_records_tracking_start(self):
+        self.client.login(username="testuser", password="secretpassword")
+        ride_data = {
+            "driver": self.user.pk,
+            "current_location": "POINT(76.267303 9.931233)",
+            "pickup_location": "POINT(76.267303 9.931233)",
+            "dropoff_location": "POINT(75.7804 11.2588)",
+        }
+        response = self.client.post("/api/v1/rides/", data=ride_data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.topic, "tracking.start")
+        self.assertEqual(message.payload["ride_id"], response.data["id"])
+        self.assertFalse(tracking.is_tracked(response.data["id"]))
+
+    def test_rolled_back_status_change_records_nothing(self):
+        tracking.register(self.ride3.pk, "current")
+        self.client.login(username="testdriver", password="secretpassword")
+        with mock.patch.object(Ride, "save", side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.client.patch(
+                    f"/api/v1/rides/{self.ride3.pk}/status/",
+                    data={"status": "COMPLETED"},
+                    content_type="application/json",
+                )
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_write_ride_location_skips_tiny_movements(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(
+                write_ride_location(self.ride1.pk, Point(75.7804, 11.2588, srid=4326))
+            )
+        # About a metre away from the last location written
+        nudged = Point(75.78041, 11.25881, srid=4326)
+        self.assertFalse(write_ride_location(self.ride1.pk, nudged))
+        self.ride1.refresh_from_db()
+        self.assertEqual(self.ride1.current_location.coords, (75.7804, 11.2588))
+
+        moved = Point(76.2608, 9.9342, srid=4326)
+        self.assertTrue(write_ride_location(self.ride1.pk, moved))
+        self.ride1.refresh_from_db()
+        self.assertEqual(self.ride1.current_location.coords, (76.2608, 9.9342))
+
+    def test_write_ride_location_after_skip_window(self):
+        nudged = Point(75.78041, 11.25881, srid=4326)
+        with self.settings(RIDES_LOCATION_MAX_SKIP_SECONDS=0):
+            with self.captureOnCommitCallbacks(execute=True):
+                write_ride_location(self.ride1.pk, Point(75.7804, 11.2588, srid=4326))
+            self.assertTrue(write_ride_location(self.ride1.pk, nudged))
+
+    def test_full_save_forgets_remembered_location(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            write_ride_location(self.ride1.pk, Point(75.7804, 11.2588, srid=4326))
+            self.ride1.status = "STARTED"
+            self.ride1.save()
+        nudged = Point(75.78041, 11.25881, srid=4326)
+        self.assertTrue(write_ride_location(self.ride1.pk, nudged))
+
+    def test_remembered_location_is_shared_between_processes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            write_ride_location(self.ride1.pk, Point(75.7804, 11.2588, srid=4326))
+        # The tracker in a Celery worker, with a local memory cache of its own.
+        worker_cache = {
+            "default": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": "worker",
+            }
+        }
+        nudged = Point(75.78041, 11.25881, srid=4326)
+        with override_settings(CACHES=worker_cache):
+            self.assertFalse(write_ride_location(self.ride1.pk, nudged))
+
+    def test_write_ride_location_forced(self):
+        nudged = Point(75.78041, 11.25881, srid=4326)
+        self.assertTrue(write_ride_location(self.ride1.pk, nudged, force=True))
+
+    def test_update_ride_location_as_driver(self):
+        self.client.login(username="testdriver", password="secretpassword")
+        ride_id = self.ride1.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f"/api/v1/rides/{ride_id}/location/",
+                data={"current_location": "POINT(75.79 11.26)"},
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data["written"])
+        self.ride1.refresh_from_db()
+        self.assertEqual(self.ride1.current_location.coords, (75.79, 11.26))
+
+        response = self.client.patch(
+            f"/api/v1/rides/{ride_id}/location/",
+            data={"current_location": "POINT(75.79001 11.26001)"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.data["written"])
+
+    def test_update_ride_location_as_rider(self):
+        self.client.login(username="testrider", password="secretpassword")
+        ride_id = self.ride3.pk
+        response = self.client.patch(
+            f"/api/v1/rides/{ride_id}/location/",
+            data={"current_location": "POINT(75.79 11.26)"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_update_ride_location_with_invalid_data(self):
+        self.client.login(username="testdriver", password="secretpassword")
+        ride_id = self.ride1.pk
+        response = self.client.patch(
+            f"/api/v1/rides/{ride_id}/location/",
+            data={"current_location": "Kochi"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
 
 class RideRequestTests(TestCase):
     @classmethod
@@ -538,6 +1276,11 @@ class RideRequestTests(TestCase):
             rider=cls.rider,
         )
 
+    def setUp(self):
+        # Cached ride detail and freshness outlive the rollback of each test.
+        detail_cache.clear()
+        conditional.clear()
+
     def test_ride_request_model(self):
         self.assertEqual(self.riderequest1.ride, self.ride1)
         self.assertEqual(self.riderequest1.rider, self.rider)
@@ -565,6 +1308,30 @@ class RideRequestTests(TestCase):
         expected_data = RideRequestSerializer(ride_request).data
         self.assertEqual(response.data, expected_data)
 
+    def test_get_ride_request_not_modified(self):
+        self.client.login(username="testrider", password="secretpassword")
+        ride_request_id = self.riderequest1.pk
+        etag = self.client.get(f"/api/v1/requests/{ride_request_id}/")["ETag"]
+        response = self.client.get(
+            f"/api/v1/requests/{ride_request_id}/", HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_get_ride_request_modified_after_accept(self):
+        ride_request_id = self.riderequest1.pk
+        self.client.login(username="testrider", password="secretpassword")
+        etag = self.client.get(f"/api/v1/requests/{ride_request_id}/")["ETag"]
+
+        self.client.login(username="testdriver", password="secretpassword")
+        self.client.patch(f"/api/v1/requests/{ride_request_id}/accept/")
+
+        self.client.login(username="testrider", password="secretpassword")
+        response = self.client.get(
+            f"/api/v1/requests/{ride_request_id}/", HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data["is_accepted"])
+
     def test_get_non_existent_ride_request(self):
         self.client.login(username="testrider", password="secretpassword")
         ride_request_id = 666
@@ -765,6 +1532,47 @@ class RideRequestTests(TestCase):
         expected_data = RideRequestSerializer(self.riderequest1).data
         self.assertEqual(response.data, expected_data)
 
+    def test_accept_ride_request_rejects_siblings(self):
+        sibling = RideRequest.objects.create(ride=self.ride1, rider=self.user)
+        other_ride_request = self.riderequest2
+        self.client.login(username="testdriver", password="secretpassword")
+        response = self.client.patch(f"/api/v1/requests/{self.riderequest1.pk}/accept/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["status"], "ACCEPTED")
+
+        self.ride1.refresh_from_db()
+        self.assertEqual(self.ride1.rider, self.rider)
+        sibling.refresh_from_db()
+        self.assertEqual(sibling.status, "REJECTED")
+        self.assertFalse(sibling.is_accepted)
+        other_ride_request.refresh_from_db()
+        self.assertEqual(other_ride_request.status, "PENDING")
+
+    def test_accept_ride_request_of_matched_ride(self):
+        ride_request = RideRequest.objects.create(ride=self.ride3, rider=self.user)
+        self.client.login(username="testdriver", password="secretpassword")
+        response = self.client.patch(f"/api/v1/requests/{ride_request.pk}/accept/")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.ride3.refresh_from_db()
+        self.assertEqual(self.ride3.rider, self.rider)
+        ride_request.refresh_from_db()
+        self.assertEqual(ride_request.status, "PENDING")
+
+    def test_expire_stale_ride_requests(self):
+        RideRequest.objects.filter(pk=self.riderequest1.pk).update(
+            created_at=timezone.now() - timedelta(hours=2)
+        )
+        self.assertEqual(expire_stale_ride_requests(timedelta(hours=1), 1), 1)
+        self.riderequest1.refresh_from_db()
+        self.assertEqual(self.riderequest1.status, "EXPIRED")
+        self.riderequest2.refresh_from_db()
+        self.assertEqual(self.riderequest2.status, "PENDING")
+
+        # Expired requests can no longer be accepted
+        self.client.login(username="testdriver", password="secretpassword")
+        response = self.client.patch(f"/api/v1/requests/{self.riderequest1.pk}/accept/")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
     def test_accept_ride_request_as_rider(self):
         self.client.login(username="testrider", password="secretpassword")
         ride_request_id = self.riderequest1.pk
@@ -781,3 +1589,1481 @@ class RideRequestTests(TestCase):
         ride_request_id = self.riderequest1.pk
         response = self.client.patch(f"/api/v1/requests/{ride_request_id}/accept/")
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class RideArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client = APIClient()
+
+        cls.driver = get_user_model().objects.create_user(
+            username="testdriver",
+            email="testdriver@email.com",
+            password="secretpassword",
+        )
+
+        cls.rider = get_user_model().objects.create_user(
+            username="testrider",
+            email="testrider@email.com",
+            password="secretpassword",
+        )
+
+        cls.completed_ride = Ride.objects.create(
+            rider=cls.rider,
+            driver=cls.driver,
+            current_location=Point(76.2606304, 9.9340738, srid=4326),
+            pickup_location=Point(76.2606304, 9.9340738, srid=4326),
+            dropoff_location=Point(75.7804, 11.2588, srid=4326),
+            status="COMPLETED",
+        )
+
+        cls.pending_ride = Ride.objects.create(
+            driver=cls.driver,
+            current_location=Point(75.7804, 11.2588, srid=4326),
+            pickup_location=Point(75.7804, 11.2588, srid=4326),
+            dropoff_location=Point(76.2606304, 9.9340738, srid=4326),
+        )
+
+        cls.riderequest = RideRequest.objects.create(
+            ride=cls.completed_ride, rider=cls.rider, is_accepted=True
+        )
+
+    def test_archive_finished_rides(self):
+        archived = archive_finished_rides(older_than=timedelta(0))
+        self.assertEqual(archived, 1)
+        self.assertFalse(Ride.objects.filter(pk=self.completed_ride.pk).exists())
+        self.assertFalse(RideRequest.objects.filter(pk=self.riderequest.pk).exists())
+        self.assertTrue(Ride.objects.filter(pk=self.pending_ride.pk).exists())
+
+        archived_ride = ArchivedRide.objects.get(pk=self.completed_ride.pk)
+        self.assertEqual(archived_ride.status, "COMPLETED")
+        self.assertEqual(archived_ride.rider, self.rider)
+        self.assertEqual(archived_ride.dropoff_location.coords, (75.7804, 11.2588))
+        self.assertTrue(
+            ArchivedRideRequest.objects.filter(
+                pk=self.riderequest.pk, ride=archived_ride
+            ).exists()
+        )
+
+    def test_archive_finished_rides_is_resumable(self):
+        Ride.objects.filter(pk=self.pending_ride.pk).update(status="CANCELLED")
+        self.assertEqual(
+            archive_finished_rides(
+                older_than=timedelta(0), batch_size=1, max_batches=1
+            ),
+            1,
+        )
+        self.assertEqual(archive_finished_rides(older_than=timedelta(0)), 1)
+        self.assertEqual(archive_finished_rides(older_than=timedelta(0)), 0)
+        self.assertEqual(ArchivedRide.objects.count(), 2)
+
+    def test_archive_skips_recently_finished_rides(self):
+        self.assertEqual(archive_finished_rides(older_than=timedelta(days=1)), 0)
+        self.assertTrue(Ride.objects.filter(pk=self.completed_ride.pk).exists())
+
+    def test_ride_history_includes_archived_rides(self):
+        archive_finished_rides(older_than=timedelta(0))
+        self.client.login(username="testdriver", password="secretpassword")
+        response = self.client.get("/api/v1/rides/history/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            sorted(ride["id"] for ride in response.data),
+            sorted([self.completed_ride.pk, self.pending_ride.pk]),
+        )
+
+    def test_ride_request_history_includes_archived_requests(self):
+        archive_finished_rides(older_than=timedelta(0))
+        self.client.login(username="testrider", password="secretpassword")
+        response = self.client.get("/api/v1/requests/history/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]["id"], self.riderequest.pk)
+        self.assertIn("archived_at", response.data[0])
+
+    def test_ride_history_without_authenticating(self):
+        response = self.client.get("/api/v1/rides/history/")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class HeatmapTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client = APIClient()
+
+        cls.staff = get_user_model().objects.create_user(
+            username="teststaff",
+            email="teststaff@email.com",
+            password="secretpassword",
+            is_staff=True,
+        )
+
+        cls.driver = get_user_model().objects.create_user(
+            username="testdriver",
+            email="testdriver@email.com",
+            password="secretpassword",
+        )
+
+        cls.rider = get_user_model().objects.create_user(
+            username="testrider",
+            email="testrider@email.com",
+            password="secretpassword",
+        )
+
+    def get_cell(self, longitude, latitude, precision=6):
+        response = self.client.get(
+            "/api/v1/heatmap/",
+            data={
+                "bbox": f"{longitude},{latitude},{longitude},{latitude}",
+                "res": precision,
+            },
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        cells = response.data["cells"]
+        if not cells:
+            return {"open_rides": 0, "pending_requests": 0, "started_rides": 0}
+        return cells[0]
+
+    def test_heatmap_follows_ride_events(self):
+        self.client.login(username="teststaff", password="secretpassword")
+        kochi = self.get_cell(76.2606304, 9.9340738)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ride = Ride.objects.create(
+                driver=self.driver,
+                current_location=Point(76.2606304, 9.9340738, srid=4326),
+                pickup_location=Point(76.2606304, 9.9340738, srid=4326),
+                dropoff_location=Point(75.7804, 11.2588, srid=4326),
+            )
+            RideRequest.objects.create(ride=ride, rider=self.rider)
+        cell = self.get_cell(76.2606304, 9.9340738)
+        self.assertEqual(cell["open_rides"], kochi["open_rides"] + 1)
+        self.assertEqual(cell["pending_requests"], kochi["pending_requests"] + 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ride.status = "STARTED"
+            ride.save()
+        cell = self.get_cell(76.2606304, 9.9340738)
+        self.assertEqual(cell["open_rides"], kochi["open_rides"])
+        self.assertEqual(cell["started_rides"], kochi["started_rides"] + 1)
+
+        kozhikode = self.get_cell(75.7804, 11.2588)
+        with self.captureOnCommitCallbacks(execute=True):
+            write_ride_location(ride.pk, Point(75.7804, 11.2588, srid=4326))
+        cell = self.get_cell(75.7804, 11.2588)
+        self.assertEqual(cell["started_rides"], kozhikode["started_rides"] + 1)
+        cell = self.get_cell(76.2606304, 9.9340738)
+        self.assertEqual(cell["started_rides"], kochi["started_rides"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ride.delete()
+        cell = self.get_cell(76.2606304, 9.9340738)
+        self.assertEqual(cell["pending_requests"], kochi["pending_requests"])
+
+    def test_heatmap_errors_do_not_fail_writes(self):
+        ride = Ride.objects.create(
+            driver=self.driver,
+            current_location=Point(76.2606304, 9.9340738, srid=4326),
+            pickup_location=Point(76.2606304, 9.9340738, srid=4326),
+            dropoff_location=Point(75.7804, 11.2588, srid=4326),
+        )
+        with mock.patch.object(
+            heatmap, "get_redis", side_effect=redis.ConnectionError
+        ), self.assertLogs("rides.heatmap", "ERROR"):
+            with self.captureOnCommitCallbacks(execute=True):
+                written = write_ride_location(
+                    ride.pk, Point(75.7804, 11.2588, srid=4326), force=True
+                )
+        self.assertTrue(written)
+        ride.refresh_from_db()
+        self.assertEqual(ride.current_location.coords, (75.7804, 11.2588))
+
+    def test_heatmap_with_invalid_res(self):
+        self.client.login(username="teststaff", password="secretpassword")
+        response = self.client.get(
+            "/api/v1/heatmap/", data={"bbox": "76.2,9.9,76.3,10.0", "res": 12}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_heatmap_with_invalid_bbox(self):
+        self.client.login(username="teststaff", password="secretpassword")
+        response = self.client.get("/api/v1/heatmap/", data={"bbox": "76.2,9.9"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_heatmap_as_non_staff_user(self):
+        self.client.login(username="testdriver", password="secretpassword")
+        response = self.client.get(
+            "/api/v1/heatmap/", data={"bbox": "76.2,9.9,76.3,10.0", "res": 5}
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class RideTileTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client = APIClient()
+
+        cls.driver = get_user_model().objects.create_user(
+            username="testdriver",
+            email="testdriver@email.com",
+            password="secretpassword",
+        )
+
+    def setUp(self):
+        location.clear()
+        tiles.clear()
+        self.client.login(username="testdriver", password="secretpassword")
+
+    def tile_url(self, longitude, latitude, z=14):
+        n = 2**z
+        x = int((longitude + 180.0) / 360.0 * n)
+        y = int(
+            (1.0 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2.0 * n
+        )
+        return f"/api/v1/tiles/{z}/{x}/{y}.mvt"
+
+    def create_ride(self, longitude, latitude):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Ride.objects.create(
+                driver=self.driver,
+                current_location=Point(longitude, latitude, srid=4326),
+                pickup_location=Point(longitude, latitude, srid=4326),
+                dropoff_location=Point(76.2144, 10.5276, srid=4326),
+                status="PENDING",
+            )
+
+    def test_tile_with_open_ride(self):
+        self.create_ride(76.2606304, 9.9340738)
+        response = self.client.get(self.tile_url(76.2606304, 9.9340738))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/vnd.mapbox-vector-tile")
+        self.assertIn(b"rides", response.content)
+        self.assertIn(b"pickups", response.content)
+
+    def test_empty_tile(self):
+        response = self.client.get(self.tile_url(-0.1276, 51.5072))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, b"")
+
+    def test_clustered_tile(self):
+        self.create_ride(76.2606304, 9.9340738)
+        self.create_ride(76.2616304, 9.9350738)
+        response = self.client.get(self.tile_url(76.2606304, 9.9340738, z=6))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(b"point_count", response.content)
+
+    def test_tile_is_cached(self):
+        self.create_ride(76.2606304, 9.9340738)
+        url = self.tile_url(76.2606304, 9.9340738)
+        first = self.client.get(url)
+
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(url)
+        self.assertEqual(second.content, first.content)
+        self.assertFalse([query for query in queries if "rides_ride" in query["sql"]])
+
+    def test_tile_invalidated_when_ride_moves(self):
+        ride = self.create_ride(76.2606304, 9.9340738)
+        kozhikode = self.tile_url(75.7904, 11.2688)
+        self.assertEqual(self.client.get(kozhikode).content, b"")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            write_ride_location(ride.pk, Point(75.7904, 11.2688, srid=4326))
+        self.assertIn(b"rides", self.client.get(kozhikode).content)
+
+    def test_tile_invalidated_by_another_process(self):
+        ride = self.create_ride(76.2606304, 9.9340738)
+        kozhikode = self.tile_url(75.7904, 11.2688)
+        self.assertEqual(self.client.get(kozhikode).content, b"")
+
+        # The tracker moves the ride from a Celery worker, with a local memory
+        # cache of its own.
+        worker_cache = {
+            "default": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": "worker",
+            }
+        }
+        with override_settings(CACHES=worker_cache):
+            with self.captureOnCommitCallbacks(execute=True):
+                write_ride_location(ride.pk, Point(75.7904, 11.2688, srid=4326))
+        self.assertIn(b"rides", self.client.get(kozhikode).content)
+
+    def test_tile_invalidated_when_ride_is_taken(self):
+        ride = self.create_ride(76.2606304, 9.9340738)
+        url = self.tile_url(76.2606304, 9.9340738)
+        self.assertIn(b"rides", self.client.get(url).content)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ride.status = "CANCELLED"
+            ride.save()
+        self.assertEqual(self.client.get(url).content, b"")
+        self.assertFalse(get_redis().exists(tiles.footprint_key(ride.pk)))
+
+    def test_tile_rendered_before_a_write_is_not_cached(self):
+        ride = self.create_ride(76.2606304, 9.9340738)
+        url = self.tile_url(76.2606304, 9.9340738)
+        render_tile = tiles.render_tile
+
+        def render_then_cancel(z, x, y):
+            # The ride is taken while the tile renders from the old data.
+            tile = render_tile(z, x, y)
+            with self.captureOnCommitCallbacks(execute=True):
+                Ride.objects.filter(pk=ride.pk).update(status="CANCELLED")
+                tiles.rides_changed([ride.pk])
+            return tile
+
+        with mock.patch.object(tiles, "render_tile", side_effect=render_then_cancel):
+            self.assertIn(b"rides", self.client.get(url).content)
+        self.assertEqual(self.client.get(url).content, b"")
+
+    def test_invalid_tile(self):
+        response = self.client.get("/api/v1/tiles/2/4/0.mvt")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_tile_as_unauthenticated_user(self):
+        self.client.logout()
+        response = self.client.get("/api/v1/tiles/0/0/0.mvt")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class SchemaTests(TestCase):
+    def setUp(self):
+        schema_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(schema_dir.cleanup)
+        settings_override = override_settings(OPENAPI_SCHEMA_DIR=schema_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_schema_served_from_artifact(self):
+        call_command("build_schema", stdout=StringIO())
+        response = self.client.get("/api/schema/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn(b"/api/v1/rides/", gzip.decompress(response.content))
+        self.assertTrue(response.has_header("ETag"))
+
+        not_modified = self.client.get(
+            "/api/schema/", HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_json_schema_served_from_artifact(self):
+        call_command("build_schema", stdout=StringIO())
+        response = self.client.get("/api/schema/", data={"format": "json"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/vnd.oai.openapi+json")
+        self.assertIn("/api/v1/rides/", response.json()["paths"])
+
+    def test_schema_generated_without_artifact(self):
+        response = self.client.get("/api/schema/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(b"/api/v1/rides/", response.content)
+
+
+class BulkRideStatusTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client = APIClient()
+
+        cls.staff = get_user_model().objects.create_user(
+            username="teststaff",
+            email="teststaff@email.com",
+            password="secretpassword",
+            is_staff=True,
+        )
+
+        cls.driver = get_user_model().objects.create_user(
+            username="testdriver",
+            email="testdriver@email.com",
+            password="secretpassword",
+        )
+
+        kochi = Point(76.2606304, 9.9340738, srid=4326)
+        kozhikode = Point(75.7804, 11.2588, srid=4326)
+        cls.rides = {}
+        for name, location, ride_status in (
+            ("pending", kochi, "PENDING"),
+            ("started", kochi, "STARTED"),
+            ("completed", kochi, "COMPLETED"),
+            ("elsewhere", kozhikode, "PENDING"),
+        ):
+            cls.rides[name] = Ride.objects.create(
+                driver=cls.driver,
+                current_location=location,
+                pickup_location=location,
+                dropoff_location=kozhikode,
+                status=ride_status,
+            )
+
+    def statuses(self):
+        return dict(
+            Ride.objects.filter(
+                pk__in=[ride.pk for ride in self.rides.values()]
+            ).values_list("pk", "status")
+        )
+
+    def test_bulk_cancel_rides_in_bbox(self):
+        self.client.login(username="teststaff", password="secretpassword")
+        response = self.client.post(
+            "/api/v1/rides/bulk-status/",
+            data={"status": "CANCELLED", "bbox": "76.2,9.9,76.3,10.0"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["updated"], 2)
+
+        statuses = self.statuses()
+        self.assertEqual(statuses[self.rides["pending"].pk], "CANCELLED")
+        self.assertEqual(statuses[self.rides["started"].pk], "CANCELLED")
+        self.assertEqual(statuses[self.rides["completed"].pk], "COMPLETED")
+        self.assertEqual(statuses[self.rides["elsewhere"].pk], "PENDING")
+        self.assertEqual(
+            sorted(
+                OutboxMessage.objects.filter(topic="tracking.stop").values_list(
+                    "payload__ride_id", flat=True
+                )
+            ),
+            sorted([self.rides["pending"].pk, self.rides["started"].pk]),
+        )
+
+    def test_bulk_status_with_polygon_and_status_filter(self):
+        self.client.login(username="teststaff", password="secretpassword")
+        response = self.client.post(
+            "/api/v1/rides/bulk-status/",
+            data={
+                "status": "COMPLETED",
+                "from_statuses": ["STARTED"],
+                "polygon": "POLYGON((76.2 9.9, 76.3 9.9, 76.3 10.0, 76.2 10.0, 76.2 9.9))",
+            },
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["updated"], 1)
+        statuses = self.statuses()
+        self.assertEqual(statuses[self.rides["started"].pk], "COMPLETED")
+        self.assertEqual(statuses[self.rides["pending"].pk], "PENDING")
+
+    def test_bulk_status_with_invalid_bbox(self):
+        self.client.login(username="teststaff", password="secretpassword")
+        response = self.client.post(
+            "/api/v1/rides/bulk-status/",
+            data={"status": "CANCELLED", "bbox": "76.2,9.9"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_status_as_non_staff_user(self):
+        self.client.login(username="testdriver", password="secretpassword")
+        response = self.client.post(
+            "/api/v1/rides/bulk-status/",
+            data={"status": "CANCELLED", "bbox": "76.2,9.9,76.3,10.0"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class StandingMatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client = APIClient()
+
+        cls.driver = get_user_model().objects.create_user(
+            username="testdriver",
+            email="testdriver@email.com",
+            password="secretpassword",
+        )
+
+        cls.rider = get_user_model().objects.create_user(
+            username="testrider",
+            email="testrider@email.com",
+            password="secretpassword",
+        )
+
+        cls.kochi = Point(76.2606304, 9.9340738, srid=4326)
+        cls.kozhikode = Point(75.7804, 11.2588, srid=4326)
+        cls.standing_match = StandingMatch.objects.create(
+            rider=cls.rider,
+            pickup_location=cls.kochi,
+            destination_location=cls.kozhikode,
+            radius=500,
+            expires_at=timezone.now() + timedelta(minutes=30),
+        )
+
+    def create_ride(self, current_location, **kwargs):
+        return Ride.objects.create(
+            driver=self.driver,
+            current_location=current_location,
+            pickup_location=current_location,
+            dropoff_location=self.kozhikode,
+            **kwargs,
+        )
+
+    def test_create_standing_match(self):
+        self.client.login(username="testrider", password="secretpassword")
+        response = self.client.post(
+            "/api/v1/standing-matches/",
+            data={
+                "pickup_location": "POINT(76.2606304 9.9340738)",
+                "destination_location": "POINT(75.7804 11.2588)",
+                "radius": 1000,
+            },
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        standing_match = StandingMatch.objects.get(pk=response.data["id"])
+        self.assertEqual(standing_match.rider, self.rider)
+        self.assertGreater(standing_match.expires_at, timezone.now())
+
+    def test_create_standing_match_with_too_large_radius(self):
+        self.client.login(username="testrider", password="secretpassword")
+        response = self.client.post(
+            "/api/v1/standing-matches/",
+            data={
+                "pickup_location": "POINT(76.2606304 9.9340738)",
+                "destination_location": "POINT(75.7804 11.2588)",
+                "radius": settings.RIDES_STANDING_MATCH_MAX_RADIUS_M + 1,
+            },
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_only_own_standing_matches(self):
+        self.client.login(username="testdriver", password="secretpassword")
+        response = self.client.get("/api/v1/standing-matches/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [])
+
+    def test_new_ride_enqueues_matching(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ride = self.create_ride(self.kochi)
+        self.assertTrue(
+            OutboxMessage.objects.filter(
+                topic="rides.matchable", payload__ride_ids=[ride.pk]
+            ).exists()
+        )
+
+    def matchable_messages(self, ride):
+        return OutboxMessage.objects.filter(
+            topic="rides.matchable", payload__ride_ids__contains=[ride.pk]
+        ).count()
+
+    def test_moves_queue_matching_once(self):
+        ride = self.create_ride(self.kochi)
+        OutboxMessage.objects.all().delete()
+        for longitude in (76.27, 76.28):
+            write_ride_location(ride.pk, Point(longitude, 9.93, srid=4326))
+        self.assertEqual(self.matchable_messages(ride), 1)
+
+        # Once published, the next move queues the ride again.
+        with mock.patch.object(match_standing_matches, "delay"):
+            relay_batch()
+        write_ride_location(ride.pk, Point(76.29, 9.93, srid=4326))
+        self.assertEqual(self.matchable_messages(ride), 1)
+
+    def test_moves_of_taken_rides_queue_nothing(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ride = self.create_ride(self.kochi, rider=self.rider)
+        write_ride_location(ride.pk, Point(76.27, 9.93, srid=4326))
+        self.assertEqual(self.matchable_messages(ride), 0)
+
+    def test_match_nearby_ride(self):
+        ride = self.create_ride(Point(76.261, 9.934, srid=4326))
+        with self.captureOnCommitCallbacks(execute=True):
+            matches = match_rides([ride.pk])
+
+        self.assertEqual(matches, [(self.standing_match.pk, ride.pk)])
+        self.standing_match.refresh_from_db()
+        self.assertEqual(self.standing_match.matched_ride_id, ride.pk)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["testrider@email.com"])
+
+        # Riders are only notified once.
+        self.assertEqual(match_rides([ride.pk]), [])
+
+    def test_ignore_distant_and_taken_rides(self):
+        distant = self.create_ride(self.kozhikode)
+        taken = self.create_ride(self.kochi, rider=self.driver)
+        self.assertEqual(match_rides([distant.pk, taken.pk]), [])
+
+    def test_ignore_expired_standing_match(self):
+        StandingMatch.objects.filter(pk=self.standing_match.pk).update(
+            expires_at=timezone.now() - timedelta(minutes=1)
+        )
+        ride = self.create_ride(self.kochi)
+        self.assertEqual(match_rides([ride.pk]), [])
+
+
+@override_settings(RIDES_EVENTS_LONG_POLL_SECONDS=0)
+@mock.patch("rides.events.ensure_listener")
+class EventTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client = APIClient()
+
+        cls.driver = get_user_model().objects.create_user(
+            username="testdriver",
+            email="testdriver@email.com",
+            password="secretpassword",
+        )
+
+    def setUp(self):
+        events.event_buffer.start_stream(10)
+
+    def tearDown(self):
+        events.event_buffer.stop_stream()
+
+    def test_events_of_the_user(self, ensure_listener):
+        self.client.login(username="testdriver", password="secretpassword")
+        cursor = events.event_buffer.cursor()
+        events.event_buffer.append(
+            [
+                {
+                    "seq": 11,
+                    "type": "ride",
+                    "id": 1,
+                    "status": "PENDING",
+                    "users": [0, None],
+                },
+                {
+                    "seq": 12,
+                    "type": "ride_request",
+                    "id": 2,
+                    "ride": 3,
+                    "status": "PENDING",
+                    "users": [0, self.driver.pk],
+                },
+            ]
+        )
+
+        response = self.client.get("/api/v1/events/", {"since": cursor})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data["events"],
+            [{"type": "ride_request", "id": 2, "ride": 3, "status": "PENDING"}],
+        )
+        self.assertFalse(response.data["reset"])
+
+        response = self.client.get(
+            "/api/v1/events/", {"since": response.data["cursor"]}
+        )
+        self.assertEqual(response.data["events"], [])
+        self.assertFalse(response.data["reset"])
+
+    def test_reset_on_unknown_cursor(self, ensure_listener):
+        self.client.login(username="testdriver", password="secretpassword")
+        response = self.client.get("/api/v1/events/", {"since": "old:5"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data["reset"])
+        self.assertEqual(response.data["cursor"], events.event_buffer.cursor())
+
+    def test_reset_on_cursor_before_the_stream(self, ensure_listener):
+        # Events up to 10 may have been sent before the listener connected.
+        self.client.login(username="testdriver", password="secretpassword")
+        response = self.client.get("/api/v1/events/", {"since": "9"})
+        self.assertTrue(response.data["reset"])
+        self.assertEqual(response.data["cursor"], "10")
+
+    def test_cursor_resumes_in_another_process(self, ensure_listener):
+        # Both processes receive the same notifications, but one has connected
+        # later and buffered fewer of them.
+        other_buffer = events.EventBuffer()
+        other_buffer.start_stream(11)
+        notifications = [
+            {"seq": seq, "type": "ride", "id": seq, "status": "PENDING", "users": [7]}
+            for seq in (11, 12, 13)
+        ]
+        events.event_buffer.append(notifications[:2])
+        other_buffer.append(notifications[1:])
+
+        found, cursor, reset = events.event_buffer.wait(None, 7, 0)
+        self.assertEqual((found, cursor, reset), ([], "12", False))
+        found, cursor, reset = other_buffer.wait(cursor, 7, 0)
+        self.assertFalse(reset)
+        self.assertEqual([event["id"] for event in found], [13])
+        self.assertEqual(cursor, "13")
+
+    def test_events_without_authenticating(self, ensure_listener):
+        response = self.client.get("/api/v1/events/")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class EventTriggerTests(TransactionTestCase):
+    def test_ride_request_changes_are_notified(self):
+        driver = get_user_model().objects.create_user(
+            username="testdriver", password="secretpassword"
+        )
+        rider = get_user_model().objects.create_user(
+            username="testrider", password="secretpassword"
+        )
+        kochi = Point(76.2606304, 9.9340738, srid=4326)
+        ride = Ride.objects.create(
+            driver=driver,
+            current_location=kochi,
+            pickup_location=kochi,
+            dropoff_location=kochi,
+        )
+
+        listener = psycopg2.connect(**connection.get_connection_params())
+        listener.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        self.addCleanup(listener.close)
+        with listener.cursor() as cursor:
+            cursor.execute(f"LISTEN {events.CHANNEL}")
+
+        ride_request = RideRequest.objects.create(ride=ride, rider=rider)
+        # Location updates are not state changes.
+        Ride.objects.filter(pk=ride.pk).update(current_location=kochi)
+
+        listener.poll()
+        payloads = [json.loads(notify.payload) for notify in listener.notifies]
+        self.assertIsInstance(payloads[0].pop("seq"), int)
+        self.assertEqual(
+            payloads,
+            [
+                {
+                    "type": "ride_request",
+                    "id": ride_request.pk,
+                    "ride": ride.pk,
+                    "status": "PENDING",
+                    "users": [rider.pk, driver.pk],
+                }
+            ],
+        )
+
+
+@override_settings(RIDES_REQUIRE_DRIVER_PRESENCE=True)
+class PresenceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client = APIClient()
+
+        cls.user = get_user_model().objects.create_user(
+            username="testuser",
+            email="testuser@email.com",
+            password="secretpassword",
+        )
+
+        cls.drivers = [
+            get_user_model().objects.create_user(
+                username=f"testdriver{index}",
+                email=f"testdriver{index}@email.com",
+                password="secretpassword",
+            )
+            for index in range(2)
+        ]
+
+        kochi = Point(76.2606304, 9.9340738, srid=4326)
+        cls.rides = [
+            Ride.objects.create(
+                driver=driver,
+                current_location=kochi,
+                pickup_location=kochi,
+                dropoff_location=kochi,
+            )
+            for driver in cls.drivers
+        ]
+
+    def setUp(self):
+        presence.clear()
+
+    def nearby(self):
+        return self.client.post(
+            "/api/v1/rides/nearby/",
+            data={
+                "user_longitude": 76.2606304,
+                "user_latitude": 9.9340738,
+                "destination_longitude": 76.2606304,
+                "destination_latitude": 9.9340738,
+            },
+        )
+
+    def test_nearby_skips_absent_drivers(self):
+        self.client.login(username="testdriver0", password="secretpassword")
+        response = self.client.post("/api/v1/heartbeat/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.client.login(username="testuser", password="secretpassword")
+        response = self.nearby()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([ride["id"] for ride in response.data], [self.rides[0].pk])
+
+    def test_drivers_drop_out_when_heartbeats_expire(self):
+        presence.heartbeat(self.drivers[1].pk)
+        self.assertEqual(
+            presence.online_drivers([driver.pk for driver in self.drivers]),
+            {self.drivers[1].pk},
+        )
+        get_redis().delete(presence.presence_key(self.drivers[1].pk))
+        self.assertEqual(presence.online_rides(self.rides), [])
+
+    def test_presence_is_shared_between_processes(self):
+        # A heartbeat through one web worker, read by a Celery worker with a
+        # local memory cache and a Redis connection of its own.
+        presence.heartbeat(self.drivers[0].pk)
+        other_client = redis.Redis.from_url(settings.RIDES_REDIS_URL)
+        self.addCleanup(other_client.close)
+        self.assertTrue(other_client.exists(presence.presence_key(self.drivers[0].pk)))
+
+        worker_cache = {
+            "default": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": "worker",
+            }
+        }
+        with override_settings(CACHES=worker_cache), mock.patch.object(
+            presence, "get_redis", return_value=other_client
+        ):
+            self.assertEqual(
+                presence.online_drivers([driver.pk for driver in self.drivers]),
+                {self.drivers[0].pk},
+            )
+
+    @override_settings(RIDES_REQUIRE_DRIVER_PRESENCE=False)
+    def test_presence_not_required(self):
+        self.assertEqual(presence.online_rides(self.rides), self.rides)
+
+
+ROAD_NETWORK_OSM = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="1" lat="9.930" lon="76.260"/>
+  <node id="2" lat="9.930" lon="76.262"/>
+  <node id="3" lat="9.930" lon="76.264"/>
+  <node id="4" lat="9.933" lon="76.260"/>
+  <node id="5" lat="9.933" lon="76.262"/>
+  <node id="6" lat="9.950" lon="76.300"/>
+  <way id="10">
+    <nd ref="1"/><nd ref="2"/><nd ref="3"/>
+    <tag k="highway" v="residential"/>
+  </way>
+  <way id="11">
+    <nd ref="4"/><nd ref="5"/>
+    <tag k="highway" v="primary"/>
+    <tag k="oneway" v="yes"/>
+  </way>
+  <way id="12">
+    <nd ref="5"/><nd ref="6"/>
+    <tag k="highway" v="footway"/>
+  </way>
+</osm>
+"""
+
+
+class RoutingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client = APIClient()
+
+        cls.user = get_user_model().objects.create_user(
+            username="testuser",
+            email="testuser@email.com",
+            password="secretpassword",
+        )
+
+        cls.driver = get_user_model().objects.create_user(
+            username="testdriver",
+            email="testdriver@email.com",
+            password="secretpassword",
+        )
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        osm_path = f"{directory.name}/roads.osm"
+        with open(osm_path, "w") as file:
+            file.write(ROAD_NETWORK_OSM)
+        self.graph_path = f"{directory.name}/roads.graph"
+        call_command(
+            "build_road_graph", osm_path, output=self.graph_path, stdout=StringIO()
+        )
+
+    def test_eta_follows_roads(self):
+        with override_settings(RIDES_ROAD_GRAPH_PATH=self.graph_path):
+            etas = routing.eta_seconds(
+                [
+                    Point(76.264, 9.930, srid=4326),
+                    Point(76.262, 9.933, srid=4326),
+                    Point(76.300, 9.950, srid=4326),
+                ],
+                Point(76.260, 9.930, srid=4326),
+            )
+            # 438 m of residential road at 25 km/h, the other roads don't
+            # connect and footways aren't drivable.
+            self.assertAlmostEqual(etas[0], 63, delta=1)
+            self.assertEqual(etas[1:], [None, None])
+
+            # The primary road is one-way.
+            forward, backward = (
+                routing.eta_seconds([Point(*start, srid=4326)], Point(*end, srid=4326))[
+                    0
+                ]
+                for start, end in (
+                    ((76.260, 9.933), (76.262, 9.933)),
+                    ((76.262, 9.933), (76.260, 9.933)),
+                )
+            )
+            self.assertIsNotNone(forward)
+            self.assertIsNone(backward)
+
+    def test_no_eta_without_road_graph(self):
+        location = Point(76.260, 9.930, srid=4326)
+        self.assertIsNone(routing.eta_seconds([location], location))
+
+    def test_nearby_orders_by_eta(self):
+        destination = Point(76.2605, 9.9305, srid=4326)
+        across = Ride.objects.create(
+            driver=self.driver,
+            current_location=Point(76.260, 9.933, srid=4326),
+            pickup_location=Point(76.260, 9.933, srid=4326),
+            dropoff_location=destination,
+        )
+        along = Ride.objects.create(
+            driver=self.driver,
+            current_location=Point(76.264, 9.930, srid=4326),
+            pickup_location=Point(76.264, 9.930, srid=4326),
+            dropoff_location=destination,
+        )
+
+        self.client.login(username="testuser", password="secretpassword")
+        with override_settings(RIDES_ROAD_GRAPH_PATH=self.graph_path):
+            response = self.client.post(
+                "/api/v1/rides/nearby/",
+                data={
+                    "user_longitude": 76.260,
+                    "user_latitude": 9.930,
+                    "destination_longitude": destination.x,
+                    "destination_latitude": destination.y,
+                },
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # The closer ride has no road to the user, so it comes last.
+        self.assertEqual(
+            [(ride["id"], ride["eta_seconds"] is None) for ride in response.data],
+            [(along.pk, False), (across.pk, True)],
+        )
+
+
+class MapMatchingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.driver = get_user_model().objects.create_user(
+            username="testdriver",
+            email="testdriver@email.com",
+            password="secretpassword",
+        )
+
+        cls.ride = Ride.objects.create(
+            driver=cls.driver,
+            current_location=Point(76.260, 9.930, srid=4326),
+            pickup_location=Point(76.260, 9.930, srid=4326),
+            dropoff_location=Point(76.264, 9.930, srid=4326),
+        )
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        osm_path = f"{directory.name}/roads.osm"
+        with open(osm_path, "w") as file:
+            file.write(ROAD_NETWORK_OSM)
+        self.graph_path = f"{directory.name}/roads.graph"
+        call_command(
+            "build_road_graph", osm_path, output=self.graph_path, stdout=StringIO()
+        )
+        get_redis().delete(traces.PENDING_KEY, traces.pings_key(self.ride.pk))
+
+    def test_matcher_snaps_pings_onto_roads(self):
+        with override_settings(RIDES_ROAD_GRAPH_PATH=self.graph_path):
+            matched = routing.get_map_matcher().match(
+                [
+                    (76.2605, 9.9302),
+                    (76.2615, 9.9298),
+                    (76.2625, 9.9303),
+                    # Too far from any road.
+                    (76.280, 9.940),
+                ]
+            )
+        for longitude, latitude in matched[:3]:
+            self.assertAlmostEqual(latitude, 9.930, places=6)
+        self.assertEqual(
+            [round(longitude, 4) for longitude, _ in matched[:3]],
+            [76.2605, 76.2615, 76.2625],
+        )
+        self.assertIsNone(matched[3])
+
+    def test_buffered_locations_are_matched(self):
+        with override_settings(RIDES_ROAD_GRAPH_PATH=self.graph_path):
+            with self.captureOnCommitCallbacks(execute=True):
+                write_ride_location(
+                    self.ride.pk, Point(76.2610, 9.9302, srid=4326), force=True
+                )
+            with self.captureOnCommitCallbacks(execute=True):
+                write_ride_location(
+                    self.ride.pk, Point(76.2620, 9.9298, srid=4326), force=True
+                )
+            self.assertEqual(traces.match_pending_traces(), 2)
+
+        points = RideTracePoint.objects.filter(ride=self.ride).order_by("recorded_at")
+        self.assertEqual(
+            [(point.raw_location.y, round(point.location.y, 6)) for point in points],
+            [(9.9302, 9.930), (9.9298, 9.930)],
+        )
+        # The buffer was drained.
+        self.assertEqual(traces.match_pending_traces(), 0)
+
+    def test_failed_matching_keeps_pings_pending(self):
+        with override_settings(RIDES_ROAD_GRAPH_PATH=self.graph_path):
+            with self.captureOnCommitCallbacks(execute=True):
+                write_ride_location(
+                    self.ride.pk, Point(76.2610, 9.9302, srid=4326), force=True
+                )
+            with mock.patch.object(
+                RideTracePoint.objects, "bulk_create", side_effect=DatabaseError
+            ):
+                with self.assertRaises(DatabaseError):
+                    traces.match_pending_traces()
+            self.assertEqual(traces.match_pending_traces(), 1)
+        self.assertEqual(RideTracePoint.objects.filter(ride=self.ride).count(), 1)
+
+    def test_matching_fans_out_per_batch(self):
+        get_redis().sadd(traces.PENDING_KEY, 1, 2, 3)
+        with override_settings(RIDES_TRACE_BATCH_RIDES=2), mock.patch.object(
+            match_ride_trace_batch, "delay"
+        ) as delay:
+            self.assertEqual(match_ride_traces(), 2)
+        self.assertEqual(delay.call_count, 2)
+
+    def test_no_buffering_without_road_graph(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            write_ride_location(
+                self.ride.pk, Point(76.2610, 9.9302, srid=4326), force=True
+            )
+        self.assertFalse(get_redis().exists(traces.pings_key(self.ride.pk)))
+
+
+class RollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client = APIClient()
+
+        cls.staff = get_user_model().objects.create_user(
+            username="teststaff",
+            email="teststaff@email.com",
+            password="secretpassword",
+            is_staff=True,
+        )
+
+        cls.driver = get_user_model().objects.create_user(
+            username="testdriver",
+            email="testdriver@email.com",
+            password="secretpassword",
+        )
+
+        cls.rider = get_user_model().objects.create_user(
+            username="testrider",
+            email="testrider@email.com",
+            password="secretpassword",
+        )
+
+        cls.hour = datetime(2026, 1, 5, 10, tzinfo=dt_timezone.utc)
+        cls.cell = geohash_encode(76.2606304, 9.9340738, 5)
+
+    def create_ride(self, ride_status, hour, rider=None):
+        # The driver starts about a kilometre from the pickup.
+        ride = Ride.objects.create(
+            driver=self.driver,
+            rider=rider,
+            current_location=Point(76.2706304, 9.9340738, srid=4326),
+            pickup_location=Point(76.2606304, 9.9340738, srid=4326),
+            dropoff_location=Point(76.2706304, 9.9440738, srid=4326),
+            status=ride_status,
+        )
+        Ride.objects.filter(pk=ride.pk).update(created_at=hour + timedelta(minutes=5))
+        ride.refresh_from_db()
+        return ride
+
+    def ride_counts(self):
+        return {
+            (rollup.hour, rollup.cell, rollup.status): rollup.rides
+            for rollup in RideRollup.objects.all()
+        }
+
+    def test_refresh_counts_changed_hours(self):
+        completed = self.create_ride("COMPLETED", self.hour)
+        cancelled = self.create_ride("CANCELLED", self.hour)
+        pending = self.create_ride("PENDING", self.hour + timedelta(hours=1))
+        request = RideRequest.objects.create(ride=pending, rider=self.rider)
+        RideRequest.objects.filter(pk=request.pk).update(
+            created_at=self.hour + timedelta(hours=1, minutes=10)
+        )
+
+        self.assertEqual(rollups.refresh_rollups(), 2)
+        self.assertEqual(
+            self.ride_counts(),
+            {
+                (self.hour, self.cell, "COMPLETED"): 1,
+                (self.hour, self.cell, "CANCELLED"): 1,
+                (self.hour + timedelta(hours=1), self.cell, "PENDING"): 1,
+            },
+        )
+        self.assertEqual(
+            RideRequestRollup.objects.get(status="PENDING").hour,
+            self.hour + timedelta(hours=1),
+        )
+
+        # Only the hour of the changed ride is recomputed.
+        Ride.objects.filter(pk=completed.pk).update(updated_at=timezone.now())
+        Ride.objects.filter(pk__in=[cancelled.pk, pending.pk]).update(
+            updated_at=timezone.now() - timedelta(days=1)
+        )
+        RideRequest.objects.filter(pk=request.pk).update(
+            updated_at=timezone.now() - timedelta(days=1)
+        )
+        Ride.objects.filter(pk=pending.pk).update(status="CANCELLED")
+        self.assertEqual(rollups.refresh_rollups(), 1)
+        self.assertEqual(
+            self.ride_counts()[(self.hour + timedelta(hours=1), self.cell, "PENDING")],
+            1,
+        )
+
+        # Archived rides still count.
+        Ride.objects.filter(pk=completed.pk).update(
+            updated_at=timezone.now() - timedelta(days=1)
+        )
+        archive_finished_rides(older_than=timedelta(0))
+        self.assertEqual(rollups.refresh_rollups(rebuild=True), 2)
+        self.assertEqual(
+            self.ride_counts(),
+            {
+                (self.hour, self.cell, "COMPLETED"): 1,
+                (self.hour, self.cell, "CANCELLED"): 1,
+                (self.hour + timedelta(hours=1), self.cell, "CANCELLED"): 1,
+            },
+        )
+
+    def test_deleted_rides_mark_their_hour_stale(self):
+        ride = self.create_ride("PENDING", self.hour)
+        rollups.refresh_rollups()
+        ride.delete()
+        self.assertEqual(
+            list(
+                OutboxMessage.objects.filter(topic="rollups.stale").values_list(
+                    "payload", flat=True
+                )
+            ),
+            [{"hour": self.hour.isoformat()}],
+        )
+
+        rollups.refresh_hours([self.hour])
+        self.assertEqual(self.ride_counts(), {})
+
+    def test_pickup_distance_is_kept_once_matched(self):
+        ride = self.create_ride("PENDING", self.hour)
+        self.assertIsNone(ride.pickup_distance_m)
+
+        ride.rider = self.rider
+        ride.save()
+        ride.refresh_from_db()
+        self.assertAlmostEqual(ride.pickup_distance_m, 1097, delta=5)
+
+        # The driver reaching the pickup doesn't change it.
+        ride.current_location = ride.pickup_location
+        ride.status = "STARTED"
+        ride.save()
+        ride.refresh_from_db()
+        self.assertAlmostEqual(ride.pickup_distance_m, 1097, delta=5)
+
+    def test_rollups_report(self):
+        self.create_ride("COMPLETED", self.hour, rider=self.rider)
+        self.create_ride("CANCELLED", self.hour + timedelta(hours=1))
+        self.create_ride("COMPLETED", self.hour + timedelta(hours=2))
+        rollups.refresh_rollups()
+
+        self.client.login(username="teststaff", password="secretpassword")
+        response = self.client.get(
+            "/api/v1/rollups/",
+            data={
+                "since": self.hour.isoformat(),
+                "until": (self.hour + timedelta(hours=2)).isoformat(),
+                "interval": "day",
+                "cell": self.cell[:3],
+            },
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        [row] = response.data["rows"]
+        self.assertEqual(row["period"], self.hour.replace(hour=0))
+        self.assertEqual(row["cell"], self.cell)
+        self.assertEqual(row["rides"], {"COMPLETED": 1, "CANCELLED": 1})
+        self.assertEqual(row["completion_rate"], 0.5)
+        self.assertEqual(row["cancellation_rate"], 0.5)
+        # The cancelled ride never had a rider.
+        self.assertAlmostEqual(row["average_pickup_m"], 1097, delta=5)
+
+    def test_rollups_for_staff_only(self):
+        self.client.login(username="testrider", password="secretpassword")
+        response = self.client.get(
+            "/api/v1/rollups/", data={"since": self.hour.isoformat()}
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_rollups_with_invalid_range(self):
+        self.client.login(username="teststaff", password="secretpassword")
+        response = self.client.get("/api/v1/rollups/", data={"since": "yesterday"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(
+            "/api/v1/rollups/",
+            data={"since": (self.hour - timedelta(days=365)).isoformat()},
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client = APIClient()
+
+        cls.staff = get_user_model().objects.create_user(
+            username="teststaff",
+            email="teststaff@email.com",
+            password="secretpassword",
+            is_staff=True,
+        )
+
+        cls.driver = get_user_model().objects.create_user(
+            username="testdriver",
+            email="testdriver@email.com",
+            password="secretpassword",
+        )
+
+        cls.rider = get_user_model().objects.create_user(
+            username="testrider",
+            email="testrider@email.com",
+            password="secretpassword",
+        )
+
+        cls.rides = [
+            Ride.objects.create(
+                driver=cls.driver,
+                current_location=Point(76.26 + index / 100, 9.93, srid=4326),
+                pickup_location=Point(76.26 + index / 100, 9.93, srid=4326),
+                dropoff_location=Point(75.7804, 11.2588, srid=4326),
+            )
+            for index in range(3)
+        ]
+        RideRequest.objects.create(ride=cls.rides[0], rider=cls.rider)
+        RideTracePoint.objects.create(
+            ride=cls.rides[1],
+            recorded_at=timezone.now(),
+            raw_location=Point(76.2701, 9.9302, srid=4326),
+            location=Point(76.2701, 9.9300, srid=4326),
+        )
+
+    def export(self, model, **params):
+        response = self.client.get(f"/api/v1/export/{model}/", data=params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        return [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).decode().splitlines()
+        ]
+
+    def test_export_streams_ndjson(self):
+        self.client.login(username="teststaff", password="secretpassword")
+        rows = self.export("rides", trajectories="1")
+        self.assertEqual([row["id"] for row in rows], [ride.pk for ride in self.rides])
+        self.assertAlmostEqual(rows[1]["pickup_longitude"], 76.27)
+        self.assertEqual(rows[0]["trajectory"], [])
+        [point] = rows[1]["trajectory"]
+        self.assertEqual((point["raw_latitude"], point["latitude"]), (9.9302, 9.93))
+
+        [request] = self.export("requests")
+        self.assertEqual(
+            (request["ride_id"], request["status"], request["archived"]),
+            (self.rides[0].pk, "PENDING", False),
+        )
+
+    def test_export_since_watermark(self):
+        for days, ride in zip((3, 2, 1), self.rides):
+            Ride.objects.filter(pk=ride.pk).update(
+                updated_at=timezone.now() - timedelta(days=days)
+            )
+        output = StringIO()
+        call_command(
+            "export_rides",
+            "rides",
+            output=os.devnull,
+            since=(timezone.now() - timedelta(days=2.5)).isoformat(),
+            stderr=output,
+        )
+        self.assertIn("Exported 2 rides", output.getvalue())
+
+        latest = Ride.objects.get(pk=self.rides[2].pk).updated_at
+        self.assertIn(f"watermark {latest.isoformat()}", output.getvalue())
+
+        since = Ride.objects.get(pk=self.rides[1].pk).updated_at
+        self.client.login(username="teststaff", password="secretpassword")
+        response = self.client.get(
+            "/api/v1/export/rides/", data={"since": since.isoformat()}
+        )
+        self.assertEqual(response["X-Export-Watermark"], latest.isoformat())
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).decode().splitlines()
+        ]
+        # Rows updated within the overlap before since are exported again.
+        self.assertEqual(
+            [row["id"] for row in rows], [self.rides[1].pk, self.rides[2].pk]
+        )
+
+        with self.settings(RIDES_EXPORT_OVERLAP_SECONDS=0):
+            rows = self.export("rides", since=since.isoformat())
+        self.assertEqual([row["id"] for row in rows], [self.rides[2].pk])
+
+    def test_export_stops_at_its_watermark(self):
+        export = Export("rides")
+        watermark = export.bound()
+        self.assertEqual(watermark, Ride.objects.latest("updated_at").updated_at)
+
+        # Written once the export started, so left to the next one.
+        Ride.objects.filter(pk=self.rides[0].pk).update(
+            updated_at=timezone.now() + timedelta(seconds=1)
+        )
+        rows = b"".join(export.stream("ndjson")).decode().splitlines()
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(export.watermark, watermark)
+
+    def test_export_includes_archive(self):
+        Ride.objects.filter(pk=self.rides[2].pk).update(
+            status="COMPLETED", updated_at=timezone.now() - timedelta(days=60)
+        )
+        archive_finished_rides()
+
+        self.client.login(username="teststaff", password="secretpassword")
+        self.assertEqual(len(self.export("rides")), 2)
+        rows = self.export("rides", archived="1")
+        self.assertEqual(
+            [(row["id"], row["archived"]) for row in rows][-1],
+            (self.rides[2].pk, True),
+        )
+
+    def test_export_for_staff_only(self):
+        self.client.login(username="testrider", password="secretpassword")
+        response = self.client.get("/api/v1/export/rides/")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_export_with_invalid_params(self):
+        self.client.login(username="teststaff", password="secretpassword")
+        response = self.client.get("/api/v1/export/users/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get("/api/v1/export/rides/", data={"format": "csv"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get("/api/v1/export/rides/", data={"since": "soon"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RideFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client = APIClient()
+
+        cls.driver = get_user_model().objects.create_user(
+            username="testdriver",
+            email="testdriver@email.com",
+            password="secretpassword",
+        )
+
+        cls.rider = get_user_model().objects.create_user(
+            username="testrider",
+            email="testrider@email.com",
+            password="secretpassword",
+        )
+
+        cls.kochi = Ride.objects.create(
+            driver=cls.driver,
+            rider=cls.rider,
+            current_location=Point(76.2606304, 9.9340738, srid=4326),
+            pickup_location=Point(76.2606304, 9.9340738, srid=4326),
+            dropoff_location=Point(75.7804, 11.2588, srid=4326),
+            status="COMPLETED",
+        )
+        cls.kozhikode = Ride.objects.create(
+            driver=cls.rider,
+            current_location=Point(75.7804, 11.2588, srid=4326),
+            pickup_location=Point(75.7804, 11.2588, srid=4326),
+            dropoff_location=Point(76.2606304, 9.9340738, srid=4326),
+        )
+        Ride.objects.filter(pk=cls.kochi.pk).update(
+            created_at=timezone.now() - timedelta(days=10)
+        )
+
+    def list_ids(self, **params):
+        response = self.client.get("/api/v1/rides/", data=params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(ride["id"] for ride in response.data)
+
+    def test_filter_rides(self):
+        self.client.login(username="testrider", password="secretpassword")
+        self.assertEqual(self.list_ids(role="rider"), [self.kochi.pk])
+        self.assertEqual(self.list_ids(role="driver"), [self.kozhikode.pk])
+        self.assertEqual(self.list_ids(status="PENDING,STARTED"), [self.kozhikode.pk])
+        self.assertEqual(
+            self.list_ids(
+                created_after=(timezone.now() - timedelta(days=11)).isoformat(),
+                created_before=(timezone.now() - timedelta(days=9)).isoformat(),
+            ),
+            [self.kochi.pk],
+        )
+        self.assertEqual(self.list_ids(bbox="76.2,9.9,76.3,10.0"), [self.kochi.pk])
+        self.assertEqual(self.list_ids(role="rider", bbox="75.7,11.2,75.8,11.3"), [])
+
+        response = self.client.get("/api/v1/rides/history/", data={"status": "PENDING"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([ride["id"] for ride in response.data], [self.kozhikode.pk])
+
+    def test_filter_rides_with_invalid_params(self):
+        self.client.login(username="testrider", password="secretpassword")
+        for params in (
+            {"role": "owner"},
+            {"status": "DONE"},
+            {"created_after": "last week"},
+            {"bbox": "76.3,9.9,76.2,10.0"},
+        ):
+            with self.subTest(params=params):
+                response = self.client.get("/api/v1/rides/", data=params)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filters_never_scan_rides(self):
+        # Every combination of filters must be answerable from an index. With
+        # sequential scans disabled the planner only picks one when no index
+        # applies.
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+        created = {
+            "created_after": (timezone.now() - timedelta(days=30)).isoformat(),
+            "created_before": timezone.now().isoformat(),
+        }
+        for role, ride_status, created_range, bbox in product(
+            (None, "driver", "rider"),
+            (None, "COMPLETED", "PENDING,STARTED"),
+            (None, created),
+            (None, "76.2,9.9,76.3,10.0"),
+        ):
+            params = dict(created_range or {})
+            if role:
+                params["role"] = role
+            if ride_status:
+                params["status"] = ride_status
+            if bbox:
+                params["bbox"] = bbox
+            if not params:
+                continue
+            with self.subTest(params=params):
+                plan = filter_rides(Ride.objects.all(), params, self.driver).explain()
+                self.assertNotIn("Seq Scan", plan)
+
+        # History, with and without filters.
+        involved = Q(driver=self.driver) | Q(rider=self.driver)
+        for model, params in product(
+            (Ride, ArchivedRide), ({}, {"status": "COMPLETED", **created})
+        ):
+            with self.subTest(model=model, params=params):
+                plan = filter_rides(
+                    model.objects.filter(involved), params, self.driver
+                ).explain()
+                self.assertNotIn("Seq Scan", plan)
@@ -0,0 +1,107 @@
+import redis
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from .connections import get_redis
+
+# Token bucket throttles kept in Redis, so every API process shares the same
+# buckets. Rates come from REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"], keyed by the
+# view's throttle_scope or, on viewsets, the action name, e.g. "nearby" for the
+# per-user rate and "nearby_ip" for the per-IP rate. Scopes without a rate are
+# not throttled.
+
+# Refills the bucket for the time passed since the last request and takes one
+# token. Returns whether the request is allowed, and otherwise the milliseconds
+# until the next token.
+TOKEN_BUCKET_SCRIPT = """
+if redis.replicate_commands then
+    redis.replicate_commands()
+end
+local capacity = tonumber(ARGV[1])
+local refill_ms = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) / refill_ms)
+local allowed = 0
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    wait = math.ceil((1 - tokens) * refill_ms)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity * refill_ms))
+return {allowed, wait}
+"""
+
+DURATIONS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate):
+    # "30/min" -> (30, 60), like SimpleRateThrottle.parse_rate.
+    num, period = rate.split("/")
+    return int(num), DURATIONS[period[0]]
+
+
+def bucket_key(scope, ident):
+    return f"rides:throttle:{scope}:{ident}"
+
+
+class TokenBucketThrottle(BaseThrottle):
+    rate_suffix = ""
+
+    def get_scope(self, view):
+        return getattr(view, "throttle_scope", None) or getattr(view, "action", None)
+
+    def get_bucket_ident(self, request):
+        raise NotImplementedError(".get_bucket_ident() must be overridden")
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+
+        scope = self.get_scope(view)
+        if scope is None:
+            return True
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(f"{scope}{self.rate_suffix}")
+        if rate is None:
+            return True
+        ident = self.get_bucket_ident(request)
+        if ident is None:
+            return True
+
+        capacity, duration = parse_rate(rate)
+        client = get_redis()
+        try:
+            allowed, wait_ms = client.register_script(TOKEN_BUCKET_SCRIPT)(
+                keys=[bucket_key(scope, ident)],
+                args=[capacity, duration * 1000 / capacity],
+            )
+        except redis.RedisError:
+            # Fail open, an unavailable Redis shouldn't take the API down.
+            return True
+
+        if allowed:
+            return True
+        self.wait_seconds = wait_ms / 1000
+        return False
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    def get_bucket_ident(self, request):
+        if request.user and request.user.is_authenticated:
+            return f"user:{request.user.pk}"
+        return None
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    rate_suffix = "_ip"
+
+    def get_bucket_ident(self, request):
+        return f"ip:{self.get_ident(request)}"
@@ -0,0 +1,270 @@
+import json
+import math
+
+import redis
+from django.conf import settings
+from django.db import connection, transaction
+
+from .connections import get_redis
+from .models import Ride
+
+
+# Mapbox Vector Tiles of open rides, rendered by PostGIS with ST_AsMVT.
+# Rendered tiles are cached per zoom level up to RIDES_TILES_CACHE_MAX_ZOOM. Each
+# open ride remembers the cached tiles its points fall into, and those tiles are
+# dropped whenever the ride moves, changes status or is deleted. Tiles and
+# footprints live in the shared Redis, since the invalidating writes mostly
+# happen in Celery workers. If Redis is unavailable, tiles are rendered for
+# every request and missed invalidations expire with RIDES_TILES_CACHE_TIMEOUT.
+#
+# A tile rendered before a write committed could be stored after the write's
+# invalidation. Like ride detail, each tile has a generation bumped by every
+# invalidation, and a rendered tile is stored only if the generation read before
+# rendering hasn't moved.
+
+EXTENT = 4096
+BUFFER = 64
+WEB_MERCATOR_WIDTH = 2 * 20037508.342789244
+
+LAYERS = (
+    ("rides", "current_location"),
+    ("pickups", "pickup_location"),
+    ("dropoffs", "dropoff_location"),
+)
+
+OPEN_RIDES = "status = 'PENDING' AND rider_id IS NULL"
+
+POINTS_SQL = f"""
+SELECT ST_AsMVT(tile, %(layer_{{index}})s, {EXTENT}, 'geom') FROM (
+    SELECT id, ST_AsMVTGeom(
+        ST_Transform({{column}}::geometry, 3857),
+        ST_TileEnvelope(%(z)s, %(x)s, %(y)s),
+        {EXTENT},
+        {BUFFER},
+        true
+    ) AS geom
+    FROM rides_ride
+    WHERE {OPEN_RIDES} AND {{bounds}}
+) AS tile WHERE geom IS NOT NULL
+"""
+
+# Below RIDES_TILES_CLUSTER_MAX_ZOOM points are snapped to a grid and every grid
+# cell becomes one feature carrying the number of points it stands for.
+CLUSTERS_SQL = f"""
+SELECT ST_AsMVT(tile, %(layer_{{index}})s, {EXTENT}, 'geom') FROM (
+    SELECT count(*) AS point_count, ST_AsMVTGeom(
+        ST_Centroid(ST_Collect(geom)),
+        ST_TileEnvelope(%(z)s, %(x)s, %(y)s),
+        {EXTENT},
+        {BUFFER},
+        true
+    ) AS geom
+    FROM (
+        SELECT ST_Transform({{column}}::geometry, 3857) AS geom
+        FROM rides_ride
+        WHERE {OPEN_RIDES} AND {{bounds}}
+    ) AS points
+    GROUP BY ST_SnapToGrid(geom, %(grid)s)
+) AS tile WHERE geom IS NOT NULL
+"""
+
+# Lets the GiST index on the geography column drive the scan. The envelope is
+# densified first so its edges follow the tile instead of great circles.
+BOUNDS_SQL = (
+    "{column} && ST_Segmentize(ST_Transform(ST_TileEnvelope("
+    f"%(z)s, %(x)s, %(y)s, margin => {BUFFER / EXTENT}), 4326), 0.5)::geography"
+)
+
+
+# Stores ARGV[2] under KEYS[1] for ARGV[3] seconds unless the generation in
+# KEYS[2] is no longer ARGV[1].
+SET_IF_GENERATION_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+
+def is_valid_tile(z, x, y):
+    return (
+        0 <= z <= settings.RIDES_TILES_MAX_ZOOM and 0 <= x < 2**z and 0 <= y < 2**z
+    )
+
+
+def tile_key(z, x, y):
+    return f"rides:tiles:{z}:{x}:{y}"
+
+
+def generation_key(key):
+    return f"{key}:generation"
+
+
+def footprint_key(ride_id):
+    return f"rides:tiles:footprint:{ride_id}"
+
+
+def clear():
+    client = get_redis()
+    keys = list(client.scan_iter(match="rides:tiles:*"))
+    if keys:
+        client.delete(*keys)
+
+
+def render_tile(z, x, y):
+    template = CLUSTERS_SQL if z < settings.RIDES_TILES_CLUSTER_MAX_ZOOM else POINTS_SQL
+    layers = []
+    params = {
+        "z": z,
+        "x": x,
+        "y": y,
+        "grid": WEB_MERCATOR_WIDTH / 2**z / settings.RIDES_TILES_CLUSTER_GRID,
+    }
+    for index, (layer, column) in enumerate(LAYERS):
+        # The whole world doesn't fit a geography polygon, and at these zoom
+        # levels the tile covers most rides anyway.
+        bounds = BOUNDS_SQL.format(column=column) if z >= 2 else "true"
+        sql = template.format(index=index, column=column, bounds=bounds)
+        layers.append(f"COALESCE(({sql}), ''::bytea)")
+        params[f"layer_{index}"] = layer
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT {' || '.join(layers)}", params)
+        return bytes(cursor.fetchone()[0])
+
+
+def get_tile(z, x, y):
+    if z > settings.RIDES_TILES_CACHE_MAX_ZOOM:
+        return render_tile(z, x, y)
+
+    key = tile_key(z, x, y)
+    client = get_redis()
+    try:
+        tile, generation = client.mget(key, generation_key(key))
+    except redis.RedisError:
+        return render_tile(z, x, y)
+    if tile is not None:
+        return tile
+
+    tile = render_tile(z, x, y)
+    try:
+        client.register_script(SET_IF_GENERATION_SCRIPT)(
+            keys=[key, generation_key(key)],
+            args=[generation or b"", tile, settings.RIDES_TILES_CACHE_TIMEOUT],
+        )
+    except redis.RedisError:
+        pass
+    return tile
+
+
+def invalidate_tiles(pipe, keys):
+    for key in keys:
+        pipe.incr(generation_key(key))
+        pipe.expire(generation_key(key), settings.RIDES_TILES_CACHE_TIMEOUT)
+        pipe.delete(key)
+
+
+def point_tile_keys(point):
+    # Keys of the cached tiles showing a point, including neighbouring tiles
+    # whose buffer reaches it.
+    keys = set()
+    latitude = max(min(point.y, 85.0511287798), -85.0511287798)
+    margin = BUFFER / EXTENT
+    for z in range(settings.RIDES_TILES_CACHE_MAX_ZOOM + 1):
+        n = 2**z
+        tile_x = (point.x + 180.0) / 360.0 * n
+        tile_y = (
+            (1.0 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2.0 * n
+        )
+        for x in {int(tile_x - margin), int(tile_x + margin)}:
+            for y in {int(tile_y - margin), int(tile_y + margin)}:
+                if 0 <= x < n and 0 <= y < n:
+                    keys.add(tile_key(z, x, y))
+    return keys
+
+
+def ride_footprint(ride):
+    # None once the ride left the open states, so its footprint is dropped.
+    if ride.status != "PENDING" or ride.rider_id is not None:
+        return None
+    return {
+        "current": sorted(point_tile_keys(ride.current_location)),
+        "stops": sorted(
+            point_tile_keys(ride.pickup_location)
+            | point_tile_keys(ride.dropoff_location)
+        ),
+    }
+
+
+def replace_footprints(footprints):
+    # footprints maps ride ids to their new footprint, or None once the ride
+    # was deleted or isn't open anymore.
+    client = get_redis()
+    keys = [footprint_key(pk) for pk in footprints]
+    try:
+        old_footprints = client.mget(keys) if keys else []
+        stale = set()
+        for old_footprint, footprint in zip(old_footprints, footprints.values()):
+            for tiles in (old_footprint and json.loads(old_footprint), footprint):
+                if tiles:
+                    stale.update(tiles["current"], tiles["stops"])
+
+        with client.pipeline() as pipe:
+            invalidate_tiles(pipe, sorted(stale))
+            for ride_id, footprint in footprints.items():
+                if footprint is None:
+                    pipe.delete(footprint_key(ride_id))
+                else:
+                    pipe.set(footprint_key(ride_id), json.dumps(footprint))
+            pipe.execute()
+    except redis.RedisError:
+        pass
+
+
+def on_commit_replace(footprints):
+    transaction.on_commit(lambda: replace_footprints(footprints))
+
+
+def ride_saved(ride):
+    on_commit_replace({ride.pk: ride_footprint(ride)})
+
+
+def rides_deleted(ride_ids):
+    on_commit_replace(dict.fromkeys(ride_ids))
+
+
+def rides_changed(ride_ids):
+    rides = Ride.objects.filter(pk__in=ride_ids).only(
+        "pk",
+        "status",
+        "rider",
+        "current_location",
+        "pickup_location",
+        "dropoff_location",
+    )
+    on_commit_replace({ride.pk: ride_footprint(ride) for ride in rides})
+
+
+def ride_moved(ride_id, location):
+    # Only the tiles showing the ride's current location change, the pickup and
+    # dropoff points stay where they were.
+    def move():
+        client = get_redis()
+        try:
+            footprint = client.get(footprint_key(ride_id))
+            footprint = footprint and json.loads(footprint)
+            if not footprint or not footprint["current"]:
+                return
+            current = sorted(point_tile_keys(location))
+            with client.pipeline() as pipe:
+                invalidate_tiles(pipe, sorted(set(footprint["current"]) | set(current)))
+                pipe.set(
+                    footprint_key(ride_id),
+                    json.dumps({**footprint, "current": current}),
+                )
+                pipe.execute()
+        except redis.RedisError:
+            pass
+
+    transaction.on_commit(move)
@@ -0,0 +1,105 @@
+import json
+import math
+import time
+from datetime import datetime, timezone as dt_timezone
+
+import redis
+from django.conf import settings
+from django.contrib.gis.geos import Point
+from django.db import transaction
+
+from . import routing
+from .connections import get_redis
+from .models import RideTracePoint
+
+# Map matching of ride traces. Persisted ride locations are buffered per ride in
+# Redis lists, and a Celery job fans the rides with buffered pings out to one
+# task per batch, each snapping its rides' pings onto the road network in one
+# Viterbi pass and storing them as RideTracePoints. Pings are only dropped from
+# the buffer once their points are stored, and rides whose matching fails go
+# back to the pending set. Buffering only happens while a road graph is
+# configured.
+
+PENDING_KEY = "rides:traces:pending"
+
+
+def pings_key(ride_id):
+    return f"rides:traces:pings:{ride_id}"
+
+
+def buffer_ping(ride_id, location):
+    if not settings.RIDES_ROAD_GRAPH_PATH:
+        return
+    ping = json.dumps([time.time(), location.x, location.y])
+
+    def push():
+        try:
+            with get_redis().pipeline() as pipe:
+                pipe.rpush(pings_key(ride_id), ping)
+                pipe.expire(pings_key(ride_id), settings.RIDES_TRACE_BUFFER_TIMEOUT)
+                pipe.sadd(PENDING_KEY, ride_id)
+                pipe.execute()
+        except redis.RedisError:
+            # Traces are best effort, the ride itself is already saved.
+            pass
+
+    transaction.on_commit(push)
+
+
+def pending_batches(max_rides=None):
+    if max_rides is None:
+        max_rides = settings.RIDES_TRACE_BATCH_RIDES
+    return math.ceil(get_redis().scard(PENDING_KEY) / max_rides)
+
+
+def match_pending_traces(max_rides=None):
+    # Matches one batch of pending rides, returning the number of trace points
+    # stored.
+    matcher = routing.get_map_matcher()
+    if matcher is None:
+        return 0
+    if max_rides is None:
+        max_rides = settings.RIDES_TRACE_BATCH_RIDES
+
+    client = get_redis()
+    ride_ids = [int(ride_id) for ride_id in client.spop(PENDING_KEY, max_rides)]
+    if not ride_ids:
+        return 0
+
+    try:
+        with client.pipeline() as pipe:
+            for ride_id in ride_ids:
+                pipe.lrange(pings_key(ride_id), 0, -1)
+            buffered = [
+                [json.loads(ping) for ping in pings] for pings in pipe.execute()
+            ]
+
+        points = []
+        for ride_id, pings in zip(ride_ids, buffered):
+            snapped = matcher.match(
+                [(longitude, latitude) for _, longitude, latitude in pings]
+            )
+            for (timestamp, longitude, latitude), match in zip(pings, snapped):
+                points.append(
+                    RideTracePoint(
+                        ride_id=ride_id,
+                        recorded_at=datetime.fromtimestamp(
+                            timestamp, tz=dt_timezone.utc
+                        ),
+                        raw_location=Point(longitude, latitude, srid=4326),
+                        location=None if match is None else Point(*match, srid=4326),
+                    )
+                )
+        RideTracePoint.objects.bulk_create(points, batch_size=1000)
+    except Exception:
+        # The pings are still buffered, so a later run matches them again.
+        client.sadd(PENDING_KEY, *ride_ids)
+        raise
+
+    # Drops the matched pings, keeping the ones buffered since, whose rides are
+    # already pending again.
+    with client.pipeline() as pipe:
+        for ride_id, pings in zip(ride_ids, buffered):
+            pipe.ltrim(pings_key(ride_id), len(pings), -1)
+        pipe.execute()
+    return len(points)
@@ -0,0 +1,65 @@
+from .connections import get_redis
+
+
+# Registry of tracked rides, mapping each ride to the id of its tracking chain.
+# Starting, stopping and checking tracking are single Redis operations. The
+# registry is shared by the web workers, the outbox relay and the Celery
+# workers, so it can't live in the Django cache, which may be per process. The
+# tracker task checks the registry before every run and stops rescheduling
+# itself once its chain is no longer the registered one, or its ride is no
+# longer in progress, so stopping needs no broadcast revoke.
+
+# Rides in these statuses are no longer tracked.
+UNTRACKED_STATUSES = {"COMPLETED", "CANCELLED"}
+
+# How long a started chain is remembered, so a start relayed again doesn't
+# start a second one. Well beyond the outbox's retries.
+STARTED_TIMEOUT = 24 * 60 * 60
+
+
+def tracking_key(ride_id):
+    return f"rides:tracking:{ride_id}"
+
+
+def register(ride_id, tracking_id):
+    get_redis().set(tracking_key(ride_id), tracking_id)
+
+
+def unregister(ride_ids):
+    if ride_ids:
+        get_redis().delete(*[tracking_key(ride_id) for ride_id in ride_ids])
+
+
+def started_key(tracking_id):
+    return f"rides:tracking:started:{tracking_id}"
+
+
+def claim_start(tracking_id):
+    # Returns whether the chain is not started yet, and marks it started.
+    return bool(
+        get_redis().set(started_key(tracking_id), 1, nx=True, ex=STARTED_TIMEOUT)
+    )
+
+
+def release_start(tracking_id):
+    get_redis().delete(started_key(tracking_id))
+
+
+def tracking_id(ride_id):
+    value = get_redis().get(tracking_key(ride_id))
+    return None if value is None else value.decode()
+
+
+def is_tracked(ride_id, tracking_id=None):
+    registered = get_redis().get(tracking_key(ride_id))
+    if tracking_id is None:
+        return registered is not None
+    return registered is not None and registered.decode() == tracking_id
+
+
+def register_many(tracking_ids):
+    # tracking_ids maps ride ids to the ids of their tracking chains.
+    if tracking_ids:
+        get_redis().mset(
+            {tracking_key(ride_id): value for ride_id, value in tracking_ids.items()}
+        )
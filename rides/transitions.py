@@ -0,0 +1,60 @@
+from django.db import connection, transaction
+
+from . import outbox
+from .models import Ride
+from .signals import rides_updated
+from .tracking import UNTRACKED_STATUSES
+
+# The allowed status transitions of a ride. Every write path, single or bulk,
+# checks against this table. Setting a ride to its current status is a no-op
+# and always allowed.
+TRANSITIONS = {
+    "PENDING": {"STARTED", "COMPLETED", "CANCELLED"},
+    "STARTED": {"COMPLETED", "CANCELLED"},
+    "COMPLETED": set(),
+    "CANCELLED": set(),
+}
+
+
+def can_transition(current, target):
+    return current == target or target in TRANSITIONS.get(current, ())
+
+
+def source_statuses(target):
+    return sorted(
+        status for status, targets in TRANSITIONS.items() if target in targets
+    )
+
+
+def bulk_transition(queryset, target, statuses=None):
+    # Moves the rides of queryset whose status may transition to target, and is
+    # in statuses when given, in one UPDATE. Returns the ids of the moved rides.
+    sources = source_statuses(target)
+    if statuses is not None:
+        sources = [status for status in sources if status in statuses]
+    if not sources:
+        return []
+
+    rides_sql, rides_params = queryset.values("pk").query.sql_with_params()
+    table = Ride._meta.db_table
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            # The status condition is on the updated rows themselves, so it is
+            # re-checked against rows changed concurrently.
+            cursor.execute(
+                f"UPDATE {table} SET status = %s, updated_at = now(), "
+                "version = version + 1 "
+                f"WHERE status = ANY(%s) AND id IN ({rides_sql}) RETURNING id",
+                [target, sources, *rides_params],
+            )
+            ride_ids = [row[0] for row in cursor.fetchall()]
+
+        if ride_ids:
+            if target in UNTRACKED_STATUSES:
+                outbox.enqueue_many(
+                    outbox.TRACKING_STOP, [{"ride_id": pk} for pk in ride_ids]
+                )
+            rides_updated.send(
+                sender=Ride, ride_ids=ride_ids, changes={"status": target}
+            )
+    return ride_ids
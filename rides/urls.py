@@ -1,12 +1,30 @@
 from django.urls import path
 from rest_framework.routers import SimpleRouter
 
-from .views import RideViewSet, RideRequestViewSet
+from .views import (
+    EventView,
+    ExportView,
+    HeartbeatView,
+    HeatmapView,
+    RideTileView,
+    RollupView,
+    RideViewSet,
+    RideRequestViewSet,
+    StandingMatchViewSet,
+)
 
 
 router = SimpleRouter()
 
 router.register("requests", RideRequestViewSet, basename="ride_requests")
 router.register("rides", RideViewSet, basename="rides")
+router.register("standing-matches", StandingMatchViewSet, basename="standing_matches")
 
-urlpatterns = router.urls
+urlpatterns = router.urls + [
+    path("events/", EventView.as_view(), name="events"),
+    path("export/<str:model>/", ExportView.as_view(), name="export"),
+    path("heartbeat/", HeartbeatView.as_view(), name="heartbeat"),
+    path("heatmap/", HeatmapView.as_view(), name="heatmap"),
+    path("rollups/", RollupView.as_view(), name="rollups"),
+    path("tiles/<int:z>/<int:x>/<int:y>.mvt", RideTileView.as_view(), name="tiles"),
+]
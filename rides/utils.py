@@ -1,11 +1,19 @@
-from .tasks import update_ride_location
+from uuid import uuid4
+
+from . import outbox
+
+
+# Both are recorded in the outbox and take effect once the caller's transaction
+# commits and the relay publishes them.
 
 
 def start_ride_tracking(ride_id):
-    update_ride_location.apply_async(args=[ride_id], countdown=3)
+    outbox.enqueue(
+        outbox.TRACKING_START, {"ride_id": ride_id, "tracking_id": uuid4().hex}
+    )
     return
 
 
 def stop_ride_tracking(ride_id):
-    update_ride_location.revoke(ride_id, terminate=True)
+    outbox.enqueue(outbox.TRACKING_STOP, {"ride_id": ride_id})
     return
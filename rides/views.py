@@ -1,16 +1,60 @@
+from datetime import timedelta, timezone as dt_timezone
+
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
-from django.contrib.gis.measure import Distance
-from django.contrib.gis.geos import Point
-from django.contrib.gis.db.models.functions import Distance as DistanceFunction
+from rest_framework.views import APIView
+from rest_framework_gis.fields import GeometryField
+from django.conf import settings
+from django.contrib.gis.geos import Point, Polygon
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.decorators import method_decorator
+from django.utils.http import quote_etag
+from django.views.decorators.http import condition
 
-from .models import Ride, RideRequest
+from . import detail_cache, events, heatmap, load, presence, rollups, tiles
+from .export import MODELS as EXPORT_MODELS, Export, ParquetUnavailable
+from .conditional import (
+    etag_func,
+    if_match_version,
+    last_modified_func,
+    version_etag,
+)
+from .exceptions import EditConflict, PreconditionFailed, ServiceOverloaded
+from .filters import RideFilterBackend, filter_rides
+from .geo import geohash_bounds, geohash_cover_count
+from .location import write_ride_location
+from .matching import nearby_rides, order_by_eta
+from .models import (
+    ArchivedRide,
+    ArchivedRideRequest,
+    Ride,
+    RideRequest,
+    RideVersionConflict,
+    StandingMatch,
+)
+from .negotiation import FallbackContentNegotiation
 from .permissions import (
     IsDriverOrRiderElseReadOnly,
     UpdateIfDriverDeleteIfRiderElseCreate,
 )
-from .serializers import RideSerializer, RideRequestSerializer
+from .ride_requests import accept_ride_request
+from .serializers import (
+    ArchivedRideRequestSerializer,
+    ArchivedRideSerializer,
+    NearbyRideSerializer,
+    RideRequestSerializer,
+    RideSerializer,
+    StandingMatchSerializer,
+)
+from .transitions import bulk_transition, can_transition
 from .utils import start_ride_tracking, stop_ride_tracking
 
 
@@ -18,53 +62,140 @@ class RideViewSet(viewsets.ModelViewSet):
     queryset = Ride.objects.all()
     serializer_class = RideSerializer
     permission_classes = (IsDriverOrRiderElseReadOnly,)
+    # Listing filters, see rides/filters.py.
+    filter_backends = (RideFilterBackend,)
 
     # Note: For location inputs to the API, please use the format 'POINT(longitude latitude)'.
     # eg. POINT(76.267303 9.931233) represents Kochi - longitude 76.267303 and latitude 9.931233
 
-    def create(self, request, *args, **kwargs):
-        response = super().create(request, *args, **kwargs)
-
-        if response.status_code == status.HTTP_201_CREATED:
-            ride = response.data
-            ride_id = ride.get("id")
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            ride = serializer.save()
 
             # Start ride tracking when ride is created
-            start_ride_tracking(ride_id)
+            start_ride_tracking(ride.pk)
+        presence.heartbeat(ride.driver_id)
 
-        return response
+    @method_decorator(
+        condition(
+            etag_func=etag_func(Ride), last_modified_func=last_modified_func(Ride)
+        )
+    )
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs["pk"]
+        if not pk.isdigit():
+            return super().retrieve(request, *args, **kwargs)
+
+        data = detail_cache.get_or_load(
+            pk, lambda: self.get_serializer(self.get_object()).data
+        )
+        return Response(data)
+
+    def versioned_write(self, write):
+        # Runs write(ride) on a freshly read ride and returns its response.
+        # With If-Match the write is conditional on that version and fails with
+        # 412 if the ride changed. Without it, the ride is read again and the
+        # write retried, and only repeated conflicts fail with 409.
+        for _ in range(settings.RIDES_VERSION_CONFLICT_RETRIES + 1):
+            ride = self.get_object()
+            expected = if_match_version(self.request, Ride, ride.pk)
+            if expected is not None and expected != ride.version:
+                raise PreconditionFailed()
+            try:
+                response = write(ride)
+            except RideVersionConflict:
+                if expected is not None:
+                    raise PreconditionFailed()
+                continue
+            if status.is_success(response.status_code):
+                response["ETag"] = quote_etag(version_etag(Ride, ride.pk, ride.version))
+            return response
+        raise EditConflict()
+
+    def update(self, request, *args, **kwargs):
+        partial = kwargs.pop("partial", False)
+
+        def write(ride):
+            serializer = self.get_serializer(ride, data=request.data, partial=partial)
+            serializer.is_valid(raise_exception=True)
+            self.perform_update(serializer)
+            return Response(serializer.data)
+
+        return self.versioned_write(write)
 
     @action(detail=True, methods=["patch"])
     def status(self, request, pk=None):
+        def write(ride):
+            if request.user != ride.driver and request.user != ride.rider:
+                return Response(
+                    {
+                        "error": "Only a driver or rider associated with a ride can change it's status."
+                    },
+                    status=status.HTTP_403_FORBIDDEN,
+                )
+
+            status_choice = request.data.get("status")
+
+            if status_choice not in dict(Ride.STATUS_CHOICES):
+                return Response(
+                    {
+                        "error": "Invalid status choice. Accepted values = ['PENDING', 'STARTED', 'COMPLETED', 'CANCELLED']"
+                    },
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            if not can_transition(ride.status, status_choice):
+                return Response(
+                    {
+                        "error": f"Invalid status transition from {ride.status} to {status_choice}"
+                    },
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            with transaction.atomic():
+                # Stop ride tracking when status is completed or cancelled
+                if status_choice == "COMPLETED" or status_choice == "CANCELLED":
+                    stop_ride_tracking(ride.pk)
+
+                ride.status = status_choice
+                ride.save()
+
+            serializer = self.get_serializer(ride)
+            return Response(serializer.data)
+
+        return self.versioned_write(write)
+
+    @action(detail=True, methods=["patch"])
+    def location(self, request, pk=None):
         ride = self.get_object()
 
-        if request.user != ride.driver and request.user != ride.rider:
+        if request.user != ride.driver:
             return Response(
-                {
-                    "error": "Only a driver or rider associated with a ride can change it's status."
-                },
+                {"error": "Only the driver of a ride can update it's location."},
                 status=status.HTTP_403_FORBIDDEN,
             )
 
-        status_choice = request.data.get("status")
-
-        if status_choice not in dict(Ride.STATUS_CHOICES):
+        try:
+            current_location = GeometryField().to_internal_value(
+                request.data.get("current_location")
+            )
+        except ValidationError:
+            current_location = None
+        if not isinstance(current_location, Point):
             return Response(
-                {
-                    "error": "Invalid status choice. Accepted values = ['PENDING', 'STARTED', 'COMPLETED', 'CANCELLED']"
-                },
+                {"error": "Invalid location data"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # Stop ride tracking when status is completed or cancelled
-        if status_choice == "COMPLETED" or status_choice == "CANCELLED":
-            stop_ride_tracking(ride.pk)
-
-        ride.status = status_choice
-        ride.save()
-
-        serializer = self.get_serializer(ride)
-        return Response(serializer.data)
+        presence.heartbeat(request.user.pk)
+        # Tiny movements shortly after the last write are skipped, see rides.location.
+        # Without If-Match the location is simply overwritten.
+        version = if_match_version(request, Ride, ride.pk)
+        try:
+            written = write_ride_location(ride.pk, current_location, version=version)
+        except RideVersionConflict:
+            raise PreconditionFailed()
+        return Response({"written": written})
 
     @action(detail=False, methods=["post"])
     def nearby(self, request, pk=None):
@@ -93,19 +224,98 @@ class RideViewSet(viewsets.ModelViewSet):
             srid=4326,
         )
 
-        nearby_rides = (
-            Ride.objects.filter(
-                rider=None,
-                current_location__distance_lt=(user_location, Distance(m=1000)),
-                dropoff_location__distance_lt=(destination_location, Distance(m=1000)),
-            )
-            .annotate(distance=DistanceFunction("current_location", user_location))
-            .order_by("distance")
+        radius = load.nearby_radius()
+        if radius is None:
+            raise ServiceOverloaded()
+        rides = presence.online_rides(
+            nearby_rides(user_location, destination_location, radius)
         )
 
-        serializer = self.get_serializer(nearby_rides, many=True)
+        if order_by_eta(rides, user_location):
+            serializer = NearbyRideSerializer(
+                rides, many=True, context=self.get_serializer_context()
+            )
+        else:
+            serializer = self.get_serializer(rides, many=True)
         return Response(serializer.data)
 
+    # Staff only. Usage: POST /api/v1/rides/bulk-status/ with
+    # {"status": "CANCELLED", "bbox": "min_longitude,min_latitude,max_longitude,max_latitude"}
+    # or a "polygon" (WKT or GeoJSON) instead of the bbox. "from_statuses" limits
+    # the rides moved to those statuses. Rides whose status can't transition to
+    # "status" are left alone.
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="bulk-status",
+        permission_classes=(IsAdminUser,),
+    )
+    def bulk_status(self, request):
+        target = request.data.get("status")
+        if target not in dict(Ride.STATUS_CHOICES):
+            return Response(
+                {
+                    "error": "Invalid status choice. Accepted values = ['PENDING', 'STARTED', 'COMPLETED', 'CANCELLED']"
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        statuses = request.data.get("from_statuses")
+        if statuses is not None and (
+            not isinstance(statuses, list)
+            or not set(statuses) <= set(dict(Ride.STATUS_CHOICES))
+        ):
+            return Response(
+                {"error": "Invalid from_statuses"}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            if request.data.get("polygon") is not None:
+                area = GeometryField().to_internal_value(request.data["polygon"])
+                if area.geom_type not in ("Polygon", "MultiPolygon"):
+                    raise ValueError
+            else:
+                bbox = [float(value) for value in request.data["bbox"].split(",")]
+                if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+                    raise ValueError
+                area = Polygon.from_bbox(bbox)
+        except (KeyError, AttributeError, ValueError, ValidationError):
+            return Response(
+                {"error": "Invalid bbox or polygon"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        area.srid = 4326
+
+        ride_ids = bulk_transition(
+            Ride.objects.filter(current_location__intersects=area), target, statuses
+        )
+        return Response({"status": target, "updated": len(ride_ids)})
+
+    @action(detail=False, methods=["get"])
+    def history(self, request, pk=None):
+        # Rides the user drove or rode in, including the ones already archived.
+        # Takes the same filters as the listing.
+        involved = Q(driver=request.user) | Q(rider=request.user)
+        rides = self.get_serializer(
+            filter_rides(
+                Ride.objects.filter(involved), request.query_params, request.user
+            ),
+            many=True,
+        ).data
+        archived_rides = ArchivedRideSerializer(
+            filter_rides(
+                ArchivedRide.objects.filter(involved),
+                request.query_params,
+                request.user,
+            ),
+            many=True,
+            context=self.get_serializer_context(),
+        ).data
+
+        history = sorted(
+            [*rides, *archived_rides], key=lambda ride: ride["created_at"], reverse=True
+        )
+        return Response(history)
+
 
 class RideRequestViewSet(viewsets.ModelViewSet):
     queryset = RideRequest.objects.all()
@@ -124,6 +334,15 @@ class RideRequestViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(ride_request)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @method_decorator(
+        condition(
+            etag_func=etag_func(RideRequest),
+            last_modified_func=last_modified_func(RideRequest),
+        )
+    )
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     @action(detail=True, methods=["patch"])
     def accept(self, request, pk=None):
         ride_request = self.get_object()
@@ -134,10 +353,233 @@ class RideRequestViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN,
             )
 
-        ride_request.is_accepted = True
-        ride_request.save()
-        ride_request.ride.rider = ride_request.rider
-        ride_request.ride.save()
+        if not accept_ride_request(ride_request.pk):
+            return Response(
+                {
+                    "error": "Ride already has a rider or the RideRequest is no longer pending"
+                },
+                status=status.HTTP_409_CONFLICT,
+            )
 
+        ride_request.refresh_from_db()
         serializer = self.get_serializer(ride_request)
         return Response(serializer.data)
+
+    @action(detail=False, methods=["get"])
+    def history(self, request, pk=None):
+        # Requests made by the user, including the ones already archived.
+        ride_requests = self.get_serializer(
+            RideRequest.objects.filter(rider=request.user), many=True
+        ).data
+        archived_ride_requests = ArchivedRideRequestSerializer(
+            ArchivedRideRequest.objects.filter(rider=request.user),
+            many=True,
+            context=self.get_serializer_context(),
+        ).data
+
+        history = sorted(
+            [*ride_requests, *archived_ride_requests],
+            key=lambda ride_request: ride_request["created_at"],
+            reverse=True,
+        )
+        return Response(history)
+
+
+class StandingMatchViewSet(viewsets.ModelViewSet):
+    # Riders register, list and cancel their own standing matches, and are
+    # notified when a ride passing near both ends shows up.
+    serializer_class = StandingMatchSerializer
+    http_method_names = ["get", "post", "delete", "head", "options"]
+
+    def get_queryset(self):
+        return StandingMatch.objects.filter(rider=self.request.user).order_by(
+            "-created_at"
+        )
+
+    def perform_create(self, serializer):
+        serializer.save(rider=self.request.user)
+
+
+class HeartbeatView(APIView):
+    # Drivers POST here every few seconds while they are available, see
+    # rides.presence.
+    throttle_scope = "heartbeat"
+
+    def post(self, request):
+        presence.heartbeat(request.user.pk)
+        return Response({"ttl": settings.RIDES_PRESENCE_TTL}, status=status.HTTP_200_OK)
+
+
+class EventView(APIView):
+    # Usage: /api/v1/events/?since=cursor
+    # Long polls for state changes of the user's rides and ride requests. The
+    # response carries the cursor for the next poll, and reset=true when events
+    # may have been missed and the client should reload instead.
+
+    def get(self, request):
+        found, cursor, reset = events.wait_for_events(
+            request.query_params.get("since"),
+            request.user.pk,
+            settings.RIDES_EVENTS_LONG_POLL_SECONDS,
+        )
+        return Response({"events": found, "cursor": cursor, "reset": reset})
+
+
+class HeatmapView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    # Usage: /api/v1/heatmap/?bbox=min_longitude,min_latitude,max_longitude,max_latitude&res=5
+    # res is the geohash precision of the cells.
+
+    def get(self, request):
+        try:
+            bbox = [float(value) for value in request.query_params["bbox"].split(",")]
+            precision = int(
+                request.query_params.get("res", settings.RIDES_HEATMAP_PRECISIONS[0])
+            )
+        except (KeyError, ValueError):
+            return Response(
+                {"error": "Invalid bbox or res"}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+            return Response(
+                {"error": "Invalid bbox or res"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        if precision not in settings.RIDES_HEATMAP_PRECISIONS:
+            return Response(
+                {
+                    "error": f"Invalid res. Accepted values = {settings.RIDES_HEATMAP_PRECISIONS}"
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if geohash_cover_count(*bbox, precision) > settings.RIDES_HEATMAP_MAX_CELLS:
+            return Response(
+                {"error": "Bounding box covers too many cells, use a lower res"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        cells = [
+            {"cell": cell, "bounds": geohash_bounds(cell), **counts}
+            for cell, counts in heatmap.cell_counts(bbox, precision).items()
+        ]
+        return Response({"res": precision, "cells": cells})
+
+
+class RollupView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    # Usage: /api/v1/rollups/?since=2026-10-01T00:00Z&until=2026-10-02T00:00Z&interval=hour&cell=tdr1
+    # Ride and request counts by status per period and pickup cell, read from the
+    # rollup tables only. until defaults to now, cell is an optional geohash prefix.
+
+    def get(self, request):
+        try:
+            since = parse_datetime(request.query_params.get("since", ""))
+            until = request.query_params.get("until")
+            until = timezone.now() if until is None else parse_datetime(until)
+        except ValueError:
+            since = until = None
+        interval = request.query_params.get("interval", "hour")
+        cell = request.query_params.get("cell")
+        if since is None or until is None or since >= until:
+            return Response(
+                {"error": "Invalid since or until"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        if interval not in ("hour", "day"):
+            return Response(
+                {"error": "Invalid interval. Accepted values = ['hour', 'day']"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since, dt_timezone.utc)
+        if timezone.is_naive(until):
+            until = timezone.make_aware(until, dt_timezone.utc)
+        if until - since > timedelta(days=settings.RIDES_ROLLUP_MAX_DAYS):
+            return Response(
+                {
+                    "error": f"Range too long, at most {settings.RIDES_ROLLUP_MAX_DAYS} days"
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        return Response(
+            {
+                "interval": interval,
+                "rows": rollups.report(since, until, interval=interval, cell=cell),
+            }
+        )
+
+
+class ExportView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    # Usage: /api/v1/export/rides/?format=ndjson&since=2026-10-01T00:00Z&archived=1&trajectories=1
+    # Streams every ride (or request) updated after since, ordered by updated_at.
+    # format is ndjson (default) or parquet, when pyarrow is installed. The
+    # X-Export-Watermark header is the since of the next incremental export.
+
+    CONTENT_TYPES = {
+        "ndjson": "application/x-ndjson",
+        "parquet": "application/vnd.apache.parquet",
+    }
+
+    def get(self, request, model):
+        if model not in EXPORT_MODELS:
+            return Response(
+                {"error": "Invalid export"}, status=status.HTTP_404_NOT_FOUND
+            )
+        export_format = request.query_params.get("format", "ndjson")
+        if export_format not in self.CONTENT_TYPES:
+            return Response(
+                {"error": "Invalid format. Accepted values = ['ndjson', 'parquet']"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        since = request.query_params.get("since")
+        if since is not None:
+            try:
+                since = parse_datetime(since)
+            except ValueError:
+                since = None
+            if since is None:
+                return Response(
+                    {"error": "Invalid since"}, status=status.HTTP_400_BAD_REQUEST
+                )
+
+        export = Export(
+            model,
+            since=since,
+            archived=request.query_params.get("archived") == "1",
+            trajectories=request.query_params.get("trajectories") == "1",
+        )
+        try:
+            stream = export.stream(export_format)
+        except ParquetUnavailable as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        watermark = export.bound()
+
+        response = StreamingHttpResponse(
+            stream, content_type=self.CONTENT_TYPES[export_format]
+        )
+        response[
+            "Content-Disposition"
+        ] = f'attachment; filename="{model}.{export_format}"'
+        if watermark is not None:
+            response["X-Export-Watermark"] = watermark.isoformat()
+        return response
+
+
+class RideTileView(APIView):
+    renderer_classes = (JSONRenderer,)
+    content_negotiation_class = FallbackContentNegotiation
+
+    # Mapbox Vector Tile with the layers "rides", "pickups" and "dropoffs" holding
+    # the current, pickup and dropoff locations of open rides.
+
+    def get(self, request, z, x, y):
+        if not tiles.is_valid_tile(z, x, y):
+            return Response({"error": "Invalid tile"}, status=status.HTTP_404_NOT_FOUND)
+
+        return HttpResponse(
+            tiles.get_tile(z, x, y), content_type="application/vnd.mapbox-vector-tile"
+        )
@@ -69,6 +69,31 @@ REST_FRAMEWORK = {
         "rest_framework.authentication.TokenAuthentication",
     ],
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    "DEFAULT_RENDERER_CLASSES": [
+        "rest_framework.renderers.JSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+        "rides.renderers.MessagePackRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "rest_framework.parsers.JSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+        "rides.parsers.MessagePackParser",
+    ],
+    # Token buckets in Redis, see rides/throttling.py. Rates are keyed by action,
+    # with an "_ip" suffix for the per-IP rate.
+    "DEFAULT_THROTTLE_CLASSES": [
+        "rides.throttling.UserTokenBucketThrottle",
+        "rides.throttling.IPTokenBucketThrottle",
+    ],
+    "DEFAULT_THROTTLE_RATES": {
+        "nearby": env.str("THROTTLE_RATE_NEARBY", "60/min"),
+        "nearby_ip": env.str("THROTTLE_RATE_NEARBY_IP", "600/min"),
+        "location": env.str("THROTTLE_RATE_LOCATION", "120/min"),
+        "location_ip": env.str("THROTTLE_RATE_LOCATION_IP", "1200/min"),
+        "heartbeat": env.str("THROTTLE_RATE_HEARTBEAT", "30/min"),
+        "heartbeat_ip": env.str("THROTTLE_RATE_HEARTBEAT_IP", "3000/min"),
+    },
 }
 
 REST_AUTH = {
@@ -81,8 +106,12 @@ SPECTACULAR_SETTINGS = {
     "VERSION": "1.0.0",
 }
 
+# Built at deploy time with `python manage.py build_schema`.
+OPENAPI_SCHEMA_DIR = env.str("OPENAPI_SCHEMA_DIR", str(BASE_DIR / "schema"))
+
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "rides.middleware.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -91,6 +120,18 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# Responses smaller than this are not worth compressing.
+RESPONSE_COMPRESSION_MIN_SIZE = env.int("RESPONSE_COMPRESSION_MIN_SIZE", 512)
+RESPONSE_COMPRESSION_BROTLI_QUALITY = env.int("RESPONSE_COMPRESSION_BROTLI_QUALITY", 4)
+# Only API payloads are compressed. HTML pages, like the browsable API, carry
+# CSRF tokens next to reflected input, which compression would expose to BREACH.
+RESPONSE_COMPRESSION_CONTENT_TYPES = (
+    "application/json",
+    "application/x-msgpack",
+    "application/x-ndjson",
+    "application/vnd.mapbox-vector-tile",
+)
+
 CORS_ORIGIN_WHITELIST = (
     "http://localhost:3000",
     "http://localhost:8000",
@@ -138,6 +179,14 @@ DATABASES = {
 }
 
 
+# Cache
+# Use a shared cache such as redis://localhost:6379/1 outside of development.
+
+CACHES = {
+    "default": env.dj_cache_url("CACHE_URL", default="locmem://"),
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -188,9 +237,161 @@ AUTH_USER_MODEL = "accounts.CustomUser"
 CELERY_BROKER_URL = "redis://localhost:6379"
 CELERY_RESULT_BACKEND = "redis://localhost:6379"
 CELERY_BEAT_SCHEDULE = {
-    "update_ride_location_task": {
-        "task": "rides.tasks.update_ride_location",
-        "schedule": 180,
-        "args": (),
-    }
+    "archive_finished_rides_task": {
+        "task": "rides.tasks.archive_finished_rides",
+        "schedule": 60 * 60,
+    },
+    "expire_ride_requests_task": {
+        "task": "rides.tasks.expire_ride_requests",
+        "schedule": 5 * 60,
+    },
+    "match_ride_traces_task": {
+        "task": "rides.tasks.match_ride_traces",
+        "schedule": 60,
+    },
+    "refresh_rollups_task": {
+        "task": "rides.tasks.refresh_rollups",
+        "schedule": 5 * 60,
+    },
 }
+
+# Redis used directly where the cache API falls short (counters, scripts, pub/sub).
+RIDES_REDIS_URL = env.str("RIDES_REDIS_URL", "redis://localhost:6379/1")
+
+# Ride archival
+RIDE_ARCHIVE_AFTER_DAYS = env.int("RIDE_ARCHIVE_AFTER_DAYS", 30)
+RIDE_ARCHIVE_BATCH_SIZE = env.int("RIDE_ARCHIVE_BATCH_SIZE", 500)
+
+# Analytics rollups count rides per hour and pickup cell of
+# RIDES_ROLLUP_CELL_PRECISION (rebuild them after changing it). Refreshes rescan
+# RIDES_ROLLUP_OVERLAP_SECONDS before their watermark for late commits, and
+# recompute RIDES_ROLLUP_BATCH_HOURS hours per transaction. Reports cover at
+# most RIDES_ROLLUP_MAX_DAYS.
+RIDES_ROLLUP_CELL_PRECISION = env.int("RIDES_ROLLUP_CELL_PRECISION", 5)
+RIDES_ROLLUP_OVERLAP_SECONDS = env.int("RIDES_ROLLUP_OVERLAP_SECONDS", 5 * 60)
+RIDES_ROLLUP_BATCH_HOURS = env.int("RIDES_ROLLUP_BATCH_HOURS", 24)
+RIDES_ROLLUP_MAX_DAYS = env.int("RIDES_ROLLUP_MAX_DAYS", 92)
+
+# Exports stream rows in chunks of RIDES_EXPORT_CHUNK_SIZE (Parquet row groups).
+# Incremental exports re-read RIDES_EXPORT_OVERLAP_SECONDS before their since
+# for late commits.
+RIDES_EXPORT_CHUNK_SIZE = env.int("RIDES_EXPORT_CHUNK_SIZE", 5000)
+RIDES_EXPORT_OVERLAP_SECONDS = env.int("RIDES_EXPORT_OVERLAP_SECONDS", 5 * 60)
+
+# Pending ride requests older than this are expired in batches of
+# RIDE_REQUEST_EXPIRY_BATCH_SIZE.
+RIDE_REQUEST_TTL_MINUTES = env.int("RIDE_REQUEST_TTL_MINUTES", 60)
+RIDE_REQUEST_EXPIRY_BATCH_SIZE = env.int("RIDE_REQUEST_EXPIRY_BATCH_SIZE", 1000)
+
+# Ride matching
+RIDES_NEARBY_RADIUS_M = env.float("RIDES_NEARBY_RADIUS_M", 1000)
+# Projected SRID for the planar copies of ride locations, e.g. the local UTM
+# zone of the service area (32643 is UTM 43N, covering Kerala). It is baked into
+# the database trigger by the migrations, so set it before the first migrate.
+RIDES_PROJECTED_SRID = env.int("RIDES_PROJECTED_SRID", 32643)
+RIDES_USE_PROJECTED_MATCHING = env.bool("RIDES_USE_PROJECTED_MATCHING", False)
+# Rides without a rider are keyed by the geohash cells of their current and
+# dropoff locations at RIDES_OD_CELL_PRECISION (baked into a database trigger by
+# the migrations, like RIDES_PROJECTED_SRID). nearby then looks up the cell pairs
+# around both ends, unless there are more than RIDES_OD_CELL_MAX_PAIRS of them.
+RIDES_OD_CELL_PRECISION = env.int("RIDES_OD_CELL_PRECISION", 6)
+RIDES_OD_CELL_MAX_PAIRS = env.int("RIDES_OD_CELL_MAX_PAIRS", 1024)
+RIDES_USE_OD_CELL_MATCHING = env.bool("RIDES_USE_OD_CELL_MATCHING", True)
+# Road graph built by python manage.py build_road_graph. When set, nearby orders
+# rides by driving ETA. Locations further than RIDES_ROAD_SNAP_MAX_M from any
+# road node get no ETA.
+RIDES_ROAD_GRAPH_PATH = env.str("RIDES_ROAD_GRAPH_PATH", None)
+RIDES_ROAD_SNAP_MAX_M = env.float("RIDES_ROAD_SNAP_MAX_M", 300)
+# Map matching of ride traces on the same graph: pings are snapped to roads
+# within RIDES_MAP_MATCH_RADIUS_M, and buffered for up to
+# RIDES_TRACE_BUFFER_TIMEOUT seconds until they are matched, by one task per
+# RIDES_TRACE_BATCH_RIDES rides.
+RIDES_MAP_MATCH_RADIUS_M = env.float("RIDES_MAP_MATCH_RADIUS_M", 100)
+RIDES_TRACE_BUFFER_TIMEOUT = env.int("RIDES_TRACE_BUFFER_TIMEOUT", 60 * 60)
+RIDES_TRACE_BATCH_RIDES = env.int("RIDES_TRACE_BATCH_RIDES", 500)
+# Standing matches of waiting riders: the largest radius a rider may ask for,
+# and how long a match waits (by default and at most). A moved ride is queued
+# for matching once until the outbox relay publishes it, or for
+# RIDES_STANDING_MATCH_QUEUE_SECONDS if it never does.
+RIDES_STANDING_MATCH_MAX_RADIUS_M = env.float("RIDES_STANDING_MATCH_MAX_RADIUS_M", 5000)
+RIDES_STANDING_MATCH_TTL_MINUTES = env.int("RIDES_STANDING_MATCH_TTL_MINUTES", 30)
+RIDES_STANDING_MATCH_MAX_TTL_MINUTES = env.int(
+    "RIDES_STANDING_MATCH_MAX_TTL_MINUTES", 240
+)
+RIDES_STANDING_MATCH_QUEUE_SECONDS = env.int("RIDES_STANDING_MATCH_QUEUE_SECONDS", 60)
+
+# Drivers are present for RIDES_PRESENCE_TTL seconds after each heartbeat.
+# With RIDES_REQUIRE_DRIVER_PRESENCE, nearby and standing matches skip the rides
+# of absent drivers.
+RIDES_PRESENCE_TTL = env.int("RIDES_PRESENCE_TTL", 30)
+RIDES_REQUIRE_DRIVER_PRESENCE = env.bool("RIDES_REQUIRE_DRIVER_PRESENCE", False)
+
+# Ride and request events kept per process for long polling, and how long
+# GET /api/v1/events/ waits for new ones.
+RIDES_EVENTS_BUFFER_SIZE = env.int("RIDES_EVENTS_BUFFER_SIZE", 10000)
+RIDES_EVENTS_LONG_POLL_SECONDS = env.float("RIDES_EVENTS_LONG_POLL_SECONDS", 25)
+
+# Internal writers reload and retry this many times when a ride changed
+# between their read and their versioned write.
+RIDES_VERSION_CONFLICT_RETRIES = env.int("RIDES_VERSION_CONFLICT_RETRIES", 3)
+
+# Seconds the updated_at of polled rides and requests stays cached for ETags.
+RIDES_FRESHNESS_CACHE_TIMEOUT = env.int("RIDES_FRESHNESS_CACHE_TIMEOUT", 300)
+
+# Location writes closer than RIDES_LOCATION_MIN_DISTANCE_M to the last persisted
+# location of a ride (remembered in Redis) are skipped until that write is
+# RIDES_LOCATION_MAX_SKIP_SECONDS old.
+RIDES_LOCATION_MIN_DISTANCE_M = env.float("RIDES_LOCATION_MIN_DISTANCE_M", 10)
+RIDES_LOCATION_MAX_SKIP_SECONDS = env.int("RIDES_LOCATION_MAX_SKIP_SECONDS", 60)
+
+# Seconds between location updates of a tracked ride.
+RIDES_TRACKING_INTERVAL = env.int("RIDES_TRACKING_INTERVAL", 180)
+
+# Geohash precisions the demand/supply heat map keeps counters for, and the
+# largest number of cells a single heat map request may cover.
+RIDES_HEATMAP_PRECISIONS = env.list("RIDES_HEATMAP_PRECISIONS", [4, 5, 6], subcast=int)
+RIDES_HEATMAP_MAX_CELLS = env.int("RIDES_HEATMAP_MAX_CELLS", 4096)
+
+# Vector tiles of open rides. Points are clustered below
+# RIDES_TILES_CLUSTER_MAX_ZOOM on a grid of RIDES_TILES_CLUSTER_GRID cells per
+# tile side, and tiles up to RIDES_TILES_CACHE_MAX_ZOOM are cached.
+RIDES_TILES_MAX_ZOOM = env.int("RIDES_TILES_MAX_ZOOM", 22)
+RIDES_TILES_CLUSTER_MAX_ZOOM = env.int("RIDES_TILES_CLUSTER_MAX_ZOOM", 13)
+RIDES_TILES_CLUSTER_GRID = env.int("RIDES_TILES_CLUSTER_GRID", 64)
+RIDES_TILES_CACHE_MAX_ZOOM = env.int("RIDES_TILES_CACHE_MAX_ZOOM", 16)
+RIDES_TILES_CACHE_TIMEOUT = env.int("RIDES_TILES_CACHE_TIMEOUT", 300)
+
+# Serialized ride detail is cached for RIDES_DETAIL_CACHE_TIMEOUT seconds in
+# Redis, and in front of that for RIDES_DETAIL_CACHE_LOCAL_TIMEOUT seconds in a
+# per-process LRU of RIDES_DETAIL_CACHE_LOCAL_SIZE rides. Writes invalidate both
+# tiers through Redis pub/sub.
+RIDES_DETAIL_CACHE_TIMEOUT = env.int("RIDES_DETAIL_CACHE_TIMEOUT", 300)
+RIDES_DETAIL_CACHE_LOCAL_TIMEOUT = env.float("RIDES_DETAIL_CACHE_LOCAL_TIMEOUT", 30)
+RIDES_DETAIL_CACHE_LOCAL_SIZE = env.int("RIDES_DETAIL_CACHE_LOCAL_SIZE", 4096)
+
+# Messages the outbox relay publishes per transaction, and the seconds it waits
+# once the outbox is drained. Failed messages are retried after
+# RIDES_OUTBOX_RETRY_DELAY seconds, doubling with every attempt, up to
+# RIDES_OUTBOX_MAX_ATTEMPTS attempts.
+RIDES_OUTBOX_BATCH_SIZE = env.int("RIDES_OUTBOX_BATCH_SIZE", 100)
+RIDES_OUTBOX_POLL_INTERVAL = env.float("RIDES_OUTBOX_POLL_INTERVAL", 0.5)
+RIDES_OUTBOX_RETRY_DELAY = env.float("RIDES_OUTBOX_RETRY_DELAY", 5)
+RIDES_OUTBOX_MAX_ATTEMPTS = env.int("RIDES_OUTBOX_MAX_ATTEMPTS", 8)
+
+# Load shedding. The DEGRADED and OVERLOADED thresholds for the database round
+# trip time and the number of queued Celery tasks, sampled per process every
+# RIDES_LOAD_SAMPLE_INTERVAL seconds. When degraded, nearby searches are capped
+# at RIDES_SHED_NEARBY_RADIUS_M and tracked rides update RIDES_SHED_TRACKING_FACTOR
+# times less often. When overloaded, nearby searches are refused with a 503 and
+# Retry-After of RIDES_SHED_RETRY_AFTER seconds.
+RIDES_LOAD_DB_LATENCY_MS = env.list(
+    "RIDES_LOAD_DB_LATENCY_MS", [50, 250], subcast=float
+)
+RIDES_LOAD_CELERY_BACKLOG = env.list(
+    "RIDES_LOAD_CELERY_BACKLOG", [1000, 10000], subcast=int
+)
+RIDES_LOAD_CELERY_QUEUE = env.str("RIDES_LOAD_CELERY_QUEUE", "celery")
+RIDES_LOAD_SAMPLE_INTERVAL = env.float("RIDES_LOAD_SAMPLE_INTERVAL", 5)
+RIDES_SHED_NEARBY_RADIUS_M = env.float("RIDES_SHED_NEARBY_RADIUS_M", 500)
+RIDES_SHED_TRACKING_FACTOR = env.int("RIDES_SHED_TRACKING_FACTOR", 3)
+RIDES_SHED_RETRY_AFTER = env.int("RIDES_SHED_RETRY_AFTER", 30)
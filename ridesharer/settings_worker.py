@@ -0,0 +1,25 @@
+"""
+Settings for Celery workers and beat.
+
+Start them with DJANGO_SETTINGS_MODULE=ridesharer.settings_worker. Workers only
+touch rides and their users, so the admin, auth endpoints, API schema and
+their dependencies are left out, which keeps worker startup fast and memory
+low. Compare both profiles with `python manage.py measure_worker_boot`.
+"""
+
+from .settings import *  # noqa: F401, F403
+
+
+INSTALLED_APPS = [
+    "django.contrib.auth",
+    "django.contrib.contenttypes",
+    "django.contrib.gis",
+    "accounts.apps.AccountsConfig",
+    "rides.apps.RidesConfig",
+]
+
+MIDDLEWARE = []
+
+# Workers never serve requests. An empty URLconf keeps a stray reverse() from
+# importing every view.
+ROOT_URLCONF = "ridesharer.urls_worker"
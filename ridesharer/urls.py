@@ -16,7 +16,9 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
+from drf_spectacular.views import SpectacularSwaggerView
+
+from rides.schema import PrecomputedSchemaView
 
 
 urlpatterns = [
@@ -27,7 +29,7 @@ urlpatterns = [
     path(
         "api/v1/dj-rest-auth/registration/", include("dj_rest_auth.registration.urls")
     ),
-    path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
+    path("api/schema/", PrecomputedSchemaView.as_view(), name="schema"),
     path(
         "api/schema/swagger",
         SpectacularSwaggerView.as_view(url_name="schema"),
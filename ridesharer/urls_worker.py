@@ -0,0 +1,2 @@
+# URLconf of ridesharer.settings_worker.
+urlpatterns = []